@@ -2,13 +2,120 @@
 
 import os
 import time
-import cv2
+from typing import Optional
 from utils.computer_resources import get_system_usage, ping
-from utils.detection import upload_image, upload_image_preprocessed, init_model, image_prediction
+from utils.detection import upload_image, upload_image_preprocessed, image_prediction
+from utils.model_registry import get_model, model_ready
+from utils.pipeline import (
+    CameraSource,
+    ElapsedTimeOverlay,
+    Frame,
+    IntervalGate,
+    Pipeline,
+    PrintResult,
+    SaveImage,
+    Stage,
+    StageOutput,
+)
+from utils.scheduler import OffloadScheduler
+
+
+class DelegationInference(Stage):
+    """Decide por frame dónde realizar la inferencia según los recursos y el ping."""
+
+    name = "delegation"
+    role = "inference"
+
+    def __init__(self, server_ip: str = None) -> None:
+        self.server_ip = server_ip
+
+    def process(self, frame: Frame) -> StageOutput:
+        frame.result = process_image(frame.image_path, self.server_ip)
+        return frame
+
+
+class ScheduledInference(Stage):
+    """Elige por frame el camino de inferencia con ``OffloadScheduler`` y registra la
+    latencia y el tiempo de CPU medidos para corregir sus estimaciones."""
+
+    name = "scheduler"
+    role = "inference"
+
+    def __init__(self, scheduler: OffloadScheduler, server_ip: str = None) -> None:
+        self.scheduler = scheduler
+        self.server_ip = server_ip
+
+    def process(self, frame: Frame) -> StageOutput:
+        # No se enruta a local mientras el modelo se sigue cargando en segundo plano
+        unavailable = () if model_ready("n") else ("local",)
+        decision = self.scheduler.choose(os.path.getsize(frame.image_path), unavailable)
+        path = decision["path"]
+        start_time = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            if path == "local":
+                result_data = image_prediction(get_model("n"), frame.image_path)
+            elif path == "server":
+                result_data = upload_image(frame.image_path, self.server_ip)
+            else:
+                result_data = upload_image_preprocessed(
+                    image_path=frame.image_path, server_ip=self.server_ip
+                )
+        except Exception as e:  # Servidor caído o respuesta no válida
+            if path == "local":
+                raise
+            # El camino remoto queda en espera y el frame se procesa en local
+            self.scheduler.record_failure(
+                decision,
+                time.perf_counter() - start_time,
+                time.process_time() - start_cpu,
+                e,
+            )
+            print(f"Inferencia {path} fallida ({e}), se procesa en local")
+            result_data = image_prediction(get_model("n"), frame.image_path)
+            result_data["detection_place"] = "local"
+            frame.result = result_data
+            return frame
+        latency = time.perf_counter() - start_time
+        cpu_time = time.process_time() - start_cpu
+
+        row = self.scheduler.record(decision, result_data, latency, cpu_time)
+        predicted = row["predicted_latency"]
+        print(
+            f"Inferencia {path} ({row['reason']}): {latency * 1000:.1f} ms, "
+            f"predicción {'-' if predicted is None else f'{predicted * 1000:.1f} ms'}"
+        )
+        result_data["detection_place"] = path
+        frame.result = result_data
+        return frame
+
+
+def build_stages(
+    output_folder: str,
+    interval: int,
+    server_ip: str = None,
+    scheduler: Optional[OffloadScheduler] = None,
+) -> list:
+    """Configuración de etapas de la inferencia con delegación de tareas."""
+    if scheduler is not None:
+        inference = ScheduledInference(scheduler, server_ip)
+    else:
+        inference = DelegationInference(server_ip)
+    return [
+        IntervalGate(interval),
+        ElapsedTimeOverlay(),
+        SaveImage(output_folder),
+        inference,
+        PrintResult(),
+    ]
 
 
 def capture_and_process_images(
-    output_folder: str, total_duration: int, interval: int, server_ip: str = None
+    output_folder: str,
+    total_duration: int,
+    interval: int,
+    server_ip: str = None,
+    scheduler: Optional[OffloadScheduler] = None,
 ) -> None:
     """
     Captura imágenes desde la cámara, las procesa y las envía a un servidor o las guarda localmente.
@@ -18,50 +125,15 @@ def capture_and_process_images(
         total_duration (int): Duración total en segundos para la captura.
         interval (int): Intervalo en segundos entre cada captura de imagen.
         server_ip (str, optional): IP del servidor para la subida de imágenes.
+        scheduler (OffloadScheduler, optional): Planificador por modelo de costos; sin
+            él se usan los umbrales fijos de ``perform_inference``.
     """
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: No se puede abrir la cámara")
-        return
-
-    start_time_total = time.time()
-    start_time = start_time_total
-
-    while time.time() - start_time_total < total_duration:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: No se puede recibir frame (finalizando...)")
-            break
-
-        # Calcula el tiempo transcurrido y actualiza el texto en el frame
-        elapsed_time_sec = int(time.time() - start_time_total)
-        cv2.putText(
-            frame,
-            f"Tiempo transcurrido: {elapsed_time_sec}s",
-            (10, 30),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            1,
-            (0, 255, 0),
-            2,
-            cv2.LINE_AA,
-        )
-
-        # Verifica si ha pasado el intervalo
-        if time.time() - start_time >= interval:
-            save_and_process_image(frame, output_folder, server_ip)
-            start_time = time.time()
+    stages = build_stages(output_folder, interval, server_ip, scheduler)
+    Pipeline(CameraSource(total_duration), stages).run()
 
-    cap.release()
-    print("Finalizando captura de fotos...")
 
-
-def save_and_process_image(frame, output_folder, server_ip):
-    """Guarda la imagen, muestra información de recursos y decide el tipo de inferencia."""
-    # Guarda la imagen con un nombre basado en el timestamp
-    timestamp = int(time.time() * 1000)
-    image_name = f"photo_{timestamp}.png"
-    image_path = os.path.join(output_folder, image_name)
-    cv2.imwrite(image_path, frame)
+def process_image(image_path, server_ip):
+    """Muestra información de recursos y decide el tipo de inferencia."""
     print(f"\n*** Foto guardada: {image_path} ***")
 
     # Obtén el tamaño de la imagen en KB
@@ -76,7 +148,7 @@ def save_and_process_image(frame, output_folder, server_ip):
 
     # Decide el tipo de inferencia
     print("\n*** Decidiendo el tipo de inferencia ***")
-    perform_inference(cpu_usage, memory_usage, ping_time, image_path, server_ip)
+    return perform_inference(cpu_usage, memory_usage, ping_time, image_path, server_ip)
 
 
 def print_resource_info(cpu_usage, memory_usage, image_size, ping_time):
@@ -96,21 +168,30 @@ def print_resource_info(cpu_usage, memory_usage, image_size, ping_time):
 
 def perform_inference(cpu_usage, memory_usage, ping_time, image_path, server_ip):
     """Realiza la inferencia en función de los recursos y el tiempo de ping."""
+    result_data = None
     if cpu_usage > 0.75 and memory_usage > 0.75:
         if server_ip and ping_time is not None:
             if ping_time < 200:
                 print("Inferencia en el servidor")
-                upload_image(image_path, server_ip)
+                result_data = upload_image(image_path, server_ip)
+                result_data["detection_place"] = "server"
             elif ping_time > 500:
                 print("Inferencia conjunta")
-                upload_image_preprocessed(image_path=image_path, server_ip=server_ip)
+                result_data = upload_image_preprocessed(
+                    image_path=image_path, server_ip=server_ip
+                )
+                result_data["detection_place"] = "joint"
             else:
                 print("Inferencia local")
                 result_data = image_prediction(
-                    model=init_model(size='n'), image_path=image_path
+                    model=get_model("n"), image_path=image_path
                 )
-                print(f"Resultado guardado en: {result_data['path']}")
+                result_data["detection_place"] = "local"
+                if result_data["path"]:
+                    print(f"Resultado guardado en: {result_data['path']}")
     else:
         print("Uso de recursos del sistema muy altos, se recomienda realizar inferencia servidor")
-        upload_image(image_path, server_ip)
+        result_data = upload_image(image_path, server_ip)
+        result_data["detection_place"] = "server"
     print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
+    return result_data
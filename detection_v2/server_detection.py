@@ -3,15 +3,40 @@
 from datetime import datetime
 import os
 from detection_v2.image_capture import capture_and_process_images
+from utils.model_registry import preload_model
+from utils.scheduler import OffloadScheduler
 
 
-def main(duracion_total: int = 12, intervalo: int = 3, server_ip: str = None) -> None:
-    """Función principal del script"""
+def main(
+    duracion_total: int = 12,
+    intervalo: int = 3,
+    server_ip: str = None,
+    policy: str = "threshold",
+    latency_slo: float = None,
+) -> None:
+    """Función principal del script.
+
+    ``policy`` es ``"threshold"`` (umbrales fijos de CPU, memoria y ping) o el
+    objetivo del planificador por modelo de costos: ``"latency"`` o ``"cpu"``.
+    """
     # Captura y procesa imágenes
     execution_folder = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_folder = os.path.join("./data/local/", execution_folder)
     os.makedirs(output_folder, exist_ok=True)
-    capture_and_process_images(output_folder, duracion_total, intervalo, server_ip)
+
+    # El modelo local se carga mientras empieza la captura
+    preload_model("n")
+    scheduler = None
+    if policy != "threshold":
+        scheduler = OffloadScheduler(
+            paths=["local", "server", "joint"] if server_ip else ["local"],
+            objective=policy,
+            slo=latency_slo,
+            log_path=os.path.join(output_folder, "scheduler_decisions.csv"),
+        )
+    capture_and_process_images(
+        output_folder, duracion_total, intervalo, server_ip, scheduler
+    )
 
 
 if __name__ == "__main__":
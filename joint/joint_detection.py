@@ -2,15 +2,63 @@
 
 from datetime import datetime
 import os
-import time
-import cv2
-from utils.detection import (
-    upload_image_preprocessed,
+
+from utils.pipeline import (
+    CameraSource,
+    ElapsedTimeOverlay,
+    IntervalGate,
+    Pipeline,
+    PrintResult,
+    SaveImage,
 )
+from utils.stages import JointInference, SplitInference
+
+
+def build_stages(
+    output_folder: str,
+    interval: int,
+    server_ip: str = None,
+    imgsz: int = 640,
+    split_model=None,
+    split_layer: int = None,
+    quantization: str = "int8",
+) -> list:
+    """
+    Configuración de etapas de la inferencia conjunta.
+
+    Args:
+        output_folder (str): Carpeta donde se guardarán las imágenes.
+        interval (int): Intervalo en segundos entre cada captura de imagen.
+        imgsz (int): Resolución del letterbox enviado al servidor (320, 416 o 640).
+        split_model: Modelo PyTorch para ejecutar las primeras capas en el cliente.
+        split_layer (int, optional): Capa en la que se divide el modelo. Si es None
+            solo se preprocesa la imagen y el servidor ejecuta todo el modelo.
+        quantization (str): Cuantización de los tensores enviados (None, fp16, int8).
+    """
+    if split_layer is None:
+        inference = JointInference(server_ip, imgsz)
+    else:
+        inference = SplitInference(
+            split_model, split_layer, server_ip, imgsz, quantization
+        )
+    return [
+        IntervalGate(interval),
+        ElapsedTimeOverlay(),
+        SaveImage(output_folder),
+        inference,
+        PrintResult(),
+    ]
 
 
 def capture_and_process_images(
-    output_folder: str, total_duration: int, interval: int, server_ip: str = None
+    output_folder: str,
+    total_duration: int,
+    interval: int,
+    server_ip: str = None,
+    imgsz: int = 640,
+    split_model=None,
+    split_layer: int = None,
+    quantization: str = "int8",
 ) -> None:
     """
     Captura imágenes desde la cámara, las procesa y las envía al PC.
@@ -20,66 +68,42 @@ def capture_and_process_images(
         total_duration (int): Duración total en segundos para la captura.
         interval (int): Intervalo en segundos entre cada captura de imagen.
     """
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: No se puede abrir la cámara")
-        return
-
-    start_time_total = time.time()
-    start_time = start_time_total
-
-    while time.time() - start_time_total < total_duration:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: No se puede recibir frame (finalizando...)")
-            break
-
-        # Calcula el tiempo transcurrido y el tiempo actual
-        current_time = time.time()
-        elapsed_time_sec = int(current_time - start_time_total)
-        curent_elapsed_time = current_time - start_time
-
-        # Agrega el tiempo transcurrido al frame
-        cv2.putText(
-            frame,
-            f"Tiempo transcurrido: {elapsed_time_sec}s",
-            (10, 30),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            1,
-            (0, 255, 0),
-            2,
-            cv2.LINE_AA,
-        )
-
-        # Verifica si ha pasado el intervalo
-        if curent_elapsed_time >= interval:
-            # Genera un nombre único usando timestamp en milisegundos
-            timestamp = int(time.time() * 1000)
-            image_name = f"photo_{timestamp}.png"
-            image_path = os.path.join(output_folder, image_name)
-
-            # Guarda la imagen en la carpeta de salida
-            cv2.imwrite(image_path, frame)
-            print(f"Foto guardada en: {image_path}")
-
-            upload_image_preprocessed(image_path=image_path, server_ip=server_ip)
-
-            # Reinicia el temporizador
-            start_time = time.time()
-
-    # Libera la cámara
-    cap.release()
-    print("Finalizando captura de fotos...")
-
-
-def main(duracion_total: int = 12, intervalo: int = 3, server_ip: str = None) -> None:
+    stages = build_stages(
+        output_folder, interval, server_ip, imgsz, split_model, split_layer, quantization
+    )
+    Pipeline(CameraSource(total_duration), stages).run()
+
+
+def main(
+    duracion_total: int = 12,
+    intervalo: int = 3,
+    server_ip: str = None,
+    imgsz: int = 640,
+    split_layer: int = None,
+    quantization: str = "int8",
+) -> None:
     """Función principal del script"""
+    split_model = None
+    if split_layer is not None:
+        # Solo el modo dividido carga torch/ultralytics en la Pi
+        from utils.split_inference import load_split_model
+
+        split_model = load_split_model("n")
 
     # Captura y procesa imágenes
     execution_folder = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_folder = os.path.join("./data/local/", execution_folder)
     os.makedirs(output_folder, exist_ok=True)
-    capture_and_process_images(output_folder, duracion_total, intervalo, server_ip)
+    capture_and_process_images(
+        output_folder,
+        duracion_total,
+        intervalo,
+        server_ip,
+        imgsz,
+        split_model,
+        split_layer,
+        quantization,
+    )
 
 
 if __name__ == "__main__":
@@ -1,11 +1,73 @@
 """ Script para capturar imágenes desde la cámara y enviarlas a un PC remoto. """
 
 import os
-import time
 from datetime import datetime
 
-import cv2
-from utils.detection import init_model, image_prediction
+from utils.adaptive_resolution import ResolutionController
+from utils.detection import detect_frame
+from utils.model_registry import get_model
+from utils.pipeline import (
+    CameraSource,
+    CsvSink,
+    ElapsedTimeOverlay,
+    IntervalGate,
+    Pipeline,
+    PrintResult,
+    SaveImage,
+)
+from utils.stages import LocalInference, SaveTrackedResult, Tracking
+from utils.tracking import TrackedDetector
+
+
+def build_stages(
+    model,
+    output_folder: str,
+    interval: int,
+    detect_every: int = None,
+    resolution: ResolutionController = None,
+    threads: int = None,
+) -> list:
+    """
+    Configuración de etapas de la inferencia local.
+
+    Args:
+        model: Modelo YOLO ya inicializado.
+        output_folder (str): Carpeta donde se guardarán las imágenes.
+        interval (int): Intervalo en segundos entre cada captura de imagen.
+        detect_every (int, optional): Si se indica, se procesan todos los frames:
+            la detección completa corre cada ``detect_every`` frames y las cajas se
+            propagan con un tracker en los frames intermedios. El resultado de cada
+            frame se escribe en ``results.csv`` y ``interval`` solo limita los
+            frames guardados y anotados.
+        resolution (ResolutionController, optional): Ajusta la resolución de la
+            inferencia según la carga de la Raspberry Pi.
+        threads (int, optional): Hilos de la inferencia.
+    """
+    if detect_every is None:
+        return [
+            IntervalGate(interval),
+            ElapsedTimeOverlay(),
+            SaveImage(output_folder),
+            LocalInference(model, resolution=resolution, threads=threads),
+            PrintResult(),
+        ]
+
+    # Todos los frames pasan por el tracker y se registran en el CSV; el intervalo
+    # solo limita los frames que se guardan y anotan
+    tracker = TrackedDetector(
+        lambda frame, imgsz=None: detect_frame(model, frame, imgsz),
+        every_n=detect_every,
+        resolution=resolution,
+    )
+    return [
+        Tracking(tracker, model, threads),
+        CsvSink(os.path.join(output_folder, "results.csv")),
+        IntervalGate(interval),
+        ElapsedTimeOverlay(),
+        SaveImage(output_folder),
+        SaveTrackedResult(),
+        PrintResult(),
+    ]
 
 
 def capture_and_process_images(
@@ -13,77 +75,76 @@ def capture_and_process_images(
     output_folder: str,
     total_duration: int,
     interval: int,
+    detect_every: int = None,
+    resolution: ResolutionController = None,
+    threads: int = None,
+    affinity: dict = None,
 ) -> None:
     """
-    Captura imágenes desde la cámara, las procesa y las envía al PC.
+    Captura imágenes desde la cámara y las procesa localmente.
 
     Args:
         output_folder (str): Carpeta donde se guardarán las imágenes.
         total_duration (int): Duración total en segundos para la captura.
         interval (int): Intervalo en segundos entre cada captura de imagen.
+        detect_every (int, optional): Detección completa cada N frames con tracking.
+        resolution (ResolutionController, optional): Resolución adaptativa.
+        threads (int, optional): Hilos de la inferencia.
+        affinity (dict, optional): CPUs de los hilos de captura, inferencia y E/S
+            (``{"capture": {0}, "inference": {1, 2, 3}, "io": {0}}``).
     """
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: No se puede abrir la cámara")
-        return
-
-    start_time_total = time.time()
-    start_time = start_time_total
-
-    while time.time() - start_time_total < total_duration:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: No se puede recibir frame (finalizando...)")
-            break
-
-        # Calcula el tiempo transcurrido y el tiempo actual
-        current_time = time.time()
-        elapsed_time_sec = int(current_time - start_time_total)
-        curent_elapsed_time = current_time - start_time
-
-        # Agrega el tiempo transcurrido al frame
-        cv2.putText(
-            frame,
-            f"Tiempo transcurrido: {elapsed_time_sec}s",
-            (10, 30),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            1,
-            (0, 255, 0),
-            2,
-            cv2.LINE_AA,
-        )
-
-        # Verifica si ha pasado el intervalo
-        if curent_elapsed_time >= interval:
-            # Genera un nombre único usando timestamp en milisegundos
-            timestamp = int(time.time() * 1000)
-            image_name = f"photo_{timestamp}.png"
-            image_path = os.path.join(output_folder, image_name)
-
-            # Guarda la imagen en la carpeta de salida
-            cv2.imwrite(image_path, frame)
-            print(f"Foto guardada en: {image_path}")
-
-            result_data = image_prediction(model, image_path)
-            # os.remove(result_data["path"])
-
-            # Reinicia el temporizador
-            start_time = time.time()
-
-    # Libera la cámara
-    cap.release()
-    print("Finalizando captura de fotos...")
-
-
-def main(duracion_total: int = 12, intervalo: int = 3, rpi: bool = True):
-    """Función principal del script."""
-    model = init_model(size="n", rpi=rpi)
+    stages = build_stages(
+        model, output_folder, interval, detect_every, resolution, threads
+    )
+    Pipeline(CameraSource(total_duration), stages, affinity=affinity).run()
+
+
+def main(
+    duracion_total: int = 12,
+    intervalo: int = 3,
+    rpi: bool = True,
+    detect_every: int = None,
+    backend: str = None,
+    precision: str = "fp32",
+    latency_target: float = None,
+    cpu_target: float = None,
+    inference_threads: int = None,
+    affinity: dict = None,
+):
+    """Función principal del script.
+
+    ``backend`` selecciona el backend de inferencia (``pytorch``, ``ncnn``, ``onnx``,
+    ``openvino`` o ``auto``); por defecto NCNN en la Raspberry Pi. ``precision``
+    carga las variantes fp16/int8 del backend. ``latency_target`` (segundos) y
+    ``cpu_target`` (0-1) activan la resolución adaptativa 640 -> 480 -> 320.
+    ``inference_threads`` y ``affinity`` reparten los núcleos entre la captura, la
+    inferencia y la E/S.
+    """
+    model = get_model("n", rpi=rpi, backend=backend, precision=precision)
+    resolution = None
+    if latency_target is not None or cpu_target is not None:
+        # Exported models have a fixed input size: only PyTorch can change it
+        if isinstance(model.model, str):
+            print("[WARNING] La resolución adaptativa requiere el backend pytorch")
+        else:
+            resolution = ResolutionController(
+                latency_target=latency_target, cpu_target=cpu_target
+            )
     execution_folder = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_folder = os.path.join("./data/local/", execution_folder)
     os.makedirs(output_folder, exist_ok=True)
 
     # Captura y procesa imágenes
-    capture_and_process_images(model, output_folder, duracion_total, intervalo)
+    capture_and_process_images(
+        model,
+        output_folder,
+        duracion_total,
+        intervalo,
+        detect_every,
+        resolution,
+        inference_threads,
+        affinity,
+    )
 
 
 if __name__ == "__main__":
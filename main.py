@@ -1,9 +1,18 @@
 """ Main file to run the server. """
 
 import argparse
-from joint.joint_detection import main as joint_detection
-from local.detection import main as local_main
-from server.detection import main as server_main
+from utils.cpu_affinity import parse_cpus
+from utils.detection import (
+    AnnotationPolicy,
+    DetectionFilter,
+    set_annotation_policy,
+    set_detection_filter,
+)
+from utils.metrics import EXTENSIONS, set_metrics_format
+from utils.model_export import PRECISIONS
+
+# The inference modes are imported in their branch of main(): only the modes that run
+# a model on the Pi import ultralytics/torch (seconds and hundreds of MB on the Pi)
 
 
 def str2bool(value):
@@ -59,20 +68,263 @@ def main():
         default=None,
         help="Formato de Imagen",
     )
+    parser.add_argument(
+        "--max_in_flight",
+        type=int,
+        default=1,
+        help="Número máximo de subidas simultáneas al servidor",
+    )
+    parser.add_argument(
+        "--delivery",
+        type=str,
+        default="ordered",
+        choices=["ordered", "latest"],
+        help="Entrega de resultados: en orden de captura o solo el más reciente",
+    )
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=640,
+        choices=[320, 416, 640],
+        help="Resolución del preprocesamiento enviado al servidor en modo joint",
+    )
+    parser.add_argument(
+        "--target_upload_time",
+        type=float,
+        default=None,
+        help="Tiempo objetivo de subida por imagen (s); activa la codificación adaptativa",
+    )
+    parser.add_argument(
+        "--min_quality",
+        type=int,
+        default=50,
+        help="Calidad JPEG mínima permitida en la codificación adaptativa",
+    )
+    parser.add_argument(
+        "--split_layer",
+        type=int,
+        default=None,
+        help="Capa en la que se divide el modelo entre la Raspberry y el servidor (joint)",
+    )
+    parser.add_argument(
+        "--split_quantization",
+        type=str,
+        default="int8",
+        choices=["none", "fp16", "int8"],
+        help="Cuantización de los tensores intermedios enviados en modo joint",
+    )
+    parser.add_argument(
+        "--crop_offload",
+        type=str2bool,
+        default=False,
+        help="Subir solo las regiones que cambiaron respecto al fondo (modo server)",
+    )
+    parser.add_argument(
+        "--hedge_percentile",
+        type=float,
+        default=None,
+        help="Cubrir con inferencia local los frames que tardan más que este "
+        "percentil de la latencia del servidor (modo server)",
+    )
+    parser.add_argument(
+        "--circuit_breaker",
+        type=str2bool,
+        default=False,
+        help="Inferencia local mientras el servidor falla o responde lento (modo server)",
+    )
+    parser.add_argument(
+        "--spool",
+        type=str2bool,
+        default=False,
+        help="Guardar en disco los frames que no se pudieron subir y subirlos cuando "
+        "el servidor vuelva a responder (modo server)",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default=None,
+        choices=["pytorch", "ncnn", "onnx", "openvino", "auto"],
+        help="Backend de inferencia local; 'auto' elige el más rápido con un "
+        "micro-benchmark que se guarda para los siguientes arranques",
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        default="fp32",
+        choices=["fp32", "fp16", "int8"],
+        help="Precisión del modelo local (int8 calibrado con los frames de data/local)",
+    )
+    parser.add_argument(
+        "--detect_every",
+        type=int,
+        default=None,
+        help="Detección completa cada N frames con tracking intermedio (modo local)",
+    )
+    parser.add_argument(
+        "--delegation_policy",
+        type=str,
+        default="threshold",
+        choices=["threshold", "latency", "cpu"],
+        help="Política de delegación: umbrales fijos o modelo de costos (latencia o CPU)",
+    )
+    parser.add_argument(
+        "--latency_slo",
+        type=float,
+        default=None,
+        help="SLO de latencia en segundos para la política 'cpu'",
+    )
+    parser.add_argument(
+        "--latency_target",
+        type=float,
+        default=None,
+        help="Latencia objetivo (s) de la inferencia local; baja la resolución "
+        "640 -> 480 -> 320 cuando se supera (modo local)",
+    )
+    parser.add_argument(
+        "--cpu_target",
+        type=float,
+        default=None,
+        help="Uso de CPU objetivo (0-1) para la resolución adaptativa (modo local)",
+    )
+    parser.add_argument(
+        "--inference_threads",
+        type=int,
+        default=None,
+        help="Hilos intra-op de la inferencia local (PyTorch, NCNN, ONNX, OpenVINO)",
+    )
+    parser.add_argument(
+        "--capture_cpus",
+        type=str,
+        default=None,
+        help="CPUs del hilo de captura, p. ej. '0' (modo local)",
+    )
+    parser.add_argument(
+        "--inference_cpus",
+        type=str,
+        default=None,
+        help="CPUs del hilo de inferencia, p. ej. '1-3' (modo local)",
+    )
+    parser.add_argument(
+        "--io_cpus",
+        type=str,
+        default=None,
+        help="CPUs de los hilos de E/S (guardado, resultados), p. ej. '0' (modo local)",
+    )
+    parser.add_argument(
+        "--classes",
+        type=str,
+        default=None,
+        help="Clases permitidas separadas por coma (nombres COCO o índices), p. ej. "
+        "'person,car'; se aplican en el modelo y se envían al servidor",
+    )
+    parser.add_argument(
+        "--conf", type=float, default=0.25, help="Confianza mínima de las detecciones"
+    )
+    parser.add_argument("--iou", type=float, default=0.7, help="Umbral de IoU del NMS")
+    parser.add_argument(
+        "--max_det", type=int, default=300, help="Máximo de detecciones por imagen"
+    )
+    parser.add_argument(
+        "--annotate",
+        type=str,
+        default="none",
+        choices=list(AnnotationPolicy.MODES),
+        help="Frames que se guardan anotados: ninguno (solo detecciones), todos, los "
+        "que tienen detecciones o uno de cada --annotate_every",
+    )
+    parser.add_argument(
+        "--annotate_every",
+        type=int,
+        default=10,
+        help="Periodo del muestreo de imágenes anotadas (--annotate sample)",
+    )
+    parser.add_argument(
+        "--metrics_format",
+        type=str,
+        default="csv",
+        choices=list(EXTENSIONS),
+        help="Formato de los ficheros de resultados (parquet y arrow necesitan pyarrow)",
+    )
     args = parser.parse_args()
+    if args.backend in PRECISIONS and args.precision not in PRECISIONS[args.backend]:
+        parser.error(
+            f"--precision {args.precision} no está soportada por --backend "
+            f"{args.backend}: {PRECISIONS[args.backend]}"
+        )
+    set_metrics_format(args.metrics_format)
+    set_annotation_policy(AnnotationPolicy(args.annotate, args.annotate_every))
+    set_detection_filter(
+        DetectionFilter(
+            classes=args.classes.split(",") if args.classes else None,
+            conf=args.conf,
+            iou=args.iou,
+            max_det=args.max_det,
+        )
+    )
 
     # Crear una nueva carpeta para cada ejecución
     if args.type_inference == "local":
+        from local.detection import main as local_main
+
         print("Inferencia local")
-        local_main(args.total_duration, args.interval, args.rpi)
+        local_main(
+            args.total_duration,
+            args.interval,
+            args.rpi,
+            args.detect_every,
+            args.backend,
+            args.precision,
+            args.latency_target,
+            args.cpu_target,
+            args.inference_threads,
+            {
+                "capture": parse_cpus(args.capture_cpus),
+                "inference": parse_cpus(args.inference_cpus),
+                "io": parse_cpus(args.io_cpus),
+            },
+        )
     elif args.type_inference == "server":
+        from server.detection import main as server_main
+
         print("Inferencia en el servidor")
-        server_main(args.total_duration, args.interval, args.server_ip)
+        server_main(
+            args.total_duration,
+            args.interval,
+            args.server_ip,
+            args.max_in_flight,
+            args.delivery,
+            args.target_upload_time,
+            args.min_quality,
+            args.crop_offload,
+            args.hedge_percentile,
+            args.circuit_breaker,
+            args.spool,
+        )
     elif args.type_inference == "joint":
+        from joint.joint_detection import main as joint_detection
+
         print("Inferencia en conjunta")
-        joint_detection(args.total_duration, args.interval, args.server_ip)
+        joint_detection(
+            args.total_duration,
+            args.interval,
+            args.server_ip,
+            args.imgsz,
+            args.split_layer,
+            None if args.split_quantization == "none" else args.split_quantization,
+        )
+    elif args.type_inference == "delegation":
+        from detection_v2.server_detection import main as delegation_main
+
+        print("Inferencia con delegación de tareas")
+        delegation_main(
+            args.total_duration,
+            args.interval,
+            args.server_ip,
+            args.delegation_policy,
+            args.latency_slo,
+        )
     else:
-        print("Tipo de inferencia no válido: local, server, joint")
+        print("Tipo de inferencia no válido: local, server, joint, delegation")
         return None
 
 
@@ -1,11 +1,21 @@
 """ This is the main file for the server. """
-from server.server import main as server_main
+import argparse
+
+from server.server import MAX_PENDING_REQUESTS, main as server_main
 
 
 
 
 if __name__ == "__main__":
-    server_main()
+    parser = argparse.ArgumentParser(description="Servidor de detección.")
+    parser.add_argument(
+        "--max_pending",
+        type=int,
+        default=MAX_PENDING_REQUESTS,
+        help="Peticiones admitidas a la vez; el resto recibe 503 (0: sin límite)",
+    )
+    args = parser.parse_args()
+    server_main(args.max_pending)
 
 """
 if __name__ == "__main__":
@@ -2,89 +2,192 @@
 
 from datetime import datetime
 import os
-import time
 
-import cv2
-from utils.detection import upload_image
+from utils.adaptive_encoding import AdaptiveEncoder
+from utils.circuit_breaker import CircuitBreaker
+from utils.network_probe import get_probe
+from utils.pipeline import (
+    CameraSource,
+    CsvSink,
+    ElapsedTimeOverlay,
+    IntervalGate,
+    Pipeline,
+    PrintResult,
+    RemoveImage,
+    SaveImage,
+)
+from utils.regions import BackgroundModel
+from utils.spool import FrameSpool, SpoolDrainer
+from utils.stages import ChangedRegions, HedgedInference, RemoteInference, SpoolFailed
 
 SAVE_FOLDER = "./data/server/"
+# Con el circuit breaker una petición colgada no debe bloquear el intervalo completo
+BREAKER_REQUEST_TIMEOUT = 10
+SPOOL_FOLDER = "./data/spool/"
+
+
+def build_stages(
+    output_folder: str,
+    interval: int,
+    server_ip: str = None,
+    max_in_flight: int = 1,
+    delivery: str = "ordered",
+    encoder: AdaptiveEncoder = None,
+    background: BackgroundModel = None,
+    hedge_percentile: float = None,
+    breaker: CircuitBreaker = None,
+    spool: FrameSpool = None,
+    sink: CsvSink = None,
+) -> list:
+    """
+    Configuración de etapas de la inferencia en el servidor.
+
+    Args:
+        output_folder (str): Carpeta donde se guardarán las imágenes.
+        interval (int): Intervalo en segundos entre cada captura de imagen.
+        max_in_flight (int): Número máximo de subidas simultáneas.
+        delivery (str): Entrega de resultados "ordered" (orden de captura) o
+            "latest" (solo el más reciente).
+        encoder (AdaptiveEncoder, optional): Codificador que ajusta calidad y
+            resolución al ancho de banda medido.
+        background (BackgroundModel, optional): Modelo de fondo; si se indica solo
+            se suben los recortes de las regiones que cambiaron.
+        hedge_percentile (float, optional): Si se indica, cada frame se cubre con la
+            inferencia local cuando el servidor tarda más que este percentil de su
+            latencia; reemplaza las subidas en paralelo.
+        breaker (CircuitBreaker, optional): Si se indica, tras varios fallos o
+            respuestas lentas los frames se procesan con el modelo local hasta que
+            el servidor vuelve a responder.
+        spool (FrameSpool, optional): Spool en disco de los frames que no se
+            pudieron subir.
+        sink (CsvSink, optional): CSV donde se escribe el resultado de cada frame.
+    """
+    stages = [IntervalGate(interval)]
+    # Compara con el fondo antes de superponer el texto
+    if background is not None:
+        stages.append(ChangedRegions(background))
+    if hedge_percentile is not None:
+        inference = HedgedInference(server_ip, hedge_percentile, encoder)
+    else:
+        inference = RemoteInference(
+            server_ip,
+            max_in_flight,
+            delivery,
+            encoder,
+            breaker,
+            request_timeout=120 if breaker is None else BREAKER_REQUEST_TIMEOUT,
+        )
+    stages += [ElapsedTimeOverlay(), SaveImage(output_folder), inference]
+    if spool is not None:
+        stages.append(SpoolFailed(spool))
+    stages.append(RemoveImage())
+    if sink is not None:
+        stages.append(sink)
+    stages.append(PrintResult())
+    return stages
 
 
 def capture_and_process_images(
     output_folder: str,
     total_duration: int,
     interval: int,
-    server_ip: str = None
+    server_ip: str = None,
+    max_in_flight: int = 1,
+    delivery: str = "ordered",
+    encoder: AdaptiveEncoder = None,
+    background: BackgroundModel = None,
+    hedge_percentile: float = None,
+    breaker: CircuitBreaker = None,
+    spool: FrameSpool = None,
+    sink: CsvSink = None,
 ) -> None:
     """
-    Captura imágenes desde la cámara, las procesa y las envía al PC.
+    Captura imágenes desde la cámara y las envía al PC para su procesamiento.
 
     Args:
         output_folder (str): Carpeta donde se guardarán las imágenes.
         total_duration (int): Duración total en segundos para la captura.
         interval (int): Intervalo en segundos entre cada captura de imagen.
     """
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: No se puede abrir la cámara")
-        return
-
-    start_time_total = time.time()
-    start_time = start_time_total
-
-    while time.time() - start_time_total < total_duration:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: No se puede recibir frame (finalizando...)")
-            break
-
-        # Calcula el tiempo transcurrido y el tiempo actual
-        current_time = time.time()
-        elapsed_time_sec = int(current_time - start_time_total)
-        curent_elapsed_time = current_time - start_time
-
-        # Agrega el tiempo transcurrido al frame
-        cv2.putText(
-            frame,
-            f"Tiempo transcurrido: {elapsed_time_sec}s",
-            (10, 30),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            1,
-            (0, 255, 0),
-            2,
-            cv2.LINE_AA,
+    stages = build_stages(
+        output_folder,
+        interval,
+        server_ip,
+        max_in_flight,
+        delivery,
+        encoder,
+        background,
+        hedge_percentile,
+        breaker,
+        spool,
+        sink,
+    )
+    Pipeline(CameraSource(total_duration), stages).run()
+
+
+def main(
+    duracion_total: int = 12,
+    intervalo: int = 3,
+    server_ip: str = None,
+    max_in_flight: int = 1,
+    delivery: str = "ordered",
+    target_upload_time: float = None,
+    min_quality: int = 50,
+    crop_offload: bool = False,
+    hedge_percentile: float = None,
+    circuit_breaker: bool = False,
+    use_spool: bool = False,
+) -> None:
+    """Función principal del script"""
+    encoder = None
+    if target_upload_time is not None:
+        encoder = AdaptiveEncoder(
+            target_upload_time=target_upload_time, min_quality=min_quality
         )
 
-        # Verifica si ha pasado el intervalo
-        if curent_elapsed_time >= interval:
-            # Genera un nombre único usando timestamp en milisegundos
-            timestamp = int(time.time() * 1000)
-            image_name = f"photo_{timestamp}.png"
-            image_path = os.path.join(output_folder, image_name)
-
-            # Guarda la imagen en la carpeta de salida
-            cv2.imwrite(image_path, frame)
-            print(f"Foto guardada en: {image_path}")
-
-            # Procesa la imagen y la sube
-            upload_image(image_path, server_ip)
-            os.remove(image_path)
+    background = BackgroundModel() if crop_offload else None
+    breaker = None
+    if circuit_breaker:
+        breaker = CircuitBreaker(slow_threshold=BREAKER_REQUEST_TIMEOUT / 2)
 
-            # Reinicia el temporizador
-            start_time = time.time()
-
-    # Libera la cámara
-    cap.release()
-    print("Finalizando captura de fotos...")
-
-
-def main(duracion_total: int = 12, intervalo: int = 3, server_ip: str = None) -> None:
-    """Función principal del script"""
     # Captura y procesa imágenes
     execution_folder = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_folder = os.path.join("./data/local/", execution_folder)
     os.makedirs(output_folder, exist_ok=True)
-    capture_and_process_images(output_folder, duracion_total, intervalo, server_ip)
+    sink = CsvSink(os.path.join(output_folder, "results.csv"))
+
+    # Los frames que no se pudieron subir se guardan en disco y se suben en segundo
+    # plano cuando el servidor vuelve a responder (con su timestamp de captura)
+    spool = drainer = None
+    if use_spool:
+        spool = FrameSpool(SPOOL_FOLDER)
+        drainer = SpoolDrainer(
+            spool,
+            server_ip,
+            on_result=lambda meta, result: sink.write_result(
+                meta["timestamp"], meta["frame_index"], meta["image_path"], result, True
+            ),
+            is_online=(lambda: get_probe(server_ip).rtt_ms is not None)
+            if server_ip
+            else None,
+        ).start()
+
+    capture_and_process_images(
+        output_folder,
+        duracion_total,
+        intervalo,
+        server_ip,
+        max_in_flight,
+        delivery,
+        encoder,
+        background,
+        hedge_percentile,
+        breaker,
+        spool,
+        sink,
+    )
+    if drainer is not None:
+        drainer.stop()
 
 
 if __name__ == "__main__":
@@ -1,25 +1,89 @@
 """HTTP Server to receive files and perform object detection predictions"""
 
+import base64
 import http.server
 import socketserver
 import os
 import json
 import mimetypes
 import cgi
-from typing import Any, Dict
+import threading
+import time
+from typing import Any, Dict, Optional
 import numpy as np
-from utils.detection import init_model, image_prediction
-from utils.detection import predict_with_flatten_array, get_bounding_boxes
+from utils.detection import DetectionFilter, Detections, init_model, image_prediction
+from utils.detection import predict_with_flatten_array, decode_image
+from utils.network_probe import PING_PATH
+from utils.split_inference import (
+    FEATURES_CONTENT_TYPE,
+    deserialize_features,
+    load_split_model,
+    predictions_to_boxes,
+    run_tail,
+)
 
 # Configuration for the port and upload directory
 PORT = 8000
 UPLOAD_FOLDER = "./data/server/"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Models are loaded once and shared by the request threads. The YOLO predictor is not
+# thread-safe, so inference is serialized while uploads are received concurrently.
+_models: Dict[str, Any] = {}
+_model_lock = threading.Lock()
+inference_lock = threading.Lock()
+
+# Requests admitted at the same time (running or waiting for the inference lock).
+# With a limit (``--max_pending``) the server answers 503 with Retry-After beyond it
+# instead of queueing requests without bound, so an overloaded server fails fast and
+# clients fall back early. 0 keeps the previous behaviour (no limit).
+MAX_PENDING_REQUESTS = 0
+RETRY_AFTER_SECONDS = 1
+_admission: Optional[threading.BoundedSemaphore] = None
+
+# Model sizes the clients may request for split inference
+SPLIT_MODEL_SIZES = ("n", "x")
+
+
+def set_max_pending(max_pending: int = None) -> None:
+    """Sets the number of requests admitted at the same time (None: no limit)."""
+    global _admission
+    _admission = threading.BoundedSemaphore(max_pending) if max_pending else None
+
+
+def get_model(size: str = "x"):
+    """Returns the cached YOLO model of the given size, loading it on first use."""
+    with _model_lock:
+        if size not in _models:
+            _models[size] = init_model(size=size)
+        return _models[size]
+
+
+def get_split_model(size: str = "n"):
+    """Returns the cached PyTorch model used to resume split inference."""
+    with _model_lock:
+        key = f"split_{size}"
+        if key not in _models:
+            _models[key] = load_split_model(size)
+        return _models[key]
+
 
 class CustomHandler(http.server.SimpleHTTPRequestHandler):
     """Custom class to handle HTTP requests"""
 
+    def do_GET(self):
+        """Answers the network probe of the clients (``GET /ping``); other paths are
+        served as files."""
+        if self.path != PING_PATH:
+            super().do_GET()
+            return
+        body = json.dumps({"status": "ok"}).encode()
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_POST(self):
         """Handles POST requests to receive and process files or image data"""
         print(self.headers) ## 
@@ -29,58 +93,85 @@ class CustomHandler(http.server.SimpleHTTPRequestHandler):
 
         content_length = int(self.headers["Content-Length"])
         post_data = self.rfile.read(content_length)
+        self.processing_start = time.perf_counter()
         content_type = self.headers.get("Content-type")
         file_name = self.headers.get("X-File-Name", "uploaded_file.png")
         file_path = os.path.join(UPLOAD_FOLDER, file_name)
         _, image_ext = os.path.splitext(file_name)
 
-        if content_type == "application/json":
-            self._handle_json_request(post_data)
-        else:
-            self._handle_file_request(file_path, post_data, file_name, image_ext)
+        admission = _admission
+        if admission is not None and not admission.acquire(blocking=False):
+            self._send_overloaded()
+            return
+        try:
+            # Classes and thresholds requested by the client (X-Classes, X-Conf...)
+            self.detection_filter = DetectionFilter.from_headers(self.headers)
+            if content_type == "application/json":
+                self._handle_json_request(post_data)
+            elif content_type == FEATURES_CONTENT_TYPE:
+                self._handle_features_request(post_data)
+            else:
+                self._handle_file_request(file_path, post_data, file_name, image_ext)
+        except ValueError as e:
+            print(f"[ERROR] Parámetros no válidos: {e}")
+            self.send_response(400)
+            self.end_headers()
+            self.wfile.write(f"Parametros no validos: {str(e)}".encode())
+        finally:
+            if admission is not None:
+                admission.release()
+
+    def _send_overloaded(self):
+        """Rejects the request because too many are already admitted."""
+        print("[WARNING] Servidor saturado, petición rechazada (503)")
+        body = b"Servidor saturado, reintentar mas tarde."
+        self.send_response(503)
+        self.send_header("Retry-After", str(RETRY_AFTER_SECONDS))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _model_kwargs(self, model) -> Dict[str, Any]:
+        """Arguments of the model call that apply the filter of the request."""
+        return self.detection_filter.model_kwargs(model.names)
 
     def _handle_json_request(self, post_data):
         """Handles requests with serialized image data in JSON format"""
-        print("Receiving a serialized numpy array in JSON format")
-
         # Decode the JSON data
         json_data = json.loads(post_data)
-        image_array = np.array(json_data["image_array"])
-        shape = json_data["shape"]
+        if "crops" in json_data:
+            self._handle_crops_request(json_data)
+            return
+        if "images" in json_data:
+            self._handle_batch_request(json_data)
+            return
 
         # Initialize the YOLO model and make predictions
-        model = init_model(size="x")
-        results = predict_with_flatten_array(model, image_array, shape)
-        speed = results[0].speed
-        original_shape = results[0].orig_shape
-        boxes = results[0].boxes
-        labels = results[0].names
-        objects_detected = []
-        for box in boxes:
-            label = box.cls[0]  # Obtiene la clase del objeto
-            confidence = box.conf[0].item()  # Obtiene el porcentaje de confianza
-            objects_detected.append((labels[int(label)], confidence))
+        model = get_model(size="x")
+        if "image_encoded" in json_data:
+            print("Receiving a letterboxed compressed image in JSON format")
+            image = decode_image(base64.b64decode(json_data["image_encoded"]))
+            imgsz = int(json_data.get("imgsz", image.shape[0]))
+            with inference_lock:
+                results = model(image, imgsz=imgsz, **self._model_kwargs(model))
+        else:
+            print("Receiving a serialized numpy array in JSON format")
+            image_array = np.array(json_data["image_array"], dtype=np.uint8)
+            shape = json_data["shape"]
+            with inference_lock:
+                results = predict_with_flatten_array(
+                    model, image_array, shape, **self._model_kwargs(model)
+                )
+        detections = Detections.from_result(results[0])
         results_data = {
-            "speed": speed,
-            "original_shape": original_shape,
-            "objects_detected": objects_detected,
+            "speed": results[0].speed,
+            "original_shape": results[0].orig_shape,
+            "objects_detected": detections.objects_detected(),
         }
 
-        boxes = get_bounding_boxes(results)
-
-        # Prepare the response with bounding box data
+        # Prepare the response with bounding box data (in the received image space)
         response_data = {
-            "bounding_boxes": [
-                {
-                    "x1": box[0],
-                    "y1": box[1],
-                    "x2": box[2],
-                    "y2": box[3],
-                    "label": box[4],
-                    "confidence": box[5],
-                }
-                for box in boxes
-            ],
+            "bounding_boxes": detections.to_boxes(),
             "results_data": results_data,
         }
 
@@ -105,6 +196,101 @@ class CustomHandler(http.server.SimpleHTTPRequestHandler):
             self.end_headers()
         '''
 
+    def _handle_crops_request(self, json_data):
+        """Runs a batched detection over the changed-region crops sent by the client
+        and returns the boxes in full-frame coordinates"""
+        crops = json_data["crops"]
+        print(f"Receiving {len(crops)} changed-region crops")
+        detections = []
+        names = {}
+        speed = {"preprocess": 0.0, "inference": 0.0, "postprocess": 0.0}
+
+        if crops:
+            images = [
+                decode_image(base64.b64decode(crop["image_encoded"])) for crop in crops
+            ]
+            model = get_model(size="x")
+            with inference_lock:
+                results = model(images, **self._model_kwargs(model))
+            names = model.names
+            for crop, result in zip(crops, results):
+                detections.append(Detections.from_result(result).offset(*crop["offset"]))
+                for stage, value in result.speed.items():
+                    speed[stage] = speed.get(stage, 0.0) + (value or 0.0)
+
+        frame_detections = Detections.concatenate(detections, names)
+        results_data = {
+            "speed": speed,
+            "objects_detected": frame_detections.objects_detected(),
+        }
+        self._send_json_response(
+            {"bounding_boxes": frame_detections.to_boxes(), "results_data": results_data}
+        )
+
+    def _handle_batch_request(self, json_data):
+        """Runs a batched detection over several full frames (e.g. the backlog of
+        frames spooled by the client during an outage) and returns one result per
+        frame"""
+        images = json_data["images"]
+        print(f"Receiving a batch of {len(images)} frames")
+        responses = []
+
+        if images:
+            frames = [
+                decode_image(base64.b64decode(image["image_encoded"])) for image in images
+            ]
+            model = get_model(size="x")
+            with inference_lock:
+                results = model(frames, **self._model_kwargs(model))
+            for image, result in zip(images, results):
+                detections = Detections.from_result(result)
+                results_data = {
+                    "path": image.get("file_name", ""),
+                    "speed": result.speed,
+                    "original_shape": result.orig_shape,
+                    "objects_detected": detections.objects_detected(),
+                }
+                responses.append(
+                    {"bounding_boxes": detections.to_boxes(), "results_data": results_data}
+                )
+
+        self._send_json_response({"results": responses})
+
+    def _handle_features_request(self, post_data):
+        """Resumes a split forward pass from the intermediate tensors sent by the
+        client and returns the detections in the letterboxed image space"""
+        try:
+            split_layer = int(self.headers.get("X-Split-Layer", ""))
+            size = self.headers.get("X-Model-Size", "n")
+            if size not in SPLIT_MODEL_SIZES:
+                raise ValueError(f"Tamaño de modelo no soportado: {size}")
+            model = get_split_model(size)
+            print(f"Receiving intermediate features from layer {split_layer}")
+            features = deserialize_features(post_data)
+            with inference_lock:
+                start_time = time.perf_counter()
+                predictions = run_tail(model, features, split_layer)
+                bounding_boxes = predictions_to_boxes(
+                    predictions, model.names, **self._model_kwargs(model)
+                )
+                inference_time = (time.perf_counter() - start_time) * 1000
+        except (ValueError, KeyError, RuntimeError) as e:
+            print(f"[ERROR] Fallo en la inferencia dividida: {e}")
+            self.send_response(400)
+            self.end_headers()
+            self.wfile.write(f"Features no validos: {str(e)}".encode())
+            return
+
+        results_data = {
+            "speed": {"inference": inference_time},
+            "objects_detected": [
+                (box["label"], box["confidence"]) for box in bounding_boxes
+            ],
+        }
+        self._send_json_response(
+            {"bounding_boxes": bounding_boxes, "results_data": results_data}
+        )
+
     def _handle_file_request(self, file_path, post_data, file_name, image_ext: str = None):
         """Handles requests with binary files and performs predictions if needed"""
         # parsear multipart
@@ -137,8 +323,15 @@ class CustomHandler(http.server.SimpleHTTPRequestHandler):
                 # Procesar imagen solo si no es un archivo de resultado
                 if "result" not in file_name:
                     try:
-                        model = init_model()
-                        result_data = image_prediction(model, file_path, image_ext)
+                        model = get_model()
+                        with inference_lock:
+                            result_data = image_prediction(
+                                model,
+                                file_path,
+                                image_ext,
+                                detection_filter=self.detection_filter,
+                                render=True,  # The response carries the image
+                            )
                         self._send_multipart_response(result_data)
                     except Exception as e:
                         print(f"[ERROR] Fallo en image_prediction: {e}")
@@ -169,10 +362,17 @@ class CustomHandler(http.server.SimpleHTTPRequestHandler):
 
 
 
+    def _send_processing_time_header(self):
+        """Sends the time spent processing the request, so clients can separate it
+        from the time spent on the network."""
+        processing_time = time.perf_counter() - self.processing_start
+        self.send_header("X-Processing-Time", f"{processing_time:.6f}")
+
     def _send_json_response(self, data):
         """Sends a JSON response back to the client"""
         self.send_response(200)
         self.send_header("Content-type", "application/json")
+        self._send_processing_time_header()
         self.end_headers()
         self.wfile.write(json.dumps(data).encode())
 
@@ -183,6 +383,7 @@ class CustomHandler(http.server.SimpleHTTPRequestHandler):
         boundary = "----Boundary1234567890"
         self.send_response(200)
         self.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+        self._send_processing_time_header()
         self.end_headers()
 
         # Prepare JSON part
@@ -222,8 +423,13 @@ class CustomHandler(http.server.SimpleHTTPRequestHandler):
         print(f"Processed image sent: {image_path}")
 
 
-def main():
-    """Main function to start the HTTP server"""
-    with socketserver.TCPServer(("", PORT), CustomHandler) as httpd:
+def main(max_pending: int = MAX_PENDING_REQUESTS):
+    """Main function to start the HTTP server.
+
+    ``max_pending`` is the number of requests admitted at the same time; the rest
+    get a 503 answer (None or 0: no limit).
+    """
+    set_max_pending(max_pending)
+    with socketserver.ThreadingTCPServer(("", PORT), CustomHandler) as httpd:
         print(f"Server running on port {PORT}")
         httpd.serve_forever()
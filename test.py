@@ -6,9 +6,13 @@ from tests.resource_usage import run_detection_tests
 from tests.resource_usage_server import (
     run_detection_tests as run_detection_tests_server,
 )
-from tests.resource_usage_delegation import (
-    run_detection_tests as run_detection_tests_delegation,
-)
+from tests.split_benchmark import run_split_benchmark
+from tests.quantization_report import run_quantization_report
+from tests.thread_layout_benchmark import run_thread_layout_benchmark
+from tests.startup_benchmark import run_startup_benchmark
+from tests.offline_benchmark import MODES, run_offline_benchmark
+from tests.load_generator import LOAD_MODES, run_load_test
+from utils.metrics import EXTENSIONS, set_metrics_format
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Captura y procesa imágenes.")
@@ -48,8 +52,60 @@ if __name__ == "__main__":
         default=2,
         help="Intervalo entre capturas en segundos.",
     )
+    parser.add_argument(
+        "--split_layers",
+        type=str,
+        default="2,4,6,10,13,16,22",
+        help="Capas a evaluar en el benchmark de inferencia dividida (separadas por coma)",
+    )
+    parser.add_argument(
+        "--modes",
+        type=str,
+        default=",".join(MODES),
+        help="Modos del benchmark offline (separados por coma)",
+    )
+    parser.add_argument(
+        "--frames",
+        type=int,
+        default=50,
+        help="Frames medidos por modo en el benchmark offline",
+    )
+    parser.add_argument(
+        "--load_mode",
+        type=str,
+        default="open",
+        choices=list(LOAD_MODES),
+        help="Llegadas de la prueba de carga: abiertas (Poisson) o cerradas",
+    )
+    parser.add_argument(
+        "--load_levels",
+        type=str,
+        default=None,
+        help="Cargas de la prueba (peticiones/s en abierto, clientes en cerrado); por "
+        "defecto 0.5,1,2,4,8 en abierto y 1,2,4,8,16 en cerrado",
+    )
+    parser.add_argument(
+        "--clients",
+        type=int,
+        default=4,
+        help="Cámaras simuladas en la prueba de carga abierta",
+    )
+    parser.add_argument(
+        "--level_seconds",
+        type=float,
+        default=30,
+        help="Duración de cada nivel de carga en segundos",
+    )
+    parser.add_argument(
+        "--metrics_format",
+        type=str,
+        default="csv",
+        choices=list(EXTENSIONS),
+        help="Formato de los ficheros de métricas (parquet y arrow necesitan pyarrow)",
+    )
 
     args = parser.parse_args()
+    set_metrics_format(args.metrics_format)
 
     if args.type_inference == "local":
         print("Tests local")
@@ -64,10 +120,44 @@ if __name__ == "__main__":
         run_detection_tests_server(
             server_ip=args.server_ip, image_ext=args.image_format
         )
-    elif args.type_inference == "delegation":
-        print("Tests Task Delegation en conjunta")
-        run_detection_tests_delegation(
-            server_ip=args.server_ip, image_ext=args.image_format
+    elif args.type_inference == "split":
+        print("Benchmark de inferencia dividida")
+        run_split_benchmark(
+            server_ip=args.server_ip,
+            split_layers=[int(layer) for layer in args.split_layers.split(",")],
+        )
+    elif args.type_inference == "quantization":
+        print("Informe de modelos cuantizados")
+        run_quantization_report()
+    elif args.type_inference == "threads":
+        print("Benchmark de hilos y afinidad de CPU")
+        run_thread_layout_benchmark(rpi=args.rpi)
+    elif args.type_inference == "startup":
+        print("Benchmark de arranque por modo")
+        run_startup_benchmark()
+    elif args.type_inference == "offline":
+        print("Benchmark offline de los modos de inferencia")
+        run_offline_benchmark(
+            modes=args.modes.split(","),
+            frames=args.frames,
+            server_ip=args.server_ip,
+            rpi=args.rpi,
+        )
+    elif args.type_inference == "load":
+        print("Prueba de carga del servidor")
+        run_load_test(
+            server_ip=args.server_ip,
+            mode=args.load_mode,
+            levels=(
+                [float(level) for level in args.load_levels.split(",")]
+                if args.load_levels
+                else None
+            ),
+            clients=args.clients,
+            level_seconds=args.level_seconds,
         )
     else:
-        print("Tipo de inferencia no válido: local, server, joint")
+        print(
+            "Tipo de inferencia no válido: local, server, split, "
+            "quantization, threads, startup, offline, load"
+        )
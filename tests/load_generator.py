@@ -0,0 +1,377 @@
+"""This module contains a load generator for the detection server: N simulated camera
+clients send the images of a folder, as file uploads (``upload_image``) and as
+letterboxed JSON requests (``upload_image_preprocessed``), with open-loop (Poisson)
+or closed-loop arrivals.
+
+Each load level of a sweep records the latency distribution of the answered requests,
+the rates of errors and of 503 answers (admission control of the server) and the
+achieved throughput, so the saturation point of the server appears in the
+latency-vs-throughput curve. The server answers 503 only with admission control
+enabled: start it with ``python server.py --max_pending N`` (by default there is no
+limit and the 503 column stays at 0).
+
+In open loop the latency is measured from the scheduled arrival of the request, so
+the time a request waits for a free client thread is included (a saturated server
+does not slow down the offered load).
+"""
+
+import base64
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import requests
+
+from utils.detection import preprocess_image
+from utils.pipeline import FolderSource
+
+CONTENT_TYPES = ("file", "json")
+LOAD_MODES = ("open", "closed")
+# Requests/s in open loop, clients in closed loop
+DEFAULT_LEVELS = {"open": (0.5, 1, 2, 4, 8), "closed": (1, 2, 4, 8, 16)}
+RECORD_FIELDS = [
+    "level",
+    "client",
+    "content_type",
+    "scheduled",
+    "start",
+    "end",
+    "latency",
+    "service_time",
+    "server_time",
+    "status",
+    "error",
+    "retry_after",
+    "bytes_sent",
+]
+
+
+def build_payloads(
+    image_folder: str, content_types: Sequence[str], imgsz: int = 640
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Encodes the images of the folder once per content type (body and headers)."""
+    image_paths = FolderSource(image_folder).image_paths
+    payloads: Dict[str, List[Dict[str, Any]]] = {}
+    for content_type in content_types:
+        if content_type not in CONTENT_TYPES:
+            raise ValueError(
+                f"Tipo de contenido no válido: {content_type} ({', '.join(CONTENT_TYPES)})"
+            )
+        payloads[content_type] = []
+        for image_path in image_paths:
+            extension = os.path.splitext(image_path)[1]
+            if content_type == "file":
+                with open(image_path, "rb") as image_file:
+                    body = image_file.read()
+                headers = {"Content-Type": "application/octet-stream"}
+            else:
+                encoded_image, _ = preprocess_image(image_path, imgsz)
+                body = json.dumps(
+                    {
+                        "image_encoded": base64.b64encode(encoded_image).decode("ascii"),
+                        "encoding": "jpg",
+                        "imgsz": imgsz,
+                    }
+                ).encode()
+                headers = {"Content-Type": "application/json"}
+            payloads[content_type].append(
+                {"body": body, "headers": headers, "extension": extension}
+            )
+    return payloads
+
+
+class LoadGenerator:
+    """Sends requests to the server and records one row per request.
+
+    Args:
+        server_ip (str): IP address of the detection server.
+        payloads (dict): Requests per content type (see ``build_payloads``).
+        clients (int): Simulated cameras. Consecutive requests alternate between the
+            content types of ``payloads``.
+        timeout (float): Maximum seconds to wait for an answer.
+    """
+
+    def __init__(
+        self,
+        server_ip: str,
+        payloads: Dict[str, List[Dict[str, Any]]],
+        clients: int = 4,
+        timeout: float = 60,
+    ) -> None:
+        self.url = f"http://{server_ip}:8000/"
+        self.payloads = payloads
+        self.content_types = list(payloads)
+        self.clients = clients
+        self.timeout = timeout
+        self.records: List[Dict[str, Any]] = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def send(self, client: int, scheduled: float, level: float) -> Dict[str, Any]:
+        """Sends the next request of ``client``; ``scheduled`` is its arrival time
+        (``time.perf_counter``)."""
+        with self._lock:
+            sequence = self._sequence
+            self._sequence += 1
+        content_type = self.content_types[sequence % len(self.content_types)]
+        images = self.payloads[content_type]
+        payload = images[sequence // len(self.content_types) % len(images)]
+        # Unique names: the server stores file uploads (and their result) by name
+        headers = {
+            **payload["headers"],
+            "X-File-Name": f"load_{client}_{sequence}{payload['extension']}",
+        }
+
+        start = time.perf_counter()
+        status, server_time, retry_after, error = None, None, None, ""
+        try:
+            response = self._session().post(
+                self.url, data=payload["body"], headers=headers, timeout=self.timeout
+            )
+            status = response.status_code
+            server_time = float(response.headers.get("X-Processing-Time", 0.0)) or None
+            if "Retry-After" in response.headers:
+                retry_after = float(response.headers["Retry-After"])
+        except requests.RequestException as e:
+            error = type(e).__name__
+        end = time.perf_counter()
+
+        record = {
+            "level": level,
+            "client": client,
+            "content_type": content_type,
+            "scheduled": scheduled,
+            "start": start,
+            "end": end,
+            "latency": end - scheduled,
+            "service_time": end - start,
+            "server_time": server_time,
+            "status": status,
+            "error": error,
+            "retry_after": retry_after,
+            "bytes_sent": len(payload["body"]),
+        }
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def run_open_loop(
+        self, rate: float, duration: float, max_outstanding: int = 64, seed: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Poisson arrivals at ``rate`` requests/s for ``duration`` seconds, spread
+        over the clients in turn; up to ``max_outstanding`` requests in flight."""
+        rng = np.random.default_rng(seed)
+        first = len(self.records)
+        start = time.perf_counter()
+        arrival = start
+        count = 0
+        with ThreadPoolExecutor(max_workers=max_outstanding) as executor:
+            while True:
+                arrival += rng.exponential(1.0 / rate)
+                if arrival - start >= duration:
+                    break
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.send, count % self.clients, arrival, rate)
+                count += 1
+        return self.records[first:]
+
+    def run_closed_loop(
+        self, duration: float, think_time: float = 0.0, seed: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Each client sends a request, waits for the answer and an exponential
+        ``think_time`` (mean, seconds) and sends the next one, for ``duration``
+        seconds. A client rejected with 503 waits the ``Retry-After`` of the server
+        instead of retrying at once."""
+        first = len(self.records)
+        deadline = time.perf_counter() + duration
+
+        def client_loop(client: int) -> None:
+            rng = np.random.default_rng(seed + client)
+            while time.perf_counter() < deadline:
+                record = self.send(client, time.perf_counter(), self.clients)
+                pause = rng.exponential(think_time) if think_time else 0.0
+                if record["status"] == 503:
+                    pause = max(pause, record["retry_after"] or 1.0)
+                time.sleep(min(pause, max(deadline - time.perf_counter(), 0.0)))
+
+        threads = [
+            threading.Thread(target=client_loop, args=(client,), daemon=True)
+            for client in range(self.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.records[first:]
+
+    def warm_up(self) -> None:
+        """Sends one request of each content type, so the model loading of the
+        server is not measured, and forgets them."""
+        for _ in self.content_types:
+            self.send(0, time.perf_counter(), 0)
+        self.records.clear()
+
+
+def summarize(records: List[Dict[str, Any]], offered: float, mode: str) -> Dict[str, Any]:
+    """Summary of one load level: throughput, latency percentiles and error rates."""
+    sent = len(records)
+    answered = [r for r in records if r["status"] == 200]
+    rejected = sum(1 for r in records if r["status"] == 503)
+    latencies = np.array([r["latency"] for r in answered]) * 1000
+    server_times = [r["server_time"] for r in answered if r["server_time"]]
+    if records:
+        span = max(r["end"] for r in records) - min(r["scheduled"] for r in records)
+    else:
+        span = 0.0
+    return {
+        "mode": mode,
+        "offered": offered,
+        "sent": sent,
+        "offered_rps": sent / span if span else 0.0,
+        "throughput_rps": len(answered) / span if span else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(answered) else None,
+        "p95_ms": float(np.percentile(latencies, 95)) if len(answered) else None,
+        "p99_ms": float(np.percentile(latencies, 99)) if len(answered) else None,
+        "server_ms": float(np.mean(server_times)) * 1000 if server_times else None,
+        "rejected_rate": rejected / sent if sent else 0.0,
+        "error_rate": (sent - len(answered) - rejected) / sent if sent else 0.0,
+    }
+
+
+def plot_curve(rows: List[Dict[str, Any]], image_path: str) -> Optional[str]:
+    """Draws latency (p50/p95/p99) against the achieved throughput."""
+    try:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("[WARNING] matplotlib no está instalado, no se dibuja la curva")
+        return None
+    rows = [row for row in rows if row["p50_ms"] is not None]
+    throughput = [row["throughput_rps"] for row in rows]
+    figure, axis = plt.subplots(figsize=(8, 5))
+    for quantile in ("p50_ms", "p95_ms", "p99_ms"):
+        axis.plot(throughput, [row[quantile] for row in rows], marker="o", label=quantile[:3])
+    axis.set_xlabel("Throughput (peticiones/s)")
+    axis.set_ylabel("Latencia (ms)")
+    axis.set_title("Latencia frente a throughput del servidor")
+    axis.grid(True, alpha=0.3)
+    axis.legend()
+    figure.savefig(image_path, dpi=120, bbox_inches="tight")
+    plt.close(figure)
+    return image_path
+
+
+def run_load_test(
+    server_ip: str = None,
+    mode: str = "open",
+    levels: Optional[Sequence[float]] = None,
+    clients: int = 4,
+    content_types: Sequence[str] = CONTENT_TYPES,
+    level_seconds: float = 30,
+    think_time: float = 0.0,
+    image_folder: str = "./data/local/",
+    output_csv: str = "./data/tests/",
+    max_outstanding: int = 64,
+) -> List[Dict[str, Any]]:
+    """Sweeps the offered load and stores the requests, the summary and the curve.
+
+    The 503 rate is only measured when the server was started with admission control
+    (``python server.py --max_pending N``).
+
+    Args:
+        server_ip (str): IP address of the detection server (localhost by default).
+        mode (str): ``"open"`` (``levels`` are Poisson rates in requests/s) or
+            ``"closed"`` (``levels`` are numbers of clients).
+        levels (Sequence[float], optional): Offered loads of the sweep (by default
+            ``DEFAULT_LEVELS[mode]``). Closed-loop levels must be whole numbers of
+            clients, at least 1.
+        clients (int): Simulated cameras in open loop.
+        content_types (Sequence[str]): ``"file"`` and/or ``"json"`` requests.
+        level_seconds (float): Duration of each level.
+        think_time (float): Mean pause of each closed-loop client between requests.
+        image_folder (str): Folder with the images to send.
+        output_csv (str): Folder where the CSV files and the curve will be saved.
+        max_outstanding (int): Requests in flight at most in open loop.
+
+    Returns:
+        List[Dict[str, Any]]: One summary row per load level.
+    """
+    if mode not in LOAD_MODES:
+        raise ValueError(f"Modo de carga no válido: {mode} ({', '.join(LOAD_MODES)})")
+    levels = DEFAULT_LEVELS[mode] if levels is None else levels
+    if mode == "closed" and any(level < 1 or level != int(level) for level in levels):
+        raise ValueError(
+            f"En carga cerrada las cargas son clientes (enteros >= 1): {levels}"
+        )
+    os.makedirs(output_csv, exist_ok=True)
+    payloads = build_payloads(image_folder, content_types)
+    if not any(payloads.values()):
+        print(f"[ERROR] No hay imágenes en {image_folder}")
+        return []
+    server_ip = server_ip or "localhost"
+    LoadGenerator(server_ip, payloads, 1, timeout=300).warm_up()
+
+    rows = []
+    records = []
+    for level in levels:
+        if mode == "open":
+            generator = LoadGenerator(server_ip, payloads, clients)
+            print(f"Carga abierta: {level} peticiones/s durante {level_seconds} s")
+            level_records = generator.run_open_loop(level, level_seconds, max_outstanding)
+        else:
+            generator = LoadGenerator(server_ip, payloads, int(level))
+            print(f"Carga cerrada: {int(level)} clientes durante {level_seconds} s")
+            level_records = generator.run_closed_loop(level_seconds, think_time)
+        records += level_records
+        rows.append(summarize(level_records, level, mode))
+
+    timestamp = int(time.time() * 1000)
+    csv_path = os.path.join(output_csv, f"load_test_{timestamp}.csv")
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    requests_path = os.path.join(output_csv, f"load_test_requests_{timestamp}.csv")
+    with open(requests_path, mode="w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=RECORD_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    curve_path = plot_curve(rows, os.path.join(output_csv, f"load_test_{timestamp}.png"))
+
+    def fmt(value: Optional[float], width: int) -> str:
+        return f"{'-' if value is None else f'{value:.1f}':>{width}}"
+
+    print("\n" + "=" * 86)
+    print(
+        f"{'Carga':>7}{'Enviadas':>10}{'Ofrecidas/s':>13}{'Atendidas/s':>13}"
+        f"{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'503 (%)':>9}{'Error (%)':>11}"
+    )
+    print("=" * 86)
+    for row in rows:
+        print(
+            f"{row['offered']:>7g}{row['sent']:>10}{row['offered_rps']:>13.2f}"
+            f"{row['throughput_rps']:>13.2f}{fmt(row['p50_ms'], 10)}{fmt(row['p95_ms'], 10)}"
+            f"{fmt(row['p99_ms'], 10)}{row['rejected_rate'] * 100:>9.1f}"
+            f"{row['error_rate'] * 100:>11.1f}"
+        )
+    print("=" * 86)
+    print(f"Data saved to {csv_path} and {requests_path}")
+    if curve_path:
+        print(f"Curve saved to {curve_path}")
+    return rows
@@ -0,0 +1,344 @@
+"""This module contains an offline, reproducible benchmark of the inference modes: a
+fixed image set is replayed (no camera, no capture interval) through the stages of
+the local, server, joint and delegation modes against a detection server started on
+localhost when needed.
+
+For each mode it reports throughput, end-to-end latency percentiles (p50/p95/p99),
+the time of every stage, the bytes sent to the server and on the wire, and the CPU
+and RSS of the client process. The report is a JSON file, with the host, the
+versions and the commit, so runs on different hardware and commits can be
+compared, plus a summary table.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import psutil
+import requests
+
+from detection_v2.image_capture import DelegationInference
+from utils.model_registry import get_model
+from utils.network_probe import PING_PATH
+from utils.pipeline import Frame, FolderSource, Pipeline, SaveImage, Stage, StageOutput
+from utils.resource_sampler import ResourceSampler
+from utils.stages import JointInference, LocalInference, RemoteInference
+
+MODES = ("local", "server", "joint", "delegation")
+REMOTE_MODES = ("server", "joint", "delegation")
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOCAL_HOSTS = ("localhost", "127.0.0.1")
+
+
+class LatencyRecorder(Stage):
+    """Last stage of the benchmark: records the end-to-end latency of every frame
+    (from its creation by the source) and the bytes uploaded for it."""
+
+    name = "recorder"
+
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self.upload_sizes: List[int] = []
+        self.places: Dict[str, int] = {}
+        self.errors = 0
+
+    def process(self, frame: Frame) -> StageOutput:
+        result = frame.result
+        if not isinstance(result, dict):  # Exception of a failed upload
+            self.errors += 1
+            return frame
+        self.latencies.append(time.time() - frame.timestamp)
+        self.upload_sizes.append(result.get("upload_size") or 0)
+        place = result.get("detection_place", "")
+        self.places[place] = self.places.get(place, 0) + 1
+        return frame
+
+
+def build_mode_stages(
+    mode: str, output_folder: str, server_ip: str, rpi: bool, backend: str, imgsz: int
+) -> List[Stage]:
+    """Stages of ``mode`` without the capture interval, overlay and printing."""
+    if mode == "local":
+        inference = LocalInference(get_model("n", rpi=rpi, backend=backend))
+    elif mode == "server":
+        inference = RemoteInference(server_ip)
+    elif mode == "joint":
+        inference = JointInference(server_ip, imgsz)
+    elif mode == "delegation":
+        inference = DelegationInference(server_ip)
+    else:
+        raise ValueError(f"Modo no válido: {mode} ({', '.join(MODES)})")
+    return [SaveImage(output_folder), inference]
+
+
+def _server_answers() -> bool:
+    try:
+        requests.get(f"http://127.0.0.1:8000{PING_PATH}", timeout=1)
+    except requests.RequestException:
+        return False
+    return True
+
+
+def start_local_server(stand_in: bool = False, timeout: float = 120) -> subprocess.Popen:
+    """Starts the detection server (or the stand-in without a model) on localhost in
+    another process and waits until it answers ``GET /ping``."""
+    if _server_answers():
+        raise RuntimeError("Ya hay un servidor en el puerto 8000: indica su server_ip")
+    command = (
+        [sys.executable, "-m", "tests.stand_in_server"]
+        if stand_in
+        else [sys.executable, os.path.join(REPOSITORY, "server.py")]
+    )
+    env = dict(os.environ, PYTHONPATH=REPOSITORY)
+    process = subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El servidor terminó con el código {process.returncode}")
+        if _server_answers():
+            return process
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("El servidor local no respondió a tiempo")
+
+
+def wire_bytes(server_ip: Optional[str]) -> int:
+    """Bytes on the network interfaces: loopback for a local server (every packet in
+    both directions, headers included), all the interfaces otherwise."""
+    counters = psutil.net_io_counters(pernic=True)
+    if server_ip in LOCAL_HOSTS and "lo" in counters:
+        return counters["lo"].bytes_sent
+    return sum(c.bytes_sent + c.bytes_recv for name, c in counters.items() if name != "lo")
+
+
+def host_info() -> Dict[str, Any]:
+    """Hardware, software versions and commit of the run."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=REPOSITORY,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = {}
+    for package in ("ultralytics", "torch", "onnxruntime", "ncnn", "openvino"):
+        module = sys.modules.get(package)
+        if module is not None:
+            versions[package] = getattr(module, "__version__", None)
+    return {
+        "hostname": platform.node(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "memory_bytes": psutil.virtual_memory().total,
+        "python": platform.python_version(),
+        "commit": commit,
+        "versions": versions,
+    }
+
+
+def run_mode(
+    mode: str,
+    image_folder: str,
+    output_folder: str,
+    frames: int,
+    warmup: int,
+    server_ip: Optional[str],
+    rpi: bool,
+    backend: Optional[str],
+    imgsz: int,
+    threaded: bool,
+) -> Dict[str, Any]:
+    """Replays ``frames`` images through ``mode`` and returns its summary."""
+    source = FolderSource(image_folder)
+    loops = -(-(frames + warmup) // len(source.image_paths))
+    if warmup:  # Loads the models (client and server) outside the measurement
+        Pipeline(
+            _limited(FolderSource(image_folder, loops=loops), warmup),
+            build_mode_stages(mode, output_folder, server_ip, rpi, backend, imgsz),
+            threaded=False,
+        ).run()
+
+    recorder = LatencyRecorder()
+    stages = build_mode_stages(mode, output_folder, server_ip, rpi, backend, imgsz)
+    pipeline = Pipeline(
+        _limited(FolderSource(image_folder, loops=loops), frames),
+        stages + [recorder],
+        threaded=threaded,
+        drop_when_full=False,
+    )
+    sampler = ResourceSampler(include_children=False).start()
+    mark = sampler.mark_start()
+    bytes_before = wire_bytes(server_ip)
+    stage_rows = pipeline.run()
+    wire = wire_bytes(server_ip) - bytes_before
+    usage = sampler.mark_end(mark)
+    sampler.stop()
+
+    latencies = np.array(recorder.latencies) * 1000
+    done = len(recorder.latencies)
+    return {
+        "mode": mode,
+        "frames": done,
+        "errors": recorder.errors,
+        "dropped": frames - done - recorder.errors,
+        "elapsed_s": pipeline.elapsed_time,
+        "throughput_fps": done / pipeline.elapsed_time if pipeline.elapsed_time else 0.0,
+        "latency_ms": {
+            "mean": float(latencies.mean()) if done else None,
+            "p50": float(np.percentile(latencies, 50)) if done else None,
+            "p95": float(np.percentile(latencies, 95)) if done else None,
+            "p99": float(np.percentile(latencies, 99)) if done else None,
+            "max": float(latencies.max()) if done else None,
+        },
+        "stages": [row for row in stage_rows if row["stage"] != recorder.name],
+        "upload_bytes_per_frame": sum(recorder.upload_sizes) / done if done else 0.0,
+        "wire_bytes_per_frame": wire / done if done and mode in REMOTE_MODES else 0.0,
+        "detection_places": recorder.places,
+        "process_cpu": usage["process_cpu"],
+        "process_cpu_time_s": usage["process_cpu_time"],
+        "rss_peak_mb": usage["rss_peak"] / 2**20,
+        "rss_end_mb": usage["rss_end"] / 2**20,
+        "system_cpu": usage["system_cpu"],
+    }
+
+
+def _limited(source: FolderSource, limit: int):
+    """The first ``limit`` frames of ``source`` (across its loops)."""
+    for frame in source:
+        if frame.index >= limit:
+            return
+        yield frame
+
+
+def run_offline_benchmark(
+    modes: Sequence[str] = MODES,
+    image_folder: str = "./data/local/",
+    output_json: str = "./data/tests/",
+    frames: int = 50,
+    warmup: int = 2,
+    server_ip: Optional[str] = None,
+    stand_in: bool = False,
+    rpi: bool = True,
+    backend: Optional[str] = None,
+    imgsz: int = 640,
+    threaded: bool = False,
+) -> Dict[str, Any]:
+    """Replays the images of ``image_folder`` through every mode and stores the report.
+
+    Args:
+        modes (Sequence[str]): Modes to run (local, server, joint, delegation).
+        image_folder (str): Folder with the images to replay (looped if needed).
+        output_json (str): Folder where the JSON report will be saved.
+        frames (int): Measured frames per mode.
+        warmup (int): Frames run before measuring each mode (model loading).
+        server_ip (str, optional): Detection server. By default one is started on
+            localhost for the remote modes and stopped at the end.
+        stand_in (bool): Start the stand-in server (no model) instead of the real
+            one, to measure only the client and the transfer.
+        rpi (bool): Load the model used on the Raspberry Pi.
+        backend (str, optional): Backend of the local model.
+        imgsz (int): Resolution of the joint mode.
+        threaded (bool): Run the stages on their own threads as in production. By
+            default they run one after another, so the latency of each frame is its
+            service time and does not include queueing.
+
+    Returns:
+        Dict[str, Any]: The report (``host``, ``config`` and one entry per mode).
+    """
+    os.makedirs(output_json, exist_ok=True)
+    if not FolderSource(image_folder).image_paths:
+        print(f"[ERROR] No hay imágenes en {image_folder}")
+        return {}
+    server = None
+    if server_ip is None and any(mode in REMOTE_MODES for mode in modes):
+        print("Iniciando el servidor en localhost...")
+        server = start_local_server(stand_in)
+        server_ip = "127.0.0.1"
+
+    timestamp = int(time.time() * 1000)
+    output_folder = os.path.join(output_json, f"offline_benchmark_frames_{timestamp}")
+    results = []
+    try:
+        for mode in modes:
+            print(f"Modo {mode}: {frames} frames")
+            results.append(
+                run_mode(
+                    mode,
+                    image_folder,
+                    output_folder,
+                    frames,
+                    warmup,
+                    server_ip,
+                    rpi,
+                    backend,
+                    imgsz,
+                    threaded,
+                )
+            )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "timestamp": timestamp,
+        "host": host_info(),
+        "config": {
+            "modes": list(modes),
+            "image_folder": image_folder,
+            "images": len(FolderSource(image_folder).image_paths),
+            "frames": frames,
+            "warmup": warmup,
+            "server_ip": server_ip,
+            "server": "stand_in" if stand_in else ("local" if server else "external"),
+            "rpi": rpi,
+            "backend": backend,
+            "imgsz": imgsz,
+            "threaded": threaded,
+        },
+        "modes": results,
+    }
+    json_path = os.path.join(output_json, f"offline_benchmark_{timestamp}.json")
+    with open(json_path, mode="w", encoding="utf-8") as json_file:
+        json.dump(report, json_file, indent=2)
+
+    print("\n" + "=" * 92)
+    print(
+        f"{'Modo':<12}{'FPS':>7}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}"
+        f"{'Subida (KB)':>13}{'Red (KB)':>10}{'CPU':>7}{'RSS (MB)':>10}{'Errores':>9}"
+    )
+    print("=" * 92)
+    for row in results:
+        latency = row["latency_ms"]
+        print(
+            f"{row['mode']:<12}{row['throughput_fps']:>7.2f}"
+            + "".join(
+                f"{'-' if latency[q] is None else f'{latency[q]:.1f}':>10}"
+                for q in ("p50", "p95", "p99")
+            )
+            + f"{row['upload_bytes_per_frame'] / 1024:>13.1f}"
+            f"{row['wire_bytes_per_frame'] / 1024:>10.1f}{row['process_cpu']:>7.2f}"
+            f"{row['rss_peak_mb']:>10.0f}{row['errors'] + row['dropped']:>9}"
+        )
+    print("=" * 92)
+    print(f"{'Modo':<12}{'Etapa':<12}{'media (ms)':>12}{'p50 (ms)':>10}{'p95 (ms)':>10}")
+    for row in results:
+        for stage in row["stages"]:
+            print(
+                f"{row['mode']:<12}{stage['stage']:<12}{stage['mean_ms']:>12.1f}"
+                f"{stage['p50_ms']:>10.1f}{stage['p95_ms']:>10.1f}"
+            )
+    print("=" * 92)
+    print(f"Data saved to {json_path}")
+    return report
@@ -0,0 +1,166 @@
+"""This module contains a report of the quantized model variants (fp16/int8 exports
+calibrated on the frames of ``data/local``), comparing latency, memory and detection
+agreement with the fp32 PyTorch model on the same frames.
+"""
+
+import csv
+import gc
+import os
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+import psutil
+
+from tests.split_benchmark import list_images
+from utils.model_export import PRECISIONS, available_backends, load_model
+
+
+def box_iou(box_a: Sequence[float], box_b: Sequence[float]) -> float:
+    """IoU of two ``[x1, y1, x2, y2]`` boxes."""
+    x1, y1 = max(box_a[0], box_b[0]), max(box_a[1], box_b[1])
+    x2, y2 = min(box_a[2], box_b[2]), min(box_a[3], box_b[3])
+    intersection = max(x2 - x1, 0) * max(y2 - y1, 0)
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    union = area_a + area_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def detection_agreement(
+    reference: List[Tuple[int, List[float]]],
+    detections: List[Tuple[int, List[float]]],
+    iou_threshold: float = 0.5,
+) -> float:
+    """Fraction of detections matched (same class, IoU >= ``iou_threshold``) between
+    the reference and the variant, over the larger of both counts."""
+    if not reference and not detections:
+        return 1.0
+    unmatched = list(detections)
+    matched = 0
+    for label, box in reference:
+        candidates = [
+            (box_iou(box, other), index)
+            for index, (other_label, other) in enumerate(unmatched)
+            if other_label == label
+        ]
+        best = max(candidates, default=(0.0, -1))
+        if best[0] >= iou_threshold:
+            matched += 1
+            unmatched.pop(best[1])
+    return matched / max(len(reference), len(detections))
+
+
+def _predict(model, frames: List[np.ndarray], imgsz: int) -> Tuple[list, List[float]]:
+    """Detections ``(class, box)`` and latency in ms of every frame."""
+    detections, times = [], []
+    for frame in frames:
+        start_time = time.perf_counter()
+        boxes = model(frame, imgsz=imgsz, verbose=False)[0].boxes
+        times.append((time.perf_counter() - start_time) * 1000)
+        detections.append(list(zip(boxes.cls.int().tolist(), boxes.xyxy.tolist())))
+    return detections, times
+
+
+def run_quantization_report(
+    size: str = "n",
+    image_folder: str = "./data/local/",
+    output_csv: str = "./data/tests/",
+    imgsz: int = 640,
+    max_images: int = 50,
+) -> List[Dict[str, float]]:
+    """Exports every available quantized variant of ``yolo11{size}``, runs the frames
+    of ``image_folder`` through each one and stores one CSV row per variant.
+
+    Args:
+        size (str): Model size.
+        image_folder (str): Frames used to evaluate (and to calibrate int8).
+        output_csv (str): Folder where the CSV file will be saved.
+        imgsz (int): Input resolution of the exports.
+        max_images (int): Maximum number of frames evaluated.
+
+    Returns:
+        List[Dict[str, float]]: One summary row per variant.
+    """
+    os.makedirs(output_csv, exist_ok=True)
+    frames = [cv2.imread(path) for path in list_images(image_folder)[:max_images]]
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        print(f"[ERROR] No hay imágenes en {image_folder}")
+        return []
+
+    weights = f"models/yolo11{size}.pt"
+    variants = [
+        (backend, precision)
+        for backend in available_backends()
+        for precision in PRECISIONS[backend]
+    ]
+    process = psutil.Process(os.getpid())
+    reference = None
+    rows = []
+    for backend, precision in variants:
+        gc.collect()
+        rss_before = process.memory_info().rss
+        try:
+            model = load_model(weights, backend, imgsz, precision)
+            model(frames[0], imgsz=imgsz, verbose=False)  # Warm-up
+            detections, times = _predict(model, frames, imgsz)
+        except Exception as e:  # A variant that fails to export must not stop the report
+            print(f"[ERROR] Variante {backend} {precision} no disponible: {e}")
+            continue
+        rss_delta = (process.memory_info().rss - rss_before) / 2**20
+        if reference is None:  # PyTorch fp32 comes first
+            reference = detections
+        agreement = [
+            detection_agreement(ref, dets) for ref, dets in zip(reference, detections)
+        ]
+        rows.append(
+            {
+                "backend": backend,
+                "precision": precision,
+                "p50_ms": float(np.percentile(times, 50)),
+                "p95_ms": float(np.percentile(times, 95)),
+                "rss_delta_mb": rss_delta,
+                "agreement": float(np.mean(agreement)),
+                "objects_detected": float(np.mean([len(d) for d in detections])),
+                "frames": len(frames),
+            }
+        )
+        del model
+
+    csv_path = os.path.join(
+        output_csv, f"quantization_report_{int(time.time() * 1000)}.csv"
+    )
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(
+            csv_file,
+            fieldnames=[
+                "backend",
+                "precision",
+                "p50_ms",
+                "p95_ms",
+                "rss_delta_mb",
+                "agreement",
+                "objects_detected",
+                "frames",
+            ],
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print("\n" + "=" * 70)
+    print(
+        f"{'Backend':<10}{'Precisión':<11}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+        f"{'RSS (MB)':>10}{'Acuerdo (%)':>13}{'Objetos':>9}"
+    )
+    print("=" * 70)
+    for row in rows:
+        print(
+            f"{row['backend']:<10}{row['precision']:<11}{row['p50_ms']:>10.1f}"
+            f"{row['p95_ms']:>10.1f}{row['rss_delta_mb']:>10.1f}"
+            f"{row['agreement'] * 100:>13.1f}{row['objects_detected']:>9.1f}"
+        )
+    print("=" * 70)
+    print(f"Data saved to {csv_path}")
+    return rows
@@ -64,7 +64,7 @@ def run_detection_tests(
 
         try:
             start_processing_time = time.time()
-            avg_cpu_usage, avg_memory_usage, results_data = measure_resources_during_prediction(
+            avg_cpu_usage, avg_memory_usage, results_data, _ = measure_resources_during_prediction(
                 lambda: upload_image(image_path=image_path, server_ip=server_ip, image_extension=image_ext)
             )
             processing_time = time.time() - start_processing_time
@@ -114,7 +114,7 @@ def run_detection_tests(
 
         # Measure resource usage during image prediction
         start_processing_time = time.time()
-        avg_cpu_usage, avg_memory_usage, results_data = (
+        avg_cpu_usage, avg_memory_usage, results_data, _ = (
             measure_resources_during_prediction(
                 lambda image_path=image_path: upload_image(
                     image_path=image_path, server_ip=server_ip
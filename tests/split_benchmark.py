@@ -0,0 +1,120 @@
+"""This module contains a benchmark of split inference across several split points,
+reporting client CPU time, bytes sent and end-to-end latency for each one.
+"""
+
+import csv
+import os
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+from utils.split_inference import load_split_model, upload_features
+
+
+def list_images(image_folder: str) -> List[str]:
+    """Returns the captured images in the folder (excluding result images)."""
+    return sorted(
+        os.path.join(image_folder, f)
+        for f in os.listdir(image_folder)
+        if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+        and "result" not in f.lower()
+    )
+
+
+def run_split_benchmark(
+    server_ip: str = None,
+    image_folder: str = "./data/local/",
+    output_csv: str = "./data/tests/",
+    split_layers: Sequence[int] = (2, 4, 6, 10, 13, 16, 22),
+    quantizations: Sequence[Optional[str]] = (None, "fp16", "int8"),
+    imgsz: int = 640,
+    max_images: int = 20,
+) -> None:
+    """Runs every image of ``image_folder`` through each split point and quantization
+    and stores one CSV row per request.
+
+    Args:
+        server_ip (str): IP address of the detection server.
+        image_folder (str): Folder with the images to replay.
+        output_csv (str): Folder where the CSV file will be saved.
+        split_layers (Sequence[int]): Split points to evaluate.
+        quantizations (Sequence[str]): Feature quantizations to evaluate.
+        imgsz (int): Input resolution of the model.
+        max_images (int): Maximum number of images per configuration.
+    """
+    os.makedirs(output_csv, exist_ok=True)
+    images = list_images(image_folder)[:max_images]
+    if not images:
+        print(f"[ERROR] No hay imágenes en {image_folder}")
+        return
+
+    model = load_split_model("n")
+    csv_path = os.path.join(output_csv, f"split_benchmark_{int(time.time() * 1000)}.csv")
+    fieldnames = [
+        "split_layer",
+        "quantization",
+        "image_path",
+        "client_cpu_ms",
+        "bytes_sent",
+        "latency_ms",
+        "server_inference_ms",
+        "objects_detected",
+    ]
+    summary = []
+
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+        for split_layer in split_layers:
+            for quantization in quantizations:
+                rows = []
+                for image_path in images:
+                    try:
+                        result_data = upload_features(
+                            image_path,
+                            model,
+                            split_layer,
+                            server_ip=server_ip,
+                            imgsz=imgsz,
+                            quantization=quantization,
+                        )
+                    except (IOError, RuntimeError, ValueError) as e:
+                        print(f"[ERROR] Split {split_layer} ({quantization}): {e}")
+                        continue
+                    row = {
+                        "split_layer": split_layer,
+                        "quantization": quantization or "fp32",
+                        "image_path": image_path,
+                        "client_cpu_ms": result_data["client_time"] * 1000,
+                        "bytes_sent": result_data["bytes_sent"],
+                        "latency_ms": result_data["latency"] * 1000,
+                        "server_inference_ms": result_data["speed"]["inference"],
+                        "objects_detected": len(result_data["objects_detected"]),
+                    }
+                    writer.writerow(row)
+                    rows.append(row)
+                if rows:
+                    summary.append(
+                        (
+                            split_layer,
+                            quantization or "fp32",
+                            np.mean([r["client_cpu_ms"] for r in rows]),
+                            np.mean([r["bytes_sent"] for r in rows]) / 1024,
+                            np.percentile([r["latency_ms"] for r in rows], 50),
+                            np.percentile([r["latency_ms"] for r in rows], 95),
+                        )
+                    )
+
+    print("\n" + "=" * 72)
+    print(
+        f"{'Split':<7}{'Quant':<8}{'CPU cliente (ms)':>18}{'Enviado (KB)':>14}"
+        f"{'p50 (ms)':>12}{'p95 (ms)':>12}"
+    )
+    print("=" * 72)
+    for split_layer, quantization, cpu_ms, sent_kb, p50, p95 in summary:
+        print(
+            f"{split_layer:<7}{quantization:<8}{cpu_ms:>18.1f}{sent_kb:>14.1f}"
+            f"{p50:>12.1f}{p95:>12.1f}"
+        )
+    print("=" * 72)
+    print(f"Data saved to {csv_path}")
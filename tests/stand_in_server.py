@@ -0,0 +1,122 @@
+"""This module contains a stand-in for the detection server that answers with the same
+response formats but without running a model, injecting a configurable delay.
+
+It is used to exercise the network probe, the offload scheduler and the upload paths
+against localhost with controlled latency:
+
+    python -m tests.stand_in_server --delay 0.05 --jitter 0.02 --bandwidth 500000
+"""
+
+import argparse
+import http.server
+import json
+import random
+import socketserver
+import threading
+import time
+from typing import Any, Dict
+
+from utils.network_probe import PING_PATH
+
+BOUNDARY = "----Boundary1234567890"
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Answers ``GET /ping`` and the POST requests of the clients with an empty list of
+    detections after the configured delay."""
+
+    delay = 0.0
+    jitter = 0.0
+    bandwidth = None
+
+    def _wait(self, num_bytes: int = 0) -> None:
+        """Simulates the network delay (and the transfer time at ``bandwidth``)."""
+        seconds = self.delay + random.uniform(0, self.jitter)
+        if self.bandwidth:
+            seconds += num_bytes / self.bandwidth
+        time.sleep(seconds)
+
+    def do_GET(self):
+        """Answers the network probe."""
+        self._wait()
+        if self.path != PING_PATH:
+            self.send_error(404)
+            return
+        self._send(200, "application/json", json.dumps({"status": "ok"}).encode())
+
+    def do_POST(self):
+        """Answers an inference request with an empty list of detections."""
+        post_data = self.rfile.read(int(self.headers["Content-Length"]))
+        start_time = time.perf_counter()
+        self._wait(len(post_data))
+        file_name = self.headers.get("X-File-Name", "uploaded_file.png")
+        results_data: Dict[str, Any] = {
+            "path": file_name,
+            "speed": {"preprocess": 0.0, "inference": 0.0, "postprocess": 0.0},
+            "objects_detected": [],
+        }
+        processing_time = {"X-Processing-Time": f"{time.perf_counter() - start_time:.6f}"}
+
+        # JSON and feature requests get a JSON answer, file uploads a multipart one
+        content_type = self.headers.get("Content-type", "")
+        if content_type == "application/json" or content_type.startswith("application/x-"):
+            body = {"bounding_boxes": [], "results_data": results_data}
+            if content_type == "application/json" and "images" in json.loads(post_data):
+                body = {"results": [body] * len(json.loads(post_data)["images"])}
+            self._send(200, "application/json", json.dumps(body).encode(), processing_time)
+            return
+
+        body = (
+            f"--{BOUNDARY}\r\nContent-Type: application/json\r\n\r\n".encode()
+            + json.dumps(results_data).encode()
+            + f"\r\n--{BOUNDARY}\r\nContent-Type: application/octet-stream\r\n\r\n".encode()
+            + post_data
+            + f"\r\n--{BOUNDARY}--\r\n".encode()
+        )
+        self._send(200, f"multipart/mixed; boundary={BOUNDARY}", body, processing_time)
+
+    def _send(self, status: int, content_type: str, body: bytes, headers=None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silences the per-request log lines."""
+
+
+def start_stand_in_server(
+    port: int = 8000, delay: float = 0.0, jitter: float = 0.0, bandwidth: float = None
+) -> socketserver.ThreadingTCPServer:
+    """Starts the stand-in server on a background thread and returns it
+    (``server.shutdown()`` stops it)."""
+    handler = type(
+        "ConfiguredStandInHandler",
+        (StandInHandler,),
+        {"delay": delay, "jitter": jitter, "bandwidth": bandwidth},
+    )
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(("", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Servidor sustituto en el puerto {port} (retardo {delay * 1000:.0f} ms)")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor sustituto con retardo.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--delay", type=float, default=0.0, help="Retardo en segundos")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Jitter en segundos")
+    parser.add_argument(
+        "--bandwidth", type=float, default=None, help="Ancho de banda en bytes/s"
+    )
+    args = parser.parse_args()
+    stand_in = start_stand_in_server(args.port, args.delay, args.jitter, args.bandwidth)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stand_in.shutdown()
@@ -0,0 +1,118 @@
+"""This module contains a benchmark of the startup cost of each inference mode: the
+time and memory needed to import the modules of the mode in a fresh interpreter, and
+whether ultralytics/torch were imported.
+"""
+
+import csv
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+# Mode -> module imported by main.py for that mode
+MODE_MODULES = {
+    "cli": "main",
+    "local": "local.detection",
+    "server": "server.detection",
+    "joint": "joint.joint_detection",
+    "delegation": "detection_v2.server_detection",
+}
+
+_PROBE = """
+import json, resource, sys, time
+start_time = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start_time
+print(json.dumps({{
+    "import_s": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "torch": "torch" in sys.modules,
+    "ultralytics": "ultralytics" in sys.modules,
+}}))
+"""
+
+
+def measure_startup(module: str) -> Dict[str, float]:
+    """Imports ``module`` in a new interpreter and returns its import time, peak RSS
+    and whether the heavy dependencies were loaded."""
+    start_time = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.getcwd(),
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - start_time
+    return result
+
+
+def run_startup_benchmark(
+    output_csv: str = "./data/tests/", runs: int = 3
+) -> List[Dict[str, float]]:
+    """Measures the startup of every mode ``runs`` times and stores the medians.
+
+    Args:
+        output_csv (str): Folder where the CSV file will be saved.
+        runs (int): Fresh interpreters started per mode.
+
+    Returns:
+        List[Dict[str, float]]: One summary row per mode.
+    """
+    os.makedirs(output_csv, exist_ok=True)
+    rows = []
+    for mode, module in MODE_MODULES.items():
+        try:
+            samples = [measure_startup(module) for _ in range(runs)]
+        except subprocess.CalledProcessError as e:
+            print(f"[ERROR] No se pudo importar el modo {mode}: {e.stderr.strip()}")
+            continue
+        rows.append(
+            {
+                "mode": mode,
+                "module": module,
+                "import_s": float(np.median([s["import_s"] for s in samples])),
+                "process_s": float(np.median([s["process_s"] for s in samples])),
+                "max_rss_mb": float(np.median([s["max_rss_mb"] for s in samples])),
+                "torch": samples[0]["torch"],
+                "ultralytics": samples[0]["ultralytics"],
+            }
+        )
+
+    csv_path = os.path.join(output_csv, f"startup_benchmark_{int(time.time() * 1000)}.csv")
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(
+            csv_file,
+            fieldnames=[
+                "mode",
+                "module",
+                "import_s",
+                "process_s",
+                "max_rss_mb",
+                "torch",
+                "ultralytics",
+            ],
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print("\n" + "=" * 67)
+    print(
+        f"{'Modo':<12}{'Import (s)':>12}{'Proceso (s)':>13}{'RSS (MB)':>10}"
+        f"{'torch':>7}{'ultralytics':>13}"
+    )
+    print("=" * 67)
+    for row in rows:
+        print(
+            f"{row['mode']:<12}{row['import_s']:>12.2f}{row['process_s']:>13.2f}"
+            f"{row['max_rss_mb']:>10.0f}{'sí' if row['torch'] else 'no':>7}"
+            f"{'sí' if row['ultralytics'] else 'no':>13}"
+        )
+    print("=" * 67)
+    print(f"Data saved to {csv_path}")
+    return rows
@@ -0,0 +1,75 @@
+"""Tests of the metrics sink (``utils.metrics``).
+
+The Parquet and Arrow tests need pyarrow and pandas and are skipped without them.
+"""
+
+import contextlib
+import json
+import sqlite3
+
+import pytest
+
+from utils.metrics import MetricsSink
+
+SCHEMA = {
+    "frame_index": int,
+    "latency": float,
+    "detection_place": str,
+    "objects_detected": list,
+}
+
+# The first row leaves the typed and the nested columns empty
+ROWS = [
+    {"frame_index": 0, "latency": None, "detection_place": "local", "objects_detected": None},
+    {
+        "frame_index": 1,
+        "latency": 12.5,
+        "detection_place": "server",
+        "objects_detected": [("person", 0.9), ("car", 0.5)],
+    },
+]
+
+
+def write_rows(path: str) -> None:
+    with MetricsSink(path, SCHEMA, batch_size=1) as sink:
+        for row in ROWS:
+            sink.write(row)
+
+
+def test_sqlite_types_come_from_the_schema(tmp_path):
+    path = str(tmp_path / "run.sqlite")
+    write_rows(path)
+    with contextlib.closing(sqlite3.connect(path)) as connection:
+        declared = {
+            name: column_type
+            for _, name, column_type, *_ in connection.execute("PRAGMA table_info(metrics)")
+        }
+        rows = connection.execute("SELECT * FROM metrics").fetchall()
+    assert declared == {
+        "frame_index": "INTEGER",
+        "latency": "REAL",
+        "detection_place": "TEXT",
+        "objects_detected": "JSON",
+    }
+    assert rows[0] == (0, None, "local", None)
+    assert json.loads(rows[1][3]) == [["person", 0.9], ["car", 0.5]]
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".arrow"])
+def test_arrow_formats_keep_the_schema(tmp_path, extension):
+    pytest.importorskip("pyarrow")
+    pytest.importorskip("pandas")
+    from utils.metrics import load_metrics, metrics_files
+
+    path = str(tmp_path / f"run{extension}")
+    write_rows(path)
+    # An empty first batch must not change the types (and rotate the file)
+    assert metrics_files(path) == [path]
+    frame = load_metrics(path)
+    assert list(frame.columns) == list(SCHEMA)
+    assert frame["latency"].tolist()[1] == 12.5
+    assert str(frame["frame_index"].dtype) == "int64"
+    detections = frame["objects_detected"][1]
+    assert [(item["label"], item["confidence"]) for item in detections] == ROWS[1][
+        "objects_detected"
+    ]
@@ -0,0 +1,126 @@
+"""This module contains a benchmark of thread layouts for local inference: number of
+intra-op threads of the model and CPUs of the capture, inference and I/O threads,
+reporting throughput and latency for each one.
+"""
+
+import csv
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Set
+
+import psutil
+
+from utils.cpu_affinity import parse_cpus
+from utils.model_registry import get_model
+from utils.pipeline import FolderSource, Pipeline, SaveImage
+from utils.stages import LocalInference
+
+
+def default_layouts(cpu_count: int = None) -> List[Dict[str, Optional[str]]]:
+    """Layouts to compare on a machine with ``cpu_count`` cores: all the cores for
+    the model, and one or two cores reserved for capture and I/O."""
+    cpu_count = cpu_count or os.cpu_count()
+    last = cpu_count - 1
+    layouts = [{"threads": cpu_count, "capture": None, "inference": None, "io": None}]
+    if cpu_count >= 2:
+        layouts += [
+            {"threads": cpu_count - 1, "capture": None, "inference": None, "io": None},
+            {"threads": cpu_count - 1, "capture": "0", "inference": f"1-{last}", "io": "0"},
+        ]
+    if cpu_count >= 4:
+        layouts.append(
+            {"threads": cpu_count - 2, "capture": "0", "inference": f"2-{last}", "io": "1"}
+        )
+    return layouts
+
+
+def run_thread_layout_benchmark(
+    image_folder: str = "./data/local/",
+    output_csv: str = "./data/tests/",
+    layouts: Sequence[Dict[str, Optional[str]]] = None,
+    rpi: bool = True,
+    backend: str = None,
+    frames: int = 50,
+) -> List[Dict[str, float]]:
+    """Replays the images of ``image_folder`` through the local pipeline once per
+    layout and stores one CSV row per layout.
+
+    Args:
+        image_folder (str): Folder with the images to replay.
+        output_csv (str): Folder where the CSV file will be saved.
+        layouts (Sequence[dict]): Layouts with ``threads`` and the CPU lists
+            (``"0"``, ``"1-3"``) of ``capture``, ``inference`` and ``io``.
+        rpi (bool): Load the model used on the Raspberry Pi.
+        backend (str): Inference backend (see ``utils.detection.init_model``).
+        frames (int): Frames replayed per layout.
+
+    Returns:
+        List[Dict[str, float]]: One summary row per layout.
+    """
+    os.makedirs(output_csv, exist_ok=True)
+    source = FolderSource(image_folder)
+    if not source.image_paths:
+        print(f"[ERROR] No hay imágenes en {image_folder}")
+        return []
+    loops = -(-frames // len(source.image_paths))
+    model = get_model("n", rpi=rpi, backend=backend)
+    output_folder = os.path.join(output_csv, "thread_layout_frames")
+    process = psutil.Process(os.getpid())
+
+    rows = []
+    for layout in layouts or default_layouts():
+        affinity: Dict[str, Set[int]] = {
+            role: parse_cpus(layout.get(role)) for role in ("capture", "inference", "io")
+        }
+        stages = [
+            SaveImage(output_folder),
+            LocalInference(model, threads=layout.get("threads")),
+        ]
+        pipeline = Pipeline(
+            FolderSource(image_folder, limit=frames, loops=loops),
+            stages,
+            drop_when_full=False,
+            affinity=affinity,
+        )
+        cpu_before = process.cpu_times()
+        stats = {row["stage"]: row for row in pipeline.run()}
+        cpu_after = process.cpu_times()
+        cpu_time = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+        rows.append(
+            {
+                "threads": layout.get("threads") or "-",
+                "capture": layout.get("capture") or "-",
+                "inference": layout.get("inference") or "-",
+                "io": layout.get("io") or "-",
+                "fps": pipeline.frames_out / pipeline.elapsed_time,
+                "inference_p50_ms": stats["local"]["p50_ms"],
+                "inference_p95_ms": stats["local"]["p95_ms"],
+                "capture_p95_ms": stats["folder"]["p95_ms"],
+                "cpu_percent": cpu_time / pipeline.elapsed_time * 100,
+            }
+        )
+
+    csv_path = os.path.join(
+        output_csv, f"thread_layout_benchmark_{int(time.time() * 1000)}.csv"
+    )
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print("\n" + "=" * 78)
+    print(
+        f"{'Hilos':<7}{'Captura':<9}{'Inferencia':<12}{'E/S':<6}{'FPS':>7}"
+        f"{'p50 (ms)':>10}{'p95 (ms)':>10}{'Captura p95':>13}{'CPU (%)':>9}"
+    )
+    print("=" * 78)
+    for row in rows:
+        print(
+            f"{row['threads']:<7}{row['capture']:<9}{row['inference']:<12}{row['io']:<6}"
+            f"{row['fps']:>7.2f}{row['inference_p50_ms']:>10.1f}"
+            f"{row['inference_p95_ms']:>10.1f}{row['capture_p95_ms']:>13.1f}"
+            f"{row['cpu_percent']:>9.0f}"
+        )
+    print("=" * 78)
+    print(f"Data saved to {csv_path}")
+    return rows
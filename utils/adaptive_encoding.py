@@ -0,0 +1,137 @@
+"""
+This module contains an image encoder that adapts the compression quality and the
+resolution of the uploads to the measured upload bandwidth.
+"""
+
+import collections
+import threading
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.detection import encode_image
+
+# Initial bytes-per-pixel guesses for JPEG/WebP, refined with every encoded frame
+DEFAULT_BYTES_PER_PIXEL = {95: 0.45, 90: 0.3, 80: 0.2, 70: 0.15, 60: 0.12, 50: 0.1}
+
+
+class AdaptiveEncoder:
+    """Chooses the JPEG/WebP quality and the downscale factor of each frame so that
+    the upload takes about ``target_upload_time`` seconds.
+
+    The upload bandwidth is estimated from the last ``window`` transfers recorded
+    with ``record_transfer``. The quality never goes below ``min_quality``; once the
+    floor is reached the frame is downscaled instead, up to ``min_scale``.
+
+    Args:
+        target_upload_time (float): Target upload time per frame in seconds.
+        encoding (str): Compression format, ``"jpg"`` or ``"webp"``.
+        min_quality (int): Minimum allowed compression quality.
+        max_quality (int): Quality used when the link has enough bandwidth.
+        min_scale (float): Smallest downscale factor applied to the frame.
+        window (int): Number of recent transfers used to estimate the bandwidth.
+    """
+
+    def __init__(
+        self,
+        target_upload_time: float = 0.25,
+        encoding: str = "jpg",
+        min_quality: int = 50,
+        max_quality: int = 90,
+        min_scale: float = 0.5,
+        window: int = 10,
+    ) -> None:
+        if encoding not in ("jpg", "webp"):
+            raise ValueError(f"Formato no soportado para codificación adaptativa: {encoding}")
+        if not 0 < min_quality <= max_quality <= 100:
+            raise ValueError("Se requiere 0 < min_quality <= max_quality <= 100")
+
+        self.target_upload_time = target_upload_time
+        self.encoding = encoding
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.min_scale = min_scale
+
+        self._transfers: Deque[Tuple[int, float]] = collections.deque(maxlen=window)
+        self._bytes_per_pixel: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def record_transfer(self, num_bytes: int, seconds: float) -> None:
+        """Records the size and the duration of a finished upload."""
+        if num_bytes > 0 and seconds > 0:
+            with self._lock:
+                self._transfers.append((num_bytes, seconds))
+
+    @property
+    def bandwidth(self) -> Optional[float]:
+        """Estimated upload bandwidth in bytes per second, None without samples."""
+        with self._lock:
+            if not self._transfers:
+                return None
+            total_bytes = sum(size for size, _ in self._transfers)
+            total_time = sum(seconds for _, seconds in self._transfers)
+        return total_bytes / total_time
+
+    def _estimated_bytes_per_pixel(self, quality: int) -> float:
+        """Returns the learned (or default) bytes per pixel for a quality level."""
+        if quality in self._bytes_per_pixel:
+            return self._bytes_per_pixel[quality]
+        closest = min(DEFAULT_BYTES_PER_PIXEL, key=lambda q: abs(q - quality))
+        return DEFAULT_BYTES_PER_PIXEL[closest]
+
+    def choose(self, image_shape: Tuple[int, ...]) -> Tuple[int, float]:
+        """Chooses the quality and downscale factor for a frame of the given shape.
+
+        Args:
+            image_shape (tuple): Shape (height, width, ...) of the frame.
+
+        Returns:
+            Tuple[int, float]: Compression quality and downscale factor.
+        """
+        bandwidth = self.bandwidth
+        if bandwidth is None:
+            return self.max_quality, 1.0
+
+        budget = bandwidth * self.target_upload_time
+        pixels = image_shape[0] * image_shape[1]
+        with self._lock:
+            qualities = list(range(self.max_quality, self.min_quality - 1, -10))
+            if qualities[-1] != self.min_quality:  # Off the 10-step ladder
+                qualities.append(self.min_quality)
+            for quality in qualities:
+                if self._estimated_bytes_per_pixel(quality) * pixels <= budget:
+                    return quality, 1.0
+            # Quality floor reached: downscale until the frame fits in the budget
+            floor_bytes = self._estimated_bytes_per_pixel(self.min_quality) * pixels
+        scale = max(self.min_scale, min(1.0, float(np.sqrt(budget / floor_bytes))))
+        return self.min_quality, round(scale, 2)
+
+    def encode(self, image: np.ndarray) -> Tuple[bytes, Dict[str, Any]]:
+        """Encodes the frame with the settings chosen for the current bandwidth.
+
+        Args:
+            image (np.ndarray): Frame to encode (BGR).
+
+        Returns:
+            Tuple[bytes, dict]: Encoded image and the applied settings
+            (encoding, quality, scale and size in bytes).
+        """
+        quality, scale = self.choose(image.shape)
+        if scale < 1.0:
+            image = cv2.resize(
+                image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            )
+        data = encode_image(image, self.encoding, quality)
+
+        bytes_per_pixel = len(data) / (image.shape[0] * image.shape[1])
+        with self._lock:
+            previous = self._bytes_per_pixel.get(quality, bytes_per_pixel)
+            self._bytes_per_pixel[quality] = 0.7 * previous + 0.3 * bytes_per_pixel
+
+        return data, {
+            "encoding": self.encoding,
+            "quality": quality,
+            "scale": scale,
+            "upload_size": len(data),
+        }
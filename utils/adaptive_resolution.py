@@ -0,0 +1,113 @@
+"""
+This module contains a controller of the local inference resolution. When the measured
+latency or the CPU usage of the Raspberry Pi goes over its target, the input size of
+the model is lowered one level (e.g. 640 -> 480 -> 320); when there is headroom again
+it is raised back.
+
+Both directions need several consecutive frames over (or under) the thresholds, and
+raising the size requires the predicted latency at the next level to stay under a
+fraction of the target, so the resolution does not oscillate between two levels.
+"""
+
+from typing import Optional, Sequence
+
+from utils.computer_resources import get_system_usage
+
+
+class ResolutionController:
+    """Chooses the inference size of each frame from the recent latency and CPU usage.
+
+    Args:
+        levels (Sequence[int]): Input sizes from the largest to the smallest
+            (multiples of the model stride, 32).
+        latency_target (float, optional): Target inference latency in seconds.
+        cpu_target (float, optional): Target system CPU usage (0-1), read with
+            ``get_system_usage``.
+        headroom (float): The size is raised only if the predicted latency and the
+            CPU usage stay under ``headroom`` times their targets.
+        down_after (int): Consecutive frames over a target before lowering the size.
+        up_after (int): Consecutive frames with headroom before raising the size.
+        alpha (float): Smoothing factor of the latency and CPU moving averages.
+    """
+
+    def __init__(
+        self,
+        levels: Sequence[int] = (640, 480, 320),
+        latency_target: Optional[float] = None,
+        cpu_target: Optional[float] = 0.85,
+        headroom: float = 0.7,
+        down_after: int = 3,
+        up_after: int = 10,
+        alpha: float = 0.3,
+    ) -> None:
+        if latency_target is None and cpu_target is None:
+            raise ValueError("Se necesita una latencia o un uso de CPU objetivo")
+        self.levels = sorted(levels, reverse=True)
+        self.latency_target = latency_target
+        self.cpu_target = cpu_target
+        self.headroom = headroom
+        self.down_after = down_after
+        self.up_after = up_after
+        self.alpha = alpha
+
+        self.level = 0
+        self.latency: Optional[float] = None
+        self.cpu: Optional[float] = None
+        self._over = 0
+        self._under = 0
+        get_system_usage(interval=None)  # First call only starts the CPU counters
+
+    @property
+    def imgsz(self) -> int:
+        """Input size to use for the next frame."""
+        return self.levels[self.level]
+
+    def _smooth(self, average: Optional[float], value: float) -> float:
+        if average is None:
+            return value
+        return self.alpha * value + (1 - self.alpha) * average
+
+    def _over_target(self) -> bool:
+        return (
+            self.latency_target is not None and self.latency > self.latency_target
+        ) or (self.cpu_target is not None and self.cpu > self.cpu_target)
+
+    def _has_headroom(self) -> bool:
+        if self.level == 0:
+            return False
+        if self.latency_target is not None:
+            # Inference cost grows with the number of pixels
+            scale = (self.levels[self.level - 1] / self.imgsz) ** 2
+            if self.latency * scale > self.headroom * self.latency_target:
+                return False
+        return self.cpu_target is None or self.cpu < self.headroom * self.cpu_target
+
+    def _change_level(self, step: int) -> None:
+        previous = self.imgsz
+        self.level += step
+        if self.latency is not None:
+            self.latency *= (self.imgsz / previous) ** 2
+        self._over = self._under = 0
+        print(f"[CLIENT] Resolución de inferencia {previous} -> {self.imgsz}")
+
+    def update(self, latency: float) -> int:
+        """Records the latency (seconds) of the last frame and returns the size of the
+        next one."""
+        self.latency = self._smooth(self.latency, latency)
+        if self.cpu_target is not None:
+            cpu_usage, _ = get_system_usage(interval=None)
+            self.cpu = self._smooth(self.cpu, cpu_usage)
+
+        if self._over_target():
+            self._over += 1
+            self._under = 0
+            if self._over >= self.down_after and self.level < len(self.levels) - 1:
+                self._change_level(1)
+        elif self._has_headroom():
+            self._under += 1
+            self._over = 0
+            if self._under >= self.up_after:
+                self._change_level(-1)
+        else:
+            self._over = self._under = 0
+        return self.imgsz
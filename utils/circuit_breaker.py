@@ -0,0 +1,120 @@
+"""
+This module contains a circuit breaker for remote inference. After several failed or
+slow server requests in a row the circuit opens and frames go straight to the local
+model; after ``reset_timeout`` seconds a few half-open probe requests test the
+server again and close the circuit when it answers.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker with local fallback.
+
+    Args:
+        failure_threshold (int): Consecutive failures (errors or slow responses)
+            that open the circuit.
+        slow_threshold (float, optional): Responses slower than this many seconds
+            count as failures.
+        reset_timeout (float): Seconds the circuit stays open before probing.
+        half_open_probes (int): Successful probes required to close the circuit.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        slow_threshold: Optional[float] = None,
+        reset_timeout: float = 10.0,
+        half_open_probes: int = 1,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.slow_threshold = slow_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            print(f"[CLIENT] Circuito {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+        self.failures = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def allow_request(self) -> bool:
+        """True if the next frame may be sent to the server."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def record_success(self, latency: float = 0.0) -> None:
+        """Records a server answer; slow answers count as failures."""
+        if self.slow_threshold is not None and latency > self.slow_threshold:
+            self.record_failure()
+            return
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(CLOSED)
+            else:
+                self.failures = 0
+
+    def record_failure(self) -> None:
+        """Records a failed (or slow) server request."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(OPEN)
+                return
+            self.failures += 1
+            if self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._transition(OPEN)
+
+    def call(
+        self,
+        remote_function: Callable[..., Any],
+        fallback_function: Callable[..., Any],
+        *args,
+        **kwargs,
+    ) -> Tuple[Any, str]:
+        """Runs ``remote_function`` if the circuit allows it and ``fallback_function``
+        otherwise or when the remote call fails.
+
+        Returns:
+            Tuple[Any, str]: Result and ``"server"`` or ``"local"``.
+        """
+        if self.allow_request():
+            start_time = time.perf_counter()
+            try:
+                result = remote_function(*args, **kwargs)
+            except Exception as e:  # Any server error sends the frame to local
+                print(f"[CLIENT ERROR] Falla del servidor, inferencia local: {e}")
+                self.record_failure()
+            else:
+                self.record_success(time.perf_counter() - start_time)
+                return result, "server"
+        return fallback_function(*args, **kwargs), "local"
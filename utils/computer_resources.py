@@ -2,52 +2,44 @@
 This module has functions to read the usage of resources and perform ping operations.
 """
 
-import re
-import os
-import csv
-import subprocess
-import threading
-from typing import List, Optional, Tuple
+from typing import Any, Optional, Tuple
 
 import psutil
 
+from utils.metrics import get_metrics_sink
+from utils.network_probe import get_probe
+from utils.resource_sampler import get_sampler
+
 
 def ping(ip: str) -> Optional[float]:
     """
-    Sends a single ping request to the specified IP address and returns the
-    response time in seconds.
+    Returns the smoothed round-trip time to the detection server in milliseconds.
+
+    The RTT is measured in-process by a background ``NetworkProbe`` (TCP connect and
+    ``GET /ping`` to the server), so the call does not block nor fork ``/bin/ping``
+    and works where ICMP is blocked.
 
     Args:
-        ip (str): The IP address or hostname to ping.
+        ip (str): The IP address or hostname of the detection server.
 
     Returns:
-        Optional[float]: The round-trip time in seconds.
-        Returns None if the ping fails or if the response time cannot be obtained.
+        Optional[float]: The round-trip time in milliseconds.
+        Returns None if the server has not answered the probe.
     """
-    try:
-        result = subprocess.run(
-            ["ping", "-c", "1", ip],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True,
-        )
-        time = re.search(r"time=(\d+\.?\d*) ms", result.stdout)
-        if time:
-            response_time = float(time.group(1))  # Convert milliseconds to seconds
-            return response_time
-        else:
-            print(f"No se pudo obtener el tiempo de respuesta del ping a {ip}")
-            return None
-    except subprocess.CalledProcessError as e:
-        print(f"Error haciendo ping a {ip}: {e.stderr}")
-        return None
-
-
-def get_system_usage(interval: float = 1) -> Tuple[float, float]:
+    response_time = get_probe(ip).rtt_ms
+    if response_time is None:
+        print(f"No se pudo obtener el tiempo de respuesta del servidor {ip}")
+    return response_time
+
+
+def get_system_usage(interval: Optional[float] = 1) -> Tuple[float, float]:
     """
     Gets the current CPU and memory usage of the system.
 
+    Args:
+        interval (float, optional): Seconds to sample the CPU usage. ``None`` does
+            not block and returns the usage since the previous call.
+
     Returns:
         Tuple[float, float]: A tuple containing the CPU usage and memory usage,
         both expressed as values between 0 and 1. The first element is the CPU usage,
@@ -62,47 +54,49 @@ def get_system_usage(interval: float = 1) -> Tuple[float, float]:
 
 def measure_resources_during_prediction(
     prediction_function, *args, **kwargs
-) -> Tuple[float, float]:
+) -> Tuple[float, float, Any, float]:
     """
     Measures CPU and memory usage while performing a prediction.
 
+    The usage is read from the shared ``ResourceSampler`` of the process (marks at
+    the start and the end of the prediction), so no thread is created per call.
+
     Args:
         prediction_function (callable): The function to perform the prediction.
         *args: Positional arguments for the prediction function.
         **kwargs: Keyword arguments for the prediction function.
 
     Returns:
-        Tuple[float, float]: Average CPU and memory usage during the prediction.
+        Tuple[float, float, Any, float]: Average system CPU and memory usage (0-1)
+        during the prediction, the result of the prediction and the memory usage at
+        its end.
     """
-    cpu_usages: List[float] = []
-    memory_usages: List[float] = []
-    stop_event = threading.Event()
-    current_memory = 0
-
-    # Function to measure system usage in a separate thread
-    def measure():
-        while not stop_event.is_set():
-            cpu_usage, memory_usage = get_system_usage(interval=0.1)
-            cpu_usages.append(cpu_usage)
-            memory_usages.append(memory_usage)
-            current_memory = memory_usage
-
-    # Start measuring in a separate thread
-    resource_thread = threading.Thread(target=measure)
-    resource_thread.start()
-
-    # Perform the prediction
+    sampler = get_sampler()
+    mark = sampler.mark_start()
     results_data = prediction_function(*args, **kwargs)
-
-    # Stop measuring and wait for the thread to finish
-    stop_event.set()
-    resource_thread.join()
-
-    # Calculate the average CPU and memory usage
-    avg_cpu_usage = sum(cpu_usages) / len(cpu_usages) if cpu_usages else 0
-    avg_memory_usage = sum(memory_usages) / len(memory_usages) if memory_usages else 0
-
-    return avg_cpu_usage, avg_memory_usage, results_data, current_memory
+    usage = sampler.mark_end(mark)
+    return (
+        usage["system_cpu"],
+        usage["system_memory"],
+        results_data,
+        usage["system_memory_end"],
+    )
+
+
+# Columns and types of the metric rows (see utils.metrics)
+RESULT_FIELDS = {
+    "image_size": int,
+    "processing_time": float,
+    "cpu_usage": float,
+    "memory_usage": float,
+    "image_path": str,
+    "preprocess_time": float,
+    "inference_time": float,
+    "postprocess_time": float,
+    "original_shape": list,
+    "objects_detected": list,
+    "detection_place": str,
+}
 
 
 def store_results(
@@ -114,49 +108,34 @@ def store_results(
     results_data: dict,
     detection_place: str,
 ) -> None:
-    """Stores the collected information in a CSV file.
+    """Stores the collected information in a metrics file.
+
+    The row is buffered by the shared ``MetricsSink`` of the path and written in
+    batches; the format follows the extension of ``csv_path`` or the one set with
+    ``utils.metrics.set_metrics_format``.
 
     Args:
-        csv_path (str): Path to the output CSV file.
+        csv_path (str): Path to the output metrics file.
         image_size (int): Size of the image in bytes.
         processing_time (float): Time taken to process the image.
         cpu_usage (float): Average CPU usage during processing.
         memory_usage (float): Average memory usage during processing.
         results_data (dict): Additional results data from the image prediction.
+        detection_place (str): Where the detection was run (local, server...).
     """
-    with open(csv_path, mode="a", newline="", encoding="utf-8") as csv_file:
-        fieldnames = [
-            "image_size",
-            "processing_time",
-            "cpu_usage",
-            "memory_usage",
-            "image_path",
-            "preprocess_time",
-            "inference_time",
-            "postprocess_time",
-            "original_shape",
-            "objects_detected",
-            "detection_place",
-        ]
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-
-        if not os.path.isfile(csv_path):
-            writer.writeheader()  # Write the header if the file is new
-
-        writer.writerow(
-            {
-                "image_size": image_size,
-                "processing_time": processing_time,
-                "cpu_usage": cpu_usage,
-                "memory_usage": memory_usage,
-                "image_path": results_data.get("path", ""),
-                "preprocess_time": results_data.get("speed", {}).get("preprocess", 0.0),
-                "inference_time": results_data.get("speed", {}).get("inference", 0.0),
-                "postprocess_time": results_data.get("speed", {}).get(
-                    "postprocess", 0.0
-                ),
-                "original_shape": results_data.get("original_shape", ()),
-                "objects_detected": results_data.get("objects_detected", []),
-                "detection_place": detection_place,
-            }
-        )
+    speed = results_data.get("speed", {})
+    get_metrics_sink(csv_path, RESULT_FIELDS).write(
+        {
+            "image_size": image_size,
+            "processing_time": processing_time,
+            "cpu_usage": cpu_usage,
+            "memory_usage": memory_usage,
+            "image_path": results_data.get("path") or "",
+            "preprocess_time": speed.get("preprocess", 0.0),
+            "inference_time": speed.get("inference", 0.0),
+            "postprocess_time": speed.get("postprocess", 0.0),
+            "original_shape": list(results_data.get("original_shape", ())),
+            "objects_detected": list(results_data.get("objects_detected", [])),
+            "detection_place": detection_place,
+        }
+    )
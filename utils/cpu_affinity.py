@@ -0,0 +1,99 @@
+"""
+This module controls the threads used by the inference and the CPUs each pipeline
+thread may run on, so the model does not starve the capture loop and the resource
+sampler on the four cores of the Raspberry Pi.
+
+The intra-op thread pools of PyTorch (OpenMP), ONNX Runtime, NCNN and OpenVINO are
+created by the thread that first runs the model and inherit its CPU affinity, so
+``set_inference_threads`` should be called from the (already pinned) inference
+thread; ``LocalInference`` does it in ``Stage.start``.
+"""
+
+import glob
+import os
+from typing import TYPE_CHECKING, Iterable, Optional, Set
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+
+def parse_cpus(text: Optional[str]) -> Optional[Set[int]]:
+    """Parses a CPU list such as ``"0"``, ``"2,3"`` or ``"1-3"``."""
+    if not text:
+        return None
+    cpus = set()
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def pin_current_thread(cpus: Optional[Iterable[int]]) -> bool:
+    """Restricts the calling thread (and the threads it creates afterwards) to
+    ``cpus``. Returns False where CPU affinity is not supported."""
+    if not cpus:
+        return False
+    if not hasattr(os, "sched_setaffinity"):
+        print("[WARNING] La afinidad de CPU no está soportada en este sistema")
+        return False
+    try:
+        os.sched_setaffinity(0, set(cpus))  # 0 = calling thread on Linux
+    except OSError as e:
+        print(f"[WARNING] No se pudo fijar la afinidad {sorted(cpus)}: {e}")
+        return False
+    return True
+
+
+def current_cpus() -> Optional[Set[int]]:
+    """CPUs the calling thread may run on (None where it cannot be queried)."""
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    return os.sched_getaffinity(0)
+
+
+def set_inference_threads(model: "YOLO", threads: Optional[int]) -> None:
+    """Sets the intra-op threads of the model backend.
+
+    PyTorch uses ``torch.set_num_threads``. Exported models are loaded by ultralytics
+    on the first prediction, so the model runs once on a black frame if needed and
+    then its runtime is reconfigured: NCNN ``opt.num_threads``, a new ONNX Runtime
+    session with ``intra_op_num_threads`` and OpenVINO recompiled with
+    ``INFERENCE_NUM_THREADS``.
+    """
+    if not threads:
+        return
+    import torch  # Only the processes that run a model pay for the import
+
+    torch.set_num_threads(threads)
+    if not isinstance(model.model, str):  # PyTorch model
+        return
+
+    if model.predictor is None:
+        imgsz = model.overrides.get("imgsz", 640)
+        model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False)
+    backend = getattr(model.predictor.model, "backend", None)
+    if hasattr(backend, "net"):  # NCNN
+        backend.net.opt.num_threads = threads
+    elif hasattr(backend, "session"):  # ONNX Runtime
+        import onnxruntime
+
+        options = backend.session_options or onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        backend.session_options = options
+        backend.session = onnxruntime.InferenceSession(
+            model.ckpt_path, options, providers=backend.session.get_providers()
+        )
+    elif hasattr(backend, "ov_compiled_model"):  # OpenVINO
+        import openvino
+
+        xml_path = glob.glob(os.path.join(model.ckpt_path, "*.xml"))[0]
+        backend.ov_compiled_model = openvino.Core().compile_model(
+            xml_path,
+            "CPU",
+            {"PERFORMANCE_HINT": "LATENCY", "INFERENCE_NUM_THREADS": threads},
+        )
+    else:
+        print(f"[WARNING] No se pueden fijar los hilos del backend {type(backend).__name__}")
@@ -1,105 +1,546 @@
 """ This module contains the functions to perform the detection of objects in an image. """
 
+import base64
+import functools
 import json
 import os
-import random
-from typing import Any, Dict
+import threading
+import time
+import zlib
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import cv2
 import numpy as np
 import requests
-from ultralytics import YOLO
 
+from utils.model_export import (
+    load_model,
+    precision_backend,
+    resolve_weights,
+    select_backend,
+)
+from utils.network_probe import record_transfer
+
+if TYPE_CHECKING:  # ultralytics (and torch) is imported only when a model is loaded
+    from ultralytics import YOLO
+
+_thread_local = threading.local()
+
+# Tamaños de entrada soportados para el preprocesamiento (múltiplos del stride 32)
+PREPROCESS_SIZES = (320, 416, 640)
+LETTERBOX_COLOR = (114, 114, 114)
+
+# Paleta fija (BGR) de las cajas dibujadas; cada etiqueta tiene siempre el mismo color
+PALETTE = (
+    (56, 56, 255),
+    (151, 157, 255),
+    (31, 112, 255),
+    (29, 178, 255),
+    (49, 210, 207),
+    (10, 249, 72),
+    (23, 204, 146),
+    (134, 219, 61),
+    (52, 147, 26),
+    (187, 212, 0),
+    (168, 153, 44),
+    (255, 194, 0),
+    (147, 69, 52),
+    (255, 115, 100),
+    (236, 24, 0),
+    (255, 56, 132),
+    (133, 0, 82),
+    (255, 56, 203),
+    (200, 149, 255),
+    (199, 55, 255),
+)
+
+
+class AnnotationPolicy:
+    """Decide qué frames se guardan anotados (con las cajas dibujadas).
+
+    Dibujar y codificar la imagen anotada cuesta más que la propia extracción de las
+    detecciones, y casi siempre basta con las detecciones: los resultados guardan
+    ``bounding_boxes`` y la imagen se puede dibujar más tarde con
+    ``render_detections``.
 
-def init_model(size: str = "x", rpi: bool = False) -> YOLO:
-    """Inicializa y retorna el modelo YOLO."""
-    if size == "x":
-        print("Using yolov11x model")
-        return YOLO("models/yolo11x.pt")
-    print("Using yolov11n model")
-    model = YOLO("models/yolo11n.pt")
-    if rpi:
-        if os.path.exists("models/yolo11n_ncnn_model"):
-            return YOLO("models/yolo11n_ncnn_model")
-        model.export(format="ncnn")
-        return YOLO("models/yolo11n_ncnn_model")
-    return model
+    Args:
+        mode (str): ``"none"`` (solo detecciones), ``"all"``, ``"detections"`` (solo
+            los frames con alguna detección) o ``"sample"`` (uno de cada ``every``).
+        every (int): Periodo del muestreo del modo ``"sample"``.
+    """
+
+    MODES = ("none", "all", "detections", "sample")
+
+    def __init__(self, mode: str = "none", every: int = 10) -> None:
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de anotación no soportado: {mode} {self.MODES}")
+        self.mode = mode
+        self.every = max(every, 1)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def should_render(self, detections: int) -> bool:
+        """True si el frame actual (con ``detections`` detecciones) se dibuja."""
+        if self.mode == "sample":
+            with self._lock:
+                self._count += 1
+                return (self._count - 1) % self.every == 0
+        return self.mode == "all" or (self.mode == "detections" and detections > 0)
+
+
+_annotation_policy = AnnotationPolicy()
 
 
-def image_prediction(model: YOLO, image_path: str, image_extension: str = "png") -> Dict[str, Any]:
+def set_annotation_policy(policy: AnnotationPolicy) -> None:
+    """Fija qué frames se guardan anotados en este proceso."""
+    global _annotation_policy
+    _annotation_policy = policy
+
+
+def get_annotation_policy() -> AnnotationPolicy:
+    """Retorna la política de anotación del proceso."""
+    return _annotation_policy
+
+
+class DetectionFilter:
+    """Clases permitidas y umbrales de la detección.
+
+    Se pasan a la llamada del modelo (el NMS descarta antes las cajas que no
+    interesan) y al servidor como cabeceras de la petición, para que la respuesta
+    tampoco las incluya. Los valores por defecto son los de ultralytics.
+
+    Args:
+        classes (Sequence, optional): Nombres o índices de las clases permitidas
+            (None = todas).
+        conf (float): Confianza mínima.
+        iou (float): Umbral de IoU del NMS.
+        max_det (int): Número máximo de detecciones por imagen.
+    """
+
+    HEADERS = {
+        "classes": "X-Classes",
+        "conf": "X-Conf",
+        "iou": "X-Iou",
+        "max_det": "X-Max-Det",
+    }
+
+    def __init__(
+        self,
+        classes: Optional[Sequence[Union[str, int]]] = None,
+        conf: float = 0.25,
+        iou: float = 0.7,
+        max_det: int = 300,
+    ) -> None:
+        self.classes = list(classes) if classes else None
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+    def class_ids(self, names: Mapping[int, str]) -> Optional[List[int]]:
+        """Índices de las clases permitidas según los nombres del modelo."""
+        if self.classes is None:
+            return None
+        ids = {name.lower(): index for index, name in names.items()}
+        class_ids = []
+        for name in self.classes:
+            if isinstance(name, int) or str(name).isdigit():
+                class_ids.append(int(name))
+            elif str(name).strip().lower() in ids:
+                class_ids.append(ids[str(name).strip().lower()])
+            else:
+                raise ValueError(f"Clase desconocida: {name}")
+        return class_ids
+
+    def model_kwargs(self, names: Mapping[int, str]) -> Dict[str, Any]:
+        """Argumentos de la llamada ``model(...)`` de ultralytics."""
+        return {
+            "classes": self.class_ids(names),
+            "conf": self.conf,
+            "iou": self.iou,
+            "max_det": self.max_det,
+        }
+
+    def headers(self) -> Dict[str, str]:
+        """Cabeceras HTTP con los valores que no son los de por defecto."""
+        default = DetectionFilter()
+        headers = {}
+        if self.classes is not None:
+            headers[self.HEADERS["classes"]] = ",".join(str(c) for c in self.classes)
+        for key in ("conf", "iou", "max_det"):
+            if getattr(self, key) != getattr(default, key):
+                headers[self.HEADERS[key]] = str(getattr(self, key))
+        return headers
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> "DetectionFilter":
+        """Reconstruye el filtro enviado por el cliente (servidor)."""
+        classes = headers.get(cls.HEADERS["classes"])
+        return cls(
+            classes=classes.split(",") if classes else None,
+            conf=float(headers.get(cls.HEADERS["conf"], 0.25)),
+            iou=float(headers.get(cls.HEADERS["iou"], 0.7)),
+            max_det=int(headers.get(cls.HEADERS["max_det"], 300)),
+        )
+
+
+_detection_filter = DetectionFilter()
+
+
+class Detections:
+    """Detecciones de una imagen en formato columnar.
+
+    Las cajas, confianzas y clases se guardan en arrays de NumPy obtenidos con una
+    sola copia de ``boxes.data`` (en lugar de una llamada ``.item()`` por caja y por
+    campo). La conversión a diccionarios (``to_boxes``) se hace solo en los bordes:
+    respuesta JSON del servidor, dibujo y CSV.
+
+    Args:
+        xyxy (np.ndarray): Cajas ``(N, 4)`` en píxeles.
+        confidence (np.ndarray): Confianzas ``(N,)``.
+        class_id (np.ndarray): Índices de clase ``(N,)``.
+        names (Mapping[int, str]): Nombres de las clases del modelo.
+    """
+
+    __slots__ = ("xyxy", "confidence", "class_id", "names")
+
+    def __init__(
+        self,
+        xyxy: np.ndarray,
+        confidence: np.ndarray,
+        class_id: np.ndarray,
+        names: Mapping[int, str],
+    ) -> None:
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.confidence = np.asarray(confidence, dtype=np.float32).reshape(-1)
+        self.class_id = np.asarray(class_id, dtype=np.int64).reshape(-1)
+        self.names = names
+
+    @classmethod
+    def from_tensor(cls, data, names: Mapping[int, str]) -> "Detections":
+        """Crea las detecciones a partir de un tensor ``(N, 6)`` con columnas
+        ``x1, y1, x2, y2, conf, cls`` (``boxes.data`` o la salida del NMS)."""
+        array = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+        array = array.reshape(-1, array.shape[-1] if array.size else 6)
+        return cls(array[:, :4], array[:, -2], array[:, -1], names)
+
+    @classmethod
+    def from_result(cls, result) -> "Detections":
+        """Crea las detecciones de un ``Results`` de ultralytics."""
+        boxes = result.boxes
+        if boxes.is_track:  # data: x1, y1, x2, y2, track_id, conf, cls
+            data = boxes.data[:, [0, 1, 2, 3, 5, 6]]
+        else:
+            data = boxes.data
+        return cls.from_tensor(data, result.names)
+
+    @classmethod
+    def from_boxes(cls, boxes: List[Dict[str, Any]]) -> "Detections":
+        """Crea las detecciones a partir de diccionarios (``bounding_boxes``)."""
+        labels = sorted({box["label"] for box in boxes})
+        ids = {label: index for index, label in enumerate(labels)}
+        return cls(
+            [[box["x1"], box["y1"], box["x2"], box["y2"]] for box in boxes],
+            [box["confidence"] for box in boxes],
+            [ids[box["label"]] for box in boxes],
+            dict(enumerate(labels)),
+        )
+
+    @classmethod
+    def concatenate(cls, detections: List["Detections"], names: Mapping[int, str]):
+        """Une las detecciones de varias imágenes (p. ej. recortes de un frame)."""
+        if not detections:
+            return cls(np.empty((0, 4)), np.empty(0), np.empty(0), names)
+        return cls(
+            np.concatenate([d.xyxy for d in detections]),
+            np.concatenate([d.confidence for d in detections]),
+            np.concatenate([d.class_id for d in detections]),
+            names,
+        )
+
+    def __len__(self) -> int:
+        return len(self.confidence)
+
+    @property
+    def labels(self) -> List[str]:
+        """Nombre de la clase de cada detección."""
+        return [self.names[class_id] for class_id in self.class_id.tolist()]
+
+    def offset(self, offset_x: int, offset_y: int) -> "Detections":
+        """Desplaza las cajas (de coordenadas de un recorte a las del frame)."""
+        shift = np.array([offset_x, offset_y, offset_x, offset_y], dtype=np.float32)
+        return Detections(self.xyxy + shift, self.confidence, self.class_id, self.names)
+
+    def scale_to_original(
+        self, ratio: float, pad: Tuple[int, int], original_shape: Tuple[int, ...]
+    ) -> "Detections":
+        """Convierte las cajas del espacio ``letterbox`` a la imagen original."""
+        height, width = original_shape[:2]
+        pad_array = np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)
+        xyxy = (self.xyxy - pad_array) / ratio
+        xyxy = np.clip(xyxy, 0, [width, height, width, height])
+        return Detections(xyxy, self.confidence, self.class_id, self.names)
+
+    def objects_detected(self) -> List[Tuple[str, float]]:
+        """Pares ``(etiqueta, confianza)`` de ``results_data["objects_detected"]``."""
+        return list(zip(self.labels, self.confidence.tolist()))
+
+    def to_boxes(self) -> List[Dict[str, Any]]:
+        """Bounding boxes como diccionarios (formato de ``get_bounding_boxes``)."""
+        coordinates = self.xyxy.astype(np.int64).tolist()
+        return [
+            {
+                "x1": x1,
+                "y1": y1,
+                "x2": x2,
+                "y2": y2,
+                "label": label,
+                "confidence": confidence,
+            }
+            for (x1, y1, x2, y2), label, confidence in zip(
+                coordinates, self.labels, self.confidence.tolist()
+            )
+        ]
+
+
+def set_detection_filter(detection_filter: DetectionFilter) -> None:
+    """Fija el filtro usado por la inferencia local y enviado al servidor."""
+    global _detection_filter
+    _detection_filter = detection_filter
+
+
+def get_detection_filter() -> DetectionFilter:
+    """Retorna el filtro de detección del proceso."""
+    return _detection_filter
+
+
+def init_model(
+    size: str = "x",
+    rpi: bool = False,
+    backend: str = None,
+    imgsz: int = 640,
+    precision: str = "fp32",
+) -> "YOLO":
+    """Inicializa y retorna el modelo YOLO.
+
+    Args:
+        size (str): Tamaño del modelo (``"n"`` o ``"x"``).
+        rpi (bool): En la Raspberry Pi el backend por defecto es NCNN.
+        backend (str, optional): ``"pytorch"``, ``"ncnn"``, ``"onnx"``,
+            ``"openvino"`` o ``"auto"`` (el más rápido según un micro-benchmark que
+            se guarda para los siguientes arranques). Sin backend explícito se usa
+            uno que soporte ``precision``.
+        imgsz (int): Tamaño de entrada de los modelos exportados.
+        precision (str): ``"fp32"``, ``"fp16"`` o ``"int8"`` (variantes exportadas y
+            calibradas con los frames de ``data/local``, ver ``utils.model_export``).
+    """
+    weights = resolve_weights(f"models/yolo11{size}.pt")
+    if backend is None:
+        # El backend por defecto pasa a uno que soporte la precisión pedida
+        backend = precision_backend(
+            "ncnn" if rpi and size != "x" else "pytorch", precision
+        )
+    elif backend == "auto":
+        backend = precision_backend(select_backend(weights, imgsz), precision)
+    print(f"Using yolov11{size} model ({backend}, {precision})")
+    if backend == "pytorch" and precision == "fp32":
+        from ultralytics import YOLO
+
+        return YOLO(weights)
+    return load_model(weights, backend, imgsz, precision)
+
+
+def image_prediction(
+    model: "YOLO",
+    image_path: str,
+    image_extension: str = "png",
+    imgsz: int = None,
+    detection_filter: DetectionFilter = None,
+    render: bool = None,
+) -> Dict[str, Any]:
     """
     Realiza la predicción en la imagen y guarda el resultado.
 
     Args:
         image_path (str): Ruta de la imagen de entrada.
+        imgsz (int, optional): Tamaño de entrada de la inferencia (640 por defecto).
+            Las cajas se devuelven siempre en coordenadas de la imagen original.
+        detection_filter (DetectionFilter, optional): Clases y umbrales (por defecto
+            el filtro del proceso, ver ``set_detection_filter``).
+        render (bool, optional): Guardar la imagen anotada; por defecto lo decide la
+            política del proceso (``set_annotation_policy``).
 
     Returns:
-        str: Ruta del archivo de resultado.
+        dict: Resultados; ``path`` es la imagen anotada o None si no se dibujó.
     """
-    results = model(image_path)
+    imgsz = imgsz or 640
+    detection_filter = detection_filter or get_detection_filter()
+    results = model(image_path, imgsz=imgsz, **detection_filter.model_kwargs(model.names))
     speed = results[0].speed
     original_shape = results[0].orig_shape
-    boxes = results[0].boxes
-    labels = results[0].names
-    objects_detected = []
-    for box in boxes:
-        label = box.cls[0]  # Obtiene la clase del objeto
-        confidence = box.conf[0].item()  # Obtiene el porcentaje de confianza
-        objects_detected.append((labels[int(label)], confidence))
-    result_path = f".{image_path.split('.')[-2]}_result.{image_extension}"
-    results[0].save(result_path)
+    detections = Detections.from_result(results[0])
+    bounding_boxes = detections.to_boxes()
+    result_path = None
+    if render is None:
+        render = get_annotation_policy().should_render(len(detections))
+    if render:
+        result_path = f".{image_path.split('.')[-2]}_result.{image_extension}"
+        render_detections(results[0].orig_img, bounding_boxes, result_path)
     results_data = {
         "path": result_path,
         "speed": speed,
         "original_shape": original_shape,
-        "objects_detected": objects_detected,
+        "objects_detected": detections.objects_detected(),
+        "bounding_boxes": bounding_boxes,
+        "imgsz": imgsz,
     }
     return results_data
 
 
-def preprocess_image(image_path: str) -> tuple[np.ndarray, tuple]:
-    """Lee y preprocesa la imagen, devolviendo un vector aplanado y su forma original."""
+def letterbox(
+    image: np.ndarray, target_size: int = 640
+) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """Redimensiona la imagen manteniendo la relación de aspecto y rellena hasta un
+    cuadrado de ``target_size``.
+
+    Args:
+        image (np.ndarray): Imagen original (BGR).
+        target_size (int): Lado del cuadrado de salida.
+
+    Returns:
+        Tuple[np.ndarray, float, Tuple[int, int]]: Imagen resultante, factor de
+        escala aplicado y relleno (x, y) a la izquierda/arriba en píxeles.
+    """
+    height, width = image.shape[:2]
+    ratio = min(target_size / height, target_size / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+    pad_x = (target_size - new_width) // 2
+    pad_y = (target_size - new_height) // 2
+    padded = cv2.copyMakeBorder(
+        image,
+        pad_y,
+        target_size - new_height - pad_y,
+        pad_x,
+        target_size - new_width - pad_x,
+        cv2.BORDER_CONSTANT,
+        value=LETTERBOX_COLOR,
+    )
+    return padded, ratio, (pad_x, pad_y)
+
+
+def scale_boxes_to_original(
+    boxes: List[Dict[str, Any]],
+    ratio: float,
+    pad: Tuple[int, int],
+    original_shape: Tuple[int, ...],
+) -> List[Dict[str, Any]]:
+    """Convierte bounding boxes del espacio ``letterbox`` a coordenadas de la imagen
+    original.
+
+    Args:
+        boxes (list): Bounding boxes con claves x1, y1, x2, y2.
+        ratio (float): Factor de escala usado en ``letterbox``.
+        pad (Tuple[int, int]): Relleno (x, y) usado en ``letterbox``.
+        original_shape (tuple): Forma (alto, ancho, ...) de la imagen original.
+
+    Returns:
+        list: Nuevas bounding boxes en coordenadas de la imagen original.
+    """
+    return (
+        Detections.from_boxes(boxes)
+        .scale_to_original(ratio, pad, original_shape)
+        .to_boxes()
+    )
+
+
+def encode_image(image: np.ndarray, encoding: str = "jpg", quality: int = 90) -> bytes:
+    """Codifica la imagen en memoria (jpg, webp o png)."""
+    if encoding in ("jpg", "jpeg"):
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif encoding == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        params = []
+    ok, buffer = cv2.imencode(f".{encoding}", image, params)
+    if not ok:
+        raise ValueError(f"[CLIENT ERROR] No se pudo codificar la imagen como {encoding}")
+    return buffer.tobytes()
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    """Decodifica una imagen comprimida recibida como bytes."""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("No se pudo decodificar la imagen recibida")
+    return image
+
+
+def preprocess_image(
+    image_path: str, target_size: int = 640, encoding: str = "jpg", quality: int = 90
+) -> Tuple[bytes, Dict[str, Any]]:
+    """Lee la imagen, aplica ``letterbox`` al tamaño indicado y la comprime.
+
+    Args:
+        image_path (str): Ruta de la imagen de entrada.
+        target_size (int): Resolución de entrada del modelo (320, 416 o 640).
+        encoding (str): Formato de compresión (jpg, webp o png).
+        quality (int): Calidad de compresión para jpg/webp.
+
+    Returns:
+        Tuple[bytes, dict]: Imagen comprimida y los parámetros del ``letterbox``
+        (ratio, pad y original_shape) necesarios para recuperar las coordenadas.
+    """
+    if target_size not in PREPROCESS_SIZES:
+        raise ValueError(f"Tamaño no soportado: {target_size} {PREPROCESS_SIZES}")
     image = cv2.imread(image_path)
-    resized_image = cv2.resize(image, (640, 640))
-    flattened_image = resized_image.flatten()
-    return flattened_image, resized_image.shape
+    if image is None:
+        raise FileNotFoundError(f"[CLIENT ERROR] No se pudo leer la imagen: {image_path}")
+    padded, ratio, pad = letterbox(image, target_size)
+    letterbox_info = {"ratio": ratio, "pad": pad, "original_shape": image.shape}
+    return encode_image(padded, encoding, quality), letterbox_info
 
 
 def predict_with_flatten_array(
-    model: YOLO, image_vector: np.ndarray, original_shape: tuple
+    model: "YOLO", image_vector: np.ndarray, original_shape: tuple, **kwargs
 ) -> any:
     """Predice con el modelo YOLO usando el vector aplanado de la imagen."""
     image = image_vector.reshape(original_shape)
-    return model(image)
+    return model(image, **kwargs)
 
 
-def get_bounding_boxes(results) -> list:
-    """Extrae las bounding boxes, etiquetas y porcentajes de confianza de los resultados."""
-    boxes = results[0].boxes
-    labels = results[0].names
-    bounding_boxes = []
+def detect_frame(model: "YOLO", frame: np.ndarray, imgsz: int = None) -> list:
+    """Realiza la predicción sobre un frame en memoria y retorna sus bounding boxes.
 
-    for box in boxes:
-        x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-        label = labels[int(box.cls[0])]
-        confidence = box.conf[0].item()
-        bounding_boxes.append(
-            {
-                "x1": x1,
-                "y1": y1,
-                "x2": x2,
-                "y2": y2,
-                "label": label,
-                "confidence": confidence,
-            }
-        )
+    ``imgsz`` fija la resolución de entrada del modelo (p. ej. la elegida por
+    ``ResolutionController``); por defecto se usa la del modelo.
+    """
+    kwargs = get_detection_filter().model_kwargs(model.names)
+    if imgsz is not None:
+        kwargs["imgsz"] = imgsz
+    return get_bounding_boxes(model(frame, verbose=False, **kwargs))
 
-    return bounding_boxes
 
+def get_bounding_boxes(results) -> list:
+    """Extrae las bounding boxes, etiquetas y porcentajes de confianza de los resultados."""
+    return Detections.from_result(results[0]).to_boxes()
 
-def generate_random_color() -> tuple:
-    """Genera un color RGB aleatorio."""
-    return tuple(random.randint(0, 255) for _ in range(3))
+
+@functools.lru_cache(maxsize=None)
+def label_color(label: str) -> tuple:
+    """Color (BGR) de la paleta fijo para cada etiqueta."""
+    return PALETTE[zlib.crc32(label.encode()) % len(PALETTE)]
 
 
 def draw_bounding_boxes(image: np.ndarray, boxes: list) -> np.ndarray:
@@ -107,7 +548,7 @@ def draw_bounding_boxes(image: np.ndarray, boxes: list) -> np.ndarray:
     for box in boxes:
         x1, y1, x2, y2 = box["x1"], box["y1"], box["x2"], box["y2"]
         label, confidence = box["label"], box["confidence"]
-        color = generate_random_color()
+        color = label_color(label.split(" #")[0])  # Sin el id del track
 
         cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
         label_text = f"{label} {confidence:.2f}"
@@ -138,40 +579,92 @@ def draw_bounding_boxes(image: np.ndarray, boxes: list) -> np.ndarray:
     return image
 
 
+def render_detections(image: Union[str, np.ndarray], boxes: list, result_path: str) -> str:
+    """Dibuja las detecciones guardadas sobre la imagen (ruta o array, que se
+    modifica) y la escribe en ``result_path``. Permite anotar bajo demanda los frames
+    cuyos resultados ya se guardaron sin imagen."""
+    if isinstance(image, str):
+        image = cv2.imread(image)
+        if image is None:
+            raise FileNotFoundError(f"No se pudo leer la imagen para anotar: {image}")
+    cv2.imwrite(result_path, draw_bounding_boxes(image, boxes))
+    return result_path
+
+
+def get_session() -> requests.Session:
+    """Retorna una sesión HTTP por hilo para reutilizar la conexión con el servidor."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
+
+
 def upload_image_preprocessed(
-    image_path: str, server_ip: str = "ID-DESKTOP.local", image_extension: str = None
-) -> str:
-    """Envía la imagen preprocesada al servidor y guarda el resultado."""
+    image_path: str,
+    server_ip: str = "ID-DESKTOP.local",
+    image_extension: str = None,
+    target_size: int = 640,
+    encoding: str = "jpg",
+    quality: int = 90,
+) -> Dict[str, Any]:
+    """Envía la imagen preprocesada (``letterbox`` + compresión) al servidor y guarda
+    el resultado con las bounding boxes en coordenadas de la imagen original.
+    """
     result_folder = "./data/server/"
     os.makedirs(result_folder, exist_ok=True)
 
     url = f"http://{server_ip}:8000/"
-    prepro_img, img_shape = preprocess_image(image_path)
-    prepro_img_serialized = prepro_img.tolist()
+    encoded_image, letterbox_info = preprocess_image(
+        image_path, target_size, encoding, quality
+    )
 
     headers = {
         "Content-type": "application/json",
         "X-File-Name": os.path.basename(image_path),
+        **get_detection_filter().headers(),
+    }
+    data = {
+        "image_encoded": base64.b64encode(encoded_image).decode("ascii"),
+        "encoding": encoding,
+        "imgsz": target_size,
     }
-    data = {"image_array": prepro_img_serialized, "shape": img_shape}
 
-    response = requests.post(url, headers=headers, json=data, timeout=120)
+    start_time = time.perf_counter()
+    response = get_session().post(url, headers=headers, json=data, timeout=120)
+    elapsed_time = time.perf_counter() - start_time
     if response.status_code == 200:
         response_data = response.json()
-        bounding_boxes = response_data.get("bounding_boxes", [])
-        result_data = response_data.get("result_data", {})
-
-        original_image = cv2.imread(image_path)
-        image_processed = draw_bounding_boxes(original_image, bounding_boxes)
-        result_image_path = os.path.join(
-            result_folder,
-            f"{os.path.splitext(os.path.basename(image_path))[0]}_result.{image_extension}",
+        bounding_boxes = scale_boxes_to_original(
+            response_data.get("bounding_boxes", []),
+            letterbox_info["ratio"],
+            letterbox_info["pad"],
+            letterbox_info["original_shape"],
         )
-
-        cv2.imwrite(result_image_path, image_processed)
-
-        print(f"Processed image saved at: {result_image_path}")
+        result_data = response_data.get("results_data", {})
+
+        result_image_path = None
+        if get_annotation_policy().should_render(len(bounding_boxes)):
+            result_image_path = render_detections(
+                image_path,
+                bounding_boxes,
+                os.path.join(
+                    result_folder,
+                    f"{os.path.splitext(os.path.basename(image_path))[0]}_result."
+                    f"{image_extension or 'png'}",
+                ),
+            )
+            print(f"Processed image saved at: {result_image_path}")
         result_data["path"] = result_image_path
+        result_data["bounding_boxes"] = bounding_boxes
+        # The server saw the letterboxed input; record the shape of the captured frame
+        result_data["original_shape"] = letterbox_info["original_shape"][:2]
+        result_data["upload_size"] = len(encoded_image)
+        result_data["latency"] = elapsed_time
+        result_data["server_time"] = float(response.headers.get("X-Processing-Time", 0.0))
+        record_transfer(
+            server_ip, len(encoded_image), elapsed_time - result_data["server_time"]
+        )
         return result_data
 
     raise RuntimeError("Error in server response.")
@@ -219,9 +712,20 @@ def upload_image_preprocessed(
             return result_data
         raise RuntimeError("Error in server response.")'''
 
-def upload_image(image_path: str, server_ip: str = None, image_extension: str = None) -> Dict[str, Any]:
+def upload_image(
+    image_path: str,
+    server_ip: str = None,
+    image_extension: str = None,
+    encoder=None,
+    timeout: float = 120,
+) -> Dict[str, Any]:
     """
     Envía la imagen al servidor y descarga el resultado en la carpeta './data/server/'.
+
+    Si se indica un ``encoder`` (``utils.adaptive_encoding.AdaptiveEncoder``), la
+    imagen se recomprime según el ancho de banda medido y el tiempo de subida se
+    registra en el encoder. ``timeout`` es el tiempo máximo de espera de la
+    respuesta en segundos.
     """
     result_folder = "./data/server/"
     os.makedirs(result_folder, exist_ok=True)
@@ -236,21 +740,30 @@ def upload_image(image_path: str, server_ip: str = None, image_extension: str =
     if file_size == 0:
         raise ValueError(f"[CLIENT ERROR] Archivo vacío: {image_path}")
 
-    print(f"[CLIENT] Enviando '{image_path}' ({file_size} bytes) al servidor...")
-
-    with open(image_path, "rb") as f:
-        file_data = f.read()
+    file_name = os.path.basename(image_path)
+    encoding_info = {}
+    if encoder is not None:
+        file_data, encoding_info = encoder.encode(cv2.imread(image_path))
+        file_name = f"{os.path.splitext(file_name)[0]}.{encoding_info['encoding']}"
+    else:
+        with open(image_path, "rb") as f:
+            file_data = f.read()
 
     if not file_data:
         raise ValueError("[CLIENT ERROR] La lectura del archivo resultó en datos vacíos")
 
+    print(f"[CLIENT] Enviando '{image_path}' ({len(file_data)} bytes) al servidor...")
+
     headers = {
         "Content-Type": "application/octet-stream",
-        "X-File-Name": os.path.basename(image_path)
+        "X-File-Name": file_name,
+        **get_detection_filter().headers(),
     }
 
     url = f"http://{server_ip}:8000/"
-    response = requests.post(url, headers=headers, data=file_data, timeout=120)
+    start_time = time.perf_counter()
+    response = get_session().post(url, headers=headers, data=file_data, timeout=timeout)
+    elapsed_time = time.perf_counter() - start_time
 
     print(f"[CLIENT] Respuesta del servidor: {response.status_code}")
 
@@ -262,6 +775,14 @@ def upload_image(image_path: str, server_ip: str = None, image_extension: str =
 
         # Process JSON
         result_data = json.loads(json_part)
+        processing_time = float(response.headers.get("X-Processing-Time", 0.0))
+        result_data["upload_size"] = len(file_data)
+        result_data["latency"] = elapsed_time
+        result_data["server_time"] = processing_time
+        record_transfer(server_ip, len(file_data), elapsed_time - processing_time)
+        if encoder is not None:
+            encoder.record_transfer(len(file_data), elapsed_time - processing_time)
+            result_data.update(encoding_info)
 
         # Save image
         result_image_path = os.path.join(
@@ -0,0 +1,157 @@
+"""
+This module contains hedged inference: the frame is sent to the server and, if the
+answer takes longer than a learned percentile of the server latency, the local model
+starts on the same frame. The first result wins and the other one is ignored.
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.scheduler import LatencyEstimator
+
+
+class HedgedExecutor:
+    """Runs ``remote_function`` and hedges it with ``local_function`` when the remote
+    call is slower than the ``percentile`` of the recent remote latencies.
+
+    Remote calls that lose the race keep running in the background (an HTTP request
+    cannot be interrupted) and their latency is still recorded, so slow answers keep
+    pushing the learned percentile up instead of being hidden by the hedge. A local
+    call that has not started yet is cancelled.
+
+    Args:
+        remote_function (callable): Remote inference, e.g. ``upload_image``.
+        local_function (callable): Local inference called with the same arguments.
+        percentile (float): Percentile (0-100) of the remote latency used as delay.
+        initial_delay (float): Delay in seconds used until ``min_samples`` remote
+            latencies were recorded.
+        min_samples (int): Remote latencies required before using the percentile.
+        window (int): Number of recent remote latencies kept.
+        max_remote_calls (int): Remote calls that may be running at the same time
+            (including the ones that lost the race).
+        local_ready (callable, optional): Returns False while the local inference
+            cannot start right away (e.g. model still loading); frames are not
+            hedged meanwhile.
+    """
+
+    def __init__(
+        self,
+        remote_function: Callable[..., Any],
+        local_function: Callable[..., Any],
+        percentile: float = 95,
+        initial_delay: float = 1.0,
+        min_samples: int = 10,
+        window: int = 100,
+        max_remote_calls: int = 8,
+        local_ready: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        self.remote_function = remote_function
+        self.local_function = local_function
+        self.local_ready = local_ready
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.remote_latency = LatencyEstimator(window=window)
+
+        self._remote_executor = ThreadPoolExecutor(
+            max_workers=max_remote_calls, thread_name_prefix="hedge-remote"
+        )
+        # The local model is not thread-safe: one local inference at a time
+        self._local_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="hedge-local"
+        )
+        self._lock = threading.Lock()
+        self.stats = {
+            "frames": 0,
+            "hedged": 0,
+            "remote_wins": 0,
+            "local_wins": 0,
+            "remote_errors": 0,
+        }
+
+    @property
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the server before starting the local inference."""
+        with self._lock:
+            if len(self.remote_latency.samples) < self.min_samples:
+                return self.initial_delay
+            return self.remote_latency.quantile(self.percentile / 100)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def _timed_remote(self, *args, **kwargs) -> Any:
+        start_time = time.perf_counter()
+        try:
+            return self.remote_function(*args, **kwargs)
+        except Exception:
+            self._count("remote_errors")
+            raise
+        finally:
+            with self._lock:
+                self.remote_latency.add(time.perf_counter() - start_time)
+
+    def run(self, *args, **kwargs) -> Tuple[Any, str]:
+        """Runs the inference of one frame.
+
+        Returns:
+            Tuple[Any, str]: Result of the winner and ``"server"`` or ``"local"``.
+        """
+        self._count("frames")
+        remote = self._remote_executor.submit(self._timed_remote, *args, **kwargs)
+        timeout = self.hedge_delay
+        if self.local_ready is not None and not self.local_ready():
+            timeout = None
+        done, _ = wait([remote], timeout=timeout)
+        if done and remote.exception() is None:
+            self._count("remote_wins")
+            return remote.result(), "server"
+
+        self._count("hedged")
+        local = self._local_executor.submit(self.local_function, *args, **kwargs)
+        pending = {remote, local}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    local.cancel()
+                    winner = "server" if future is remote else "local"
+                    self._count("remote_wins" if winner == "server" else "local_wins")
+                    return future.result(), winner
+        # Both failed: surface the local error, the remote one was already counted
+        raise self._first_error(local, remote)
+
+    @staticmethod
+    def _first_error(*futures: Future) -> BaseException:
+        return next(f.exception() for f in futures if f.exception() is not None)
+
+    def report(self) -> Dict[str, Any]:
+        """Prints and returns the hedge rate and the win ratio of each side."""
+        with self._lock:
+            stats = dict(self.stats)
+        frames = stats["frames"] or 1
+        winners = (stats["remote_wins"] + stats["local_wins"]) or 1
+        stats["hedge_rate"] = stats["hedged"] / frames
+        stats["remote_win_ratio"] = stats["remote_wins"] / winners
+        stats["local_win_ratio"] = stats["local_wins"] / winners
+        stats["hedge_delay_ms"] = self.hedge_delay * 1000
+
+        print("\n" + "=" * 50)
+        print(f"{'Inferencia con cobertura':<30} {'Valor':<20}")
+        print("=" * 50)
+        print(f"{'Frames:':<30} {stats['frames']}")
+        print(f"{'Tasa de cobertura (%):':<30} {stats['hedge_rate'] * 100:.1f}%")
+        print(f"{'Gana el servidor (%):':<30} {stats['remote_win_ratio'] * 100:.1f}%")
+        print(f"{'Gana local (%):':<30} {stats['local_win_ratio'] * 100:.1f}%")
+        print(f"{'Errores del servidor:':<30} {stats['remote_errors']}")
+        print(f"{'Espera antes de cubrir (ms):':<30} {stats['hedge_delay_ms']:.1f}")
+        print("=" * 50)
+        return stats
+
+    def close(self) -> None:
+        """Stops accepting work; remote calls still running are not waited for."""
+        self._remote_executor.shutdown(wait=False, cancel_futures=True)
+        self._local_executor.shutdown(wait=False, cancel_futures=True)
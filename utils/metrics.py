@@ -0,0 +1,454 @@
+"""
+This module contains a buffered sink of metric rows (one row per processed image or
+frame) and the loader used by the notebooks.
+
+The sink keeps its file open, buffers the rows in memory and writes them in batches
+(every ``batch_size`` rows, after ``flush_interval`` seconds and at exit), so a
+measurement loop does not open, seek and close a file per image. The format is
+chosen by the extension of the path:
+
+* ``.csv``: text, nested values (lists of detections, shapes) encoded as JSON.
+* ``.sqlite`` / ``.db``: a ``metrics`` table with typed columns (standard library),
+  nested values stored as JSON text.
+* ``.parquet`` / ``.arrow``: typed columnar files (Arrow IPC stream for ``.arrow``)
+  with real list columns; they need ``pyarrow``.
+
+Column types come from the schema given with the field names (a ``{name: type}``
+dict such as ``{"latency": float, "objects_detected": list}``), not from the first
+rows, so a column that starts empty or a nested value that appears later keeps its
+type. Files are rotated by size or age into numbered siblings (``run.parquet``,
+``run.1.parquet``, ...) that ``load_metrics`` reads back together.
+"""
+
+import ast
+import atexit
+import contextlib
+import csv
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+FORMATS = {
+    ".csv": "csv",
+    ".sqlite": "sqlite",
+    ".db": "sqlite",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+}
+EXTENSIONS = {"csv": ".csv", "sqlite": ".sqlite", "parquet": ".parquet", "arrow": ".arrow"}
+
+# Columns holding lists of tuples, stored as lists of structs in the Arrow formats
+STRUCT_FIELDS = {"objects_detected": ("label", "confidence")}
+
+# Field names, or a {name: type} schema (bool, int, float, str, list, tuple or dict)
+Fields = Union[Sequence[str], Dict[str, type]]
+
+NESTED_TYPES = (list, tuple, dict)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "Los formatos parquet y arrow necesitan pyarrow (pip install pyarrow)"
+        ) from e
+    return pyarrow
+
+
+def _is_nested(value: Any) -> bool:
+    return isinstance(value, (list, tuple, dict))
+
+
+def _to_json(value: Any) -> Any:
+    return json.dumps(value) if _is_nested(value) else value
+
+
+def _from_text(value: Any) -> Any:
+    """Decodes a nested value written as JSON (or as a Python literal by the CSV
+    files written before this module)."""
+    if not isinstance(value, str):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return ast.literal_eval(value)
+
+
+class _CsvWriter:
+    def __init__(self, path: str, fieldnames: Sequence[str]) -> None:
+        is_new = not os.path.isfile(path) or os.path.getsize(path) == 0
+        self._file = open(path, mode="a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(
+            self._file, fieldnames=fieldnames, extrasaction="ignore"
+        )
+        if is_new:
+            self._writer.writeheader()
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.writerows(
+            {key: _to_json(value) for key, value in row.items()} for row in rows
+        )
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _SqliteWriter:
+    TYPES = {bool: "INTEGER", int: "INTEGER", float: "REAL", str: "TEXT"}
+
+    def __init__(
+        self, path: str, fieldnames: Sequence[str], schema: Dict[str, type]
+    ) -> None:
+        self.fieldnames = list(fieldnames)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # Nested columns are declared JSON so load_metrics decodes them; columns
+        # without a type in the schema are left untyped
+        columns = []
+        for name in self.fieldnames:
+            field_type = schema.get(name)
+            declared = "JSON" if field_type in NESTED_TYPES else self.TYPES.get(field_type, "")
+            columns.append(f'"{name}" {declared}'.rstrip())
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS metrics ({', '.join(columns)})"
+        )
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        placeholders = ", ".join("?" for _ in self.fieldnames)
+        with self._connection:
+            self._connection.executemany(
+                f"INSERT INTO metrics VALUES ({placeholders})",
+                [[_to_json(row.get(name)) for name in self.fieldnames] for row in rows],
+            )
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class _ArrowWriter:
+    def __init__(
+        self, path: str, fieldnames: Sequence[str], schema: Dict[str, type], parquet: bool
+    ) -> None:
+        self.pyarrow = _import_pyarrow()
+        pa = self.pyarrow
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        scalar_types = {
+            bool: pa.bool_(),
+            int: pa.int64(),
+            float: pa.float64(),
+            str: pa.string(),
+        }
+        # Declared types; the other columns are inferred from the first batch
+        self.types = {
+            name: scalar_types[schema[name]]
+            for name in self.fieldnames
+            if schema.get(name) in scalar_types
+        }
+        for name, keys in STRUCT_FIELDS.items():
+            if name in self.fieldnames:
+                self.types[name] = pa.list_(
+                    pa.struct([(keys[0], pa.string()), (keys[1], pa.float64())])
+                )
+        self.parquet = parquet
+        self.schema = None
+        self._file = None
+        self._writer = None
+
+    def _columns(self, rows: List[Dict[str, Any]]) -> Dict[str, list]:
+        columns = {}
+        for name in self.fieldnames:
+            values = [row.get(name) for row in rows]
+            if name in STRUCT_FIELDS:
+                keys = STRUCT_FIELDS[name]
+                values = [
+                    None if value is None else [dict(zip(keys, item)) for item in value]
+                    for value in values
+                ]
+            else:
+                values = [list(value) if isinstance(value, tuple) else value for value in values]
+            columns[name] = values
+        return columns
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        pa = self.pyarrow
+        columns = self._columns(rows)
+        if self.schema is None:
+            table = pa.table(
+                {
+                    name: pa.array(values, type=self.types.get(name))
+                    for name, values in columns.items()
+                }
+            )
+            self.schema = table.schema
+            if self.parquet:
+                self._writer = pa.parquet.ParquetWriter(self.path, self.schema)
+            else:
+                self._file = pa.OSFile(self.path, "wb")
+                self._writer = pa.ipc.new_stream(self._file, self.schema)
+        else:
+            # Raises ArrowInvalid/ArrowTypeError if the types changed (handled by
+            # MetricsSink with a new file)
+            table = pa.table(columns, schema=self.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+
+class MetricsSink:
+    """Buffers metric rows and writes them in batches to a CSV, SQLite, Parquet or
+    Arrow file (by the extension of ``path``).
+
+    Args:
+        path (str): Path of the first file. Rotated files are numbered before the
+            extension.
+        fieldnames (Sequence[str] or Dict[str, type], optional): Columns, in order,
+            or a ``{name: type}`` schema that also sets the column types of the
+            SQLite and Arrow formats. By default the keys of the first row.
+        batch_size (int): Rows buffered before writing a batch.
+        flush_interval (float): Seconds after the last batch when the next row
+            written flushes the buffer.
+        rotate_bytes (int, optional): Start a new file once the current one is bigger.
+        rotate_seconds (float, optional): Start a new file once the current one is
+            older.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fieldnames: Optional[Fields] = None,
+        batch_size: int = 50,
+        flush_interval: float = 5.0,
+        rotate_bytes: Optional[int] = None,
+        rotate_seconds: Optional[float] = None,
+    ) -> None:
+        base, extension = os.path.splitext(path)
+        if extension.lower() not in FORMATS:
+            raise ValueError(
+                f"Formato de métricas no soportado: {extension} ({', '.join(FORMATS)})"
+            )
+        self.path = path
+        self.format = FORMATS[extension.lower()]
+        if self.format in ("parquet", "arrow"):
+            _import_pyarrow()  # Fail now rather than at the first flush
+        self.fieldnames = list(fieldnames) if fieldnames else None
+        self.schema = dict(fieldnames) if isinstance(fieldnames, dict) else {}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+
+        self._base = base
+        self._extension = extension
+        self._part = 0
+        self._rows: List[Dict[str, Any]] = []
+        self._writer = None
+        self._opened_at = 0.0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    @property
+    def current_path(self) -> str:
+        """Path of the file being written."""
+        if self._part == 0:
+            return self.path
+        return f"{self._base}.{self._part}{self._extension}"
+
+    def _open(self) -> None:
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        path = self.current_path
+        if self.format == "csv":
+            self._writer = _CsvWriter(path, self.fieldnames)
+        elif self.format == "sqlite":
+            self._writer = _SqliteWriter(path, self.fieldnames, self.schema)
+        else:
+            self._writer = _ArrowWriter(
+                path, self.fieldnames, self.schema, self.format == "parquet"
+            )
+        self._opened_at = time.monotonic()
+
+    def _rotate(self) -> None:
+        self._writer.close()
+        self._writer = None
+        self._part += 1
+        while os.path.exists(self.current_path):
+            self._part += 1
+
+    def _should_rotate(self) -> bool:
+        if self.rotate_seconds and time.monotonic() - self._opened_at >= self.rotate_seconds:
+            return True
+        return bool(self.rotate_bytes) and os.path.getsize(self.current_path) >= self.rotate_bytes
+
+    def _write_batch(self) -> None:
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        if self._writer is None:
+            self._open()
+        try:
+            self._writer.write(rows)
+        except Exception as e:  # Arrow types changed (e.g. a column that was all null)
+            if self.format not in ("parquet", "arrow") or self._writer.schema is None:
+                raise
+            print(f"[WARNING] Cambio de tipos en {self.current_path}, nuevo fichero: {e}")
+            self._rotate()
+            self._open()
+            self._writer.write(rows)
+        self._last_flush = time.monotonic()
+        if self._should_rotate():
+            self._rotate()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        """Buffers one row; a batch is written when the buffer is full or old."""
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"El sink de métricas {self.path} está cerrado")
+            if self.fieldnames is None:
+                self.fieldnames = list(row)
+            self._rows.append(row)
+            if (
+                len(self._rows) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._write_batch()
+
+    def flush(self) -> None:
+        """Writes the buffered rows."""
+        with self._lock:
+            self._write_batch()
+
+    def close(self) -> None:
+        """Writes the buffered rows and closes the file (safe to call twice)."""
+        with self._lock:
+            if self._closed:
+                return
+            self._write_batch()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._closed = True
+        atexit.unregister(self.close)
+
+    def __enter__(self) -> "MetricsSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+_metrics_format: Optional[str] = None
+_sinks: Dict[str, MetricsSink] = {}
+_sinks_lock = threading.Lock()
+
+
+def set_metrics_format(metrics_format: Optional[str]) -> None:
+    """Sets the format (csv, sqlite, parquet or arrow) of the metric files of the
+    process; None keeps the extension given by each caller."""
+    if metrics_format is not None and metrics_format not in EXTENSIONS:
+        raise ValueError(
+            f"Formato de métricas no soportado: {metrics_format} ({', '.join(EXTENSIONS)})"
+        )
+    if metrics_format in ("parquet", "arrow"):
+        _import_pyarrow()
+    global _metrics_format
+    _metrics_format = metrics_format
+
+
+def metrics_path(path: str) -> str:
+    """``path`` with the extension of the format set with ``set_metrics_format``."""
+    if _metrics_format is None:
+        return path
+    return os.path.splitext(path)[0] + EXTENSIONS[_metrics_format]
+
+
+def get_metrics_sink(path: str, fieldnames: Optional[Fields] = None) -> MetricsSink:
+    """Returns the shared sink of ``path`` (with the extension of the configured
+    format), created on first use and closed at exit."""
+    path = metrics_path(path)
+    with _sinks_lock:
+        sink = _sinks.get(path)
+        if sink is None or sink._closed:
+            sink = _sinks[path] = MetricsSink(path, fieldnames)
+        return sink
+
+
+def metrics_files(path: str) -> List[str]:
+    """The file ``path`` and its rotated siblings, in order."""
+    base, extension = os.path.splitext(path)
+    pattern = re.compile(re.escape(base) + r"\.(\d+)" + re.escape(extension) + "$")
+    rotated = []
+    for candidate in glob.glob(f"{glob.escape(base)}.*{extension}"):
+        match = pattern.match(candidate)
+        if match:
+            rotated.append((int(match.group(1)), candidate))
+    files = [path] if os.path.isfile(path) else []
+    return files + [candidate for _, candidate in sorted(rotated)]
+
+
+def _decode_nested(frame, name: str) -> None:
+    """Decodes a text column whose values are all JSON lists or objects."""
+    values = frame[name].dropna()
+    if (
+        len(values)
+        and values.map(lambda value: isinstance(value, str)).all()
+        and values.str.match(r"^[\[{]").all()
+    ):
+        frame[name] = frame[name].map(_from_text)
+
+
+def load_metrics(path: str):
+    """Loads a metrics file and its rotated siblings into one pandas DataFrame.
+
+    Parquet and Arrow files keep their types (list columns included); SQLite
+    columns declared JSON and the nested CSV and untyped SQLite columns are decoded
+    into lists.
+    """
+    import pandas as pd
+
+    extension = os.path.splitext(path)[1].lower()
+    metrics_format = FORMATS.get(extension)
+    if metrics_format is None:
+        raise ValueError(f"Formato de métricas no soportado: {extension}")
+    frames = []
+    for file_path in metrics_files(path):
+        if metrics_format == "parquet":
+            frames.append(pd.read_parquet(file_path))
+        elif metrics_format == "arrow":
+            pa = _import_pyarrow()
+            with pa.OSFile(file_path, "rb") as source:
+                frames.append(pa.ipc.open_stream(source).read_all().to_pandas())
+        elif metrics_format == "sqlite":
+            with contextlib.closing(sqlite3.connect(file_path)) as connection:
+                frame = pd.read_sql_query("SELECT * FROM metrics", connection)
+                declared = connection.execute("PRAGMA table_info(metrics)").fetchall()
+            for _, name, column_type, *_ in declared:
+                if column_type == "JSON":
+                    frame[name] = frame[name].map(_from_text)
+                elif not column_type:
+                    _decode_nested(frame, name)
+            frames.append(frame)
+        else:
+            frame = pd.read_csv(file_path)
+            for name in frame.columns:
+                _decode_nested(frame, name)
+            frames.append(frame)
+    if not frames:
+        raise FileNotFoundError(f"No hay ficheros de métricas en {path}")
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,309 @@
+"""
+This module contains the cache of exported YOLO models and the automatic selection of
+the fastest inference backend of the machine.
+
+Exports are stored in ``models/exports/`` under a name made of the weights hash, the
+backend, the input size and the precision, so a new ``.pt`` file or a different
+``imgsz`` never reuses a stale export. The int8 variants are calibrated on frames
+captured by the Pi (``data/local``). The backend chosen by the startup
+micro-benchmark is persisted in ``models/backend_choice.json`` and reused on later
+starts.
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+EXPORT_FOLDER = "models/exports/"
+CHOICE_FILE = "models/backend_choice.json"
+CALIBRATION_FOLDER = "data/local/"
+
+# Backend -> (ultralytics export format, runtime module needed to run it)
+BACKENDS = {
+    "pytorch": (None, "torch"),
+    "ncnn": ("ncnn", "ncnn"),
+    "onnx": ("onnx", "onnxruntime"),
+    "openvino": ("openvino", "openvino"),
+}
+
+# Precisions each backend can produce (ONNX int8 is quantized with ONNX Runtime,
+# the others are exported by ultralytics)
+PRECISIONS = {
+    "pytorch": ("fp32",),
+    "ncnn": ("fp32", "fp16"),
+    "onnx": ("fp32", "int8"),
+    "openvino": ("fp32", "fp16", "int8"),
+}
+
+_hashes: Dict[tuple, str] = {}
+
+
+def resolve_weights(weights: str) -> str:
+    """Local path of the weights, downloaded by ultralytics on a fresh checkout."""
+    if os.path.isfile(weights):
+        return weights
+    from ultralytics.utils.downloads import attempt_download_asset
+
+    return attempt_download_asset(weights)
+
+
+def weights_hash(weights: str) -> str:
+    """Short SHA-256 of the weights file (cached by path, size and mtime)."""
+    weights = resolve_weights(weights)
+    stat = os.stat(weights)
+    key = (os.path.abspath(weights), stat.st_size, stat.st_mtime)
+    if key not in _hashes:
+        digest = hashlib.sha256()
+        with open(weights, "rb") as weights_file:
+            for block in iter(lambda: weights_file.read(2**20), b""):
+                digest.update(block)
+        _hashes[key] = digest.hexdigest()[:12]
+    return _hashes[key]
+
+
+def available_backends() -> List[str]:
+    """Backends whose runtime is installed on this machine."""
+    return [
+        backend
+        for backend, (_, module) in BACKENDS.items()
+        if importlib.util.find_spec(module) is not None
+    ]
+
+
+def precision_backend(backend: str, precision: str) -> str:
+    """``backend`` if it supports ``precision``, else the first installed backend
+    that does (``ValueError`` if none)."""
+    if precision in PRECISIONS[backend]:
+        return backend
+    for candidate in available_backends():
+        if precision in PRECISIONS[candidate]:
+            return candidate
+    raise ValueError(f"Ningún backend instalado soporta la precisión {precision}")
+
+
+def export_path(
+    weights: str, backend: str, imgsz: int = 640, precision: str = "fp32"
+) -> str:
+    """Path of the cached export of ``weights`` for ``backend``, ``imgsz`` and
+    ``precision``."""
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    name = f"{stem}_{weights_hash(weights)}_{backend}_{imgsz}"
+    if precision != "fp32":
+        name += f"_{precision}"
+    if backend == "onnx":
+        name += ".onnx"
+    return os.path.join(EXPORT_FOLDER, name)
+
+
+def calibration_images(folder: str = CALIBRATION_FOLDER, limit: int = 100) -> List[str]:
+    """Captured frames (searched recursively, result images excluded) used to
+    calibrate the int8 variants, evenly sampled up to ``limit``."""
+    images = sorted(
+        os.path.join(root, f)
+        for root, _, files in os.walk(folder)
+        for f in files
+        if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+        and "result" not in f.lower()
+    )
+    if len(images) > limit:
+        images = [images[i] for i in np.linspace(0, len(images) - 1, limit).astype(int)]
+    return images
+
+
+def _calibration_dataset(weights: str, images: List[str]) -> str:
+    """Writes the dataset YAML that ultralytics uses to calibrate int8 exports."""
+    os.makedirs(EXPORT_FOLDER, exist_ok=True)
+    list_path = os.path.abspath(os.path.join(EXPORT_FOLDER, "calibration.txt"))
+    with open(list_path, "w", encoding="utf-8") as list_file:
+        list_file.write("\n".join(os.path.abspath(image) for image in images))
+    from ultralytics import YOLO
+
+    names = YOLO(weights).names
+    yaml_path = os.path.join(EXPORT_FOLDER, "calibration.yaml")
+    with open(yaml_path, "w", encoding="utf-8") as yaml_file:
+        yaml_file.write(f"train: {list_path}\nval: {list_path}\nnames:\n")
+        for index, name in names.items():
+            yaml_file.write(f"  {index}: {json.dumps(name)}\n")
+    return yaml_path
+
+
+def _quantize_onnx(fp32_path: str, path: str, images: List[str], imgsz: int) -> None:
+    """Static int8 quantization of an ONNX export with ONNX Runtime, calibrated on
+    the letterboxed frames. Only the convolutions are quantized; the detection head
+    (concat, sigmoid, box decoding) stays in float to keep the boxes accurate."""
+    import cv2
+    import onnx
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    from utils.detection import letterbox  # utils.detection imports this module
+
+    input_name = onnx.load(fp32_path).graph.input[0].name
+
+    class FrameReader(CalibrationDataReader):
+        """Feeds the calibration frames preprocessed like ultralytics does."""
+
+        def __init__(self) -> None:
+            self.paths = iter(images)
+
+        def get_next(self):
+            for image_path in self.paths:
+                image = cv2.imread(image_path)
+                if image is None:
+                    continue
+                padded, _, _ = letterbox(image, imgsz)
+                blob = padded[:, :, ::-1].transpose(2, 0, 1)[None] / 255.0
+                return {input_name: np.ascontiguousarray(blob, dtype=np.float32)}
+            return None
+
+    quantize_static(
+        fp32_path,
+        path,
+        FrameReader(),
+        quant_format=QuantFormat.QDQ,
+        op_types_to_quantize=["Conv"],
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    # Keep the ultralytics metadata (names, stride, imgsz) used by AutoBackend
+    fp32_model, quantized = onnx.load(fp32_path), onnx.load(path)
+    onnx.helper.set_model_props(
+        quantized, {prop.key: prop.value for prop in fp32_model.metadata_props}
+    )
+    onnx.save(quantized, path)
+
+
+def export_model(
+    weights: str,
+    backend: str,
+    imgsz: int = 640,
+    precision: str = "fp32",
+    calibration_folder: str = CALIBRATION_FOLDER,
+) -> str:
+    """Returns the cached export of the model, exporting it on the first call.
+
+    Args:
+        weights (str): Path of the ``.pt`` weights.
+        backend (str): ``"pytorch"``, ``"ncnn"``, ``"onnx"`` or ``"openvino"``.
+        imgsz (int): Input size of the export.
+        precision (str): ``"fp32"``, ``"fp16"`` or ``"int8"`` (see ``PRECISIONS``).
+        calibration_folder (str): Frames used to calibrate the int8 variants.
+
+    Returns:
+        str: Path to load with ``YOLO`` (the weights themselves for ``pytorch``).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend no soportado: {backend} {tuple(BACKENDS)}")
+    if precision not in PRECISIONS[backend]:
+        raise ValueError(
+            f"Precisión {precision} no soportada por {backend}: {PRECISIONS[backend]}"
+        )
+    if backend == "pytorch":
+        return weights
+
+    path = export_path(weights, backend, imgsz, precision)
+    if os.path.exists(path):
+        return path
+
+    print(f"Exportando {weights} a {backend} {precision} (imgsz={imgsz})...")
+    os.makedirs(EXPORT_FOLDER, exist_ok=True)
+    options = {"format": BACKENDS[backend][0], "imgsz": imgsz}
+    if precision == "fp16":
+        options["half"] = True
+    elif precision == "int8":
+        images = calibration_images(calibration_folder)
+        if not images:
+            raise ValueError(f"No hay imágenes de calibración en {calibration_folder}")
+        if backend == "onnx":
+            _quantize_onnx(export_model(weights, "onnx", imgsz), path, images, imgsz)
+            return path
+        options.update(int8=True, data=_calibration_dataset(weights, images))
+
+    from ultralytics import YOLO
+
+    exported = YOLO(weights).export(**options)
+    shutil.move(str(exported), path)
+    return path
+
+
+def load_model(
+    weights: str, backend: str = "pytorch", imgsz: int = 640, precision: str = "fp32"
+) -> "YOLO":
+    """Loads the model with the given backend and precision from the export cache."""
+    from ultralytics import YOLO
+
+    return YOLO(export_model(weights, backend, imgsz, precision), task="detect")
+
+
+def benchmark_backends(
+    weights: str,
+    imgsz: int = 640,
+    backends: Optional[List[str]] = None,
+    runs: int = 10,
+) -> Dict[str, float]:
+    """Times the inference of every backend on a black frame.
+
+    Returns:
+        Dict[str, float]: Median latency in milliseconds per backend (backends that
+        fail to export or load are skipped).
+    """
+    frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    timings = {}
+    for backend in backends or available_backends():
+        try:
+            model = load_model(weights, backend, imgsz)
+            model(frame, imgsz=imgsz, verbose=False)  # Warm-up
+            times = []
+            for _ in range(runs):
+                start_time = time.perf_counter()
+                model(frame, imgsz=imgsz, verbose=False)
+                times.append((time.perf_counter() - start_time) * 1000)
+        except Exception as e:  # A broken backend must not stop the selection
+            print(f"[ERROR] Backend {backend} no disponible: {e}")
+            continue
+        timings[backend] = float(np.median(times))
+        print(f"Backend {backend}: {timings[backend]:.1f} ms")
+    return timings
+
+
+def _choice_key(weights: str, imgsz: int) -> str:
+    return f"{weights_hash(weights)}:{imgsz}:{platform.machine()}"
+
+
+def select_backend(weights: str, imgsz: int = 640, runs: int = 10) -> str:
+    """Returns the fastest backend for the weights on this machine.
+
+    The result of the micro-benchmark is persisted in ``CHOICE_FILE``; later starts
+    read it without running the benchmark again.
+    """
+    choices = {}
+    if os.path.isfile(CHOICE_FILE):
+        with open(CHOICE_FILE, encoding="utf-8") as choice_file:
+            choices = json.load(choice_file)
+    key = _choice_key(weights, imgsz)
+    if key in choices:
+        return choices[key]["backend"]
+
+    timings = benchmark_backends(weights, imgsz, runs=runs)
+    backend = min(timings, key=timings.get) if timings else "pytorch"
+    choices[key] = {"backend": backend, "timings_ms": timings}
+    os.makedirs(os.path.dirname(CHOICE_FILE), exist_ok=True)
+    with open(CHOICE_FILE, "w", encoding="utf-8") as choice_file:
+        json.dump(choices, choice_file, indent=2)
+    print(f"Backend seleccionado: {backend}")
+    return backend
@@ -0,0 +1,130 @@
+"""
+This module contains the client-side registry of YOLO models. Models are loaded (and
+exported to NCNN on the Raspberry Pi) once, warmed up with a dummy frame and shared by
+every frame and inference mode of the process.
+
+``preload_model`` starts the loading on a background thread so the capture does not
+wait for it, and ``model_ready`` tells the schedulers whether the local path can be
+used without blocking.
+"""
+
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import numpy as np
+
+from utils.detection import init_model
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+ModelKey = Tuple[str, bool, Optional[str], str]
+
+
+class ModelRegistry:
+    """Loads each ``(size, rpi, backend, precision)`` model once and shares it.
+
+    Args:
+        warmup_size (int): Side of the black frame used to warm up the model after
+            loading it (0 disables the warm-up).
+    """
+
+    def __init__(self, warmup_size: int = 640) -> None:
+        self.warmup_size = warmup_size
+        self._models: Dict[ModelKey, "YOLO"] = {}
+        self._errors: Dict[ModelKey, Exception] = {}
+        self._ready: Dict[ModelKey, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, key: ModelKey) -> None:
+        size, rpi, backend, precision = key
+        try:
+            model = init_model(size=size, rpi=rpi, backend=backend, precision=precision)
+            if self.warmup_size:
+                frame = np.zeros((self.warmup_size, self.warmup_size, 3), dtype=np.uint8)
+                model(frame, verbose=False)
+            self._models[key] = model
+            print(f"Modelo yolo11{size} listo (rpi={rpi})")
+        except Exception as e:  # The error is raised again to the caller of get()
+            print(f"[ERROR] No se pudo cargar el modelo yolo11{size}: {e}")
+            self._errors[key] = e
+        finally:
+            self._ready[key].set()
+
+    def _start(self, key: ModelKey, background: bool) -> threading.Event:
+        """Starts loading ``key`` unless it is already loading or loaded."""
+        with self._lock:
+            if key in self._ready and key not in self._errors:
+                return self._ready[key]
+            self._errors.pop(key, None)
+            self._ready[key] = threading.Event()
+        if background:
+            threading.Thread(
+                target=self._load, args=(key,), name=f"preload-{key[0]}", daemon=True
+            ).start()
+        else:
+            self._load(key)
+        return self._ready[key]
+
+    def preload(
+        self, size: str = "n", rpi: bool = False, backend: str = None, precision: str = "fp32"
+    ) -> None:
+        """Loads the model on a background thread."""
+        self._start((size, rpi, backend, precision), background=True)
+
+    def ready(
+        self, size: str = "n", rpi: bool = False, backend: str = None, precision: str = "fp32"
+    ) -> bool:
+        """True if the model is loaded and warmed up."""
+        return (size, rpi, backend, precision) in self._models
+
+    def get(
+        self,
+        size: str = "n",
+        rpi: bool = False,
+        timeout: Optional[float] = None,
+        backend: str = None,
+        precision: str = "fp32",
+    ) -> "YOLO":
+        """Returns the model, loading it (or waiting for the preload) if needed.
+
+        Raises:
+            TimeoutError: If the model is not ready after ``timeout`` seconds.
+        """
+        key = (size, rpi, backend, precision)
+        if key in self._models:
+            return self._models[key]
+        event = self._start(key, background=timeout is not None)
+        if not event.wait(timeout):
+            raise TimeoutError(f"El modelo yolo11{size} no está listo")
+        if key in self._errors:
+            raise self._errors[key]
+        return self._models[key]
+
+
+registry = ModelRegistry()
+
+
+def preload_model(
+    size: str = "n", rpi: bool = False, backend: str = None, precision: str = "fp32"
+) -> None:
+    """Starts loading the model in the shared registry on a background thread."""
+    registry.preload(size, rpi, backend, precision)
+
+
+def model_ready(
+    size: str = "n", rpi: bool = False, backend: str = None, precision: str = "fp32"
+) -> bool:
+    """True if the model of the shared registry is loaded and warmed up."""
+    return registry.ready(size, rpi, backend, precision)
+
+
+def get_model(
+    size: str = "n",
+    rpi: bool = False,
+    timeout: Optional[float] = None,
+    backend: str = None,
+    precision: str = "fp32",
+) -> "YOLO":
+    """Returns the model of the shared registry (see ``ModelRegistry.get``)."""
+    return registry.get(size, rpi, timeout, backend, precision)
@@ -0,0 +1,184 @@
+"""
+This module contains an in-process network prober that measures, on a background
+thread, the TCP connect time and the application-level round-trip time to the
+detection server, and estimates the upload bandwidth from the recent transfers.
+
+The smoothed values are read without blocking, so the capture loop never waits on
+the network to decide where to run the inference.
+"""
+
+import collections
+import socket
+import threading
+import time
+from typing import Deque, Dict, Optional, Tuple
+
+import requests
+
+PING_PATH = "/ping"
+
+
+class NetworkProbe:
+    """Background prober of the link with the detection server.
+
+    Every ``interval`` seconds it opens a TCP connection to the server (connect
+    time) and sends ``GET /ping`` (application-level RTT, server handling included).
+    Both values are smoothed with an EWMA. The upload bandwidth is estimated from the
+    transfers recorded with ``record_transfer``.
+
+    Args:
+        server_ip (str): Address of the detection server.
+        port (int): Port of the detection server.
+        interval (float): Seconds between probes.
+        alpha (float): Weight of the newest sample in the EWMA.
+        timeout (float): Timeout of each probe in seconds.
+        window (int): Number of recent transfers used to estimate the bandwidth.
+    """
+
+    def __init__(
+        self,
+        server_ip: str,
+        port: int = 8000,
+        interval: float = 2.0,
+        alpha: float = 0.3,
+        timeout: float = 2.0,
+        window: int = 10,
+    ) -> None:
+        self.server_ip = server_ip
+        self.port = port
+        self.interval = interval
+        self.alpha = alpha
+        self.timeout = timeout
+
+        self.connect_time: Optional[float] = None
+        self.rtt: Optional[float] = None
+        self.failures = 0
+        self.last_probe: Optional[float] = None
+        self._transfers: Deque[Tuple[int, float]] = collections.deque(maxlen=window)
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._first_probe = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _smooth(self, previous: Optional[float], value: float) -> float:
+        if previous is None:
+            return value
+        return self.alpha * value + (1 - self.alpha) * previous
+
+    def probe_once(self) -> None:
+        """Measures the connect time and the RTT once and updates the estimates."""
+        try:
+            start_time = time.perf_counter()
+            with socket.create_connection(
+                (self.server_ip, self.port), timeout=self.timeout
+            ):
+                connect_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            response = self._session.get(
+                f"http://{self.server_ip}:{self.port}{PING_PATH}", timeout=self.timeout
+            )
+            rtt = time.perf_counter() - start_time
+            response.raise_for_status()
+        except (OSError, requests.RequestException):
+            with self._lock:
+                self.failures += 1
+            return
+        finally:
+            self.last_probe = time.time()
+            self._first_probe.set()
+
+        with self._lock:
+            self.connect_time = self._smooth(self.connect_time, connect_time)
+            self.rtt = self._smooth(self.rtt, rtt)
+            self.failures = 0
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            self.probe_once()
+            self._stop_event.wait(self.interval)
+
+    def start(self) -> "NetworkProbe":
+        """Starts the background thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name=f"probe-{self.server_ip}", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the background thread."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+        self._session.close()
+
+    def wait_first_probe(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the first probe finished (or ``timeout`` seconds passed)."""
+        return self._first_probe.wait(timeout)
+
+    def record_transfer(self, num_bytes: int, seconds: float) -> None:
+        """Records the size and the network time of a finished upload."""
+        if num_bytes > 0 and seconds > 0:
+            with self._lock:
+                self._transfers.append((num_bytes, seconds))
+
+    @property
+    def bandwidth(self) -> Optional[float]:
+        """Estimated upload bandwidth in bytes per second, None without samples."""
+        with self._lock:
+            if not self._transfers:
+                return None
+            total_bytes = sum(size for size, _ in self._transfers)
+            total_time = sum(seconds for _, seconds in self._transfers)
+        return total_bytes / total_time
+
+    @property
+    def rtt_ms(self) -> Optional[float]:
+        """Smoothed application-level RTT in milliseconds, None if the server has not
+        answered yet or the last probe failed."""
+        with self._lock:
+            if self.rtt is None or self.failures:
+                return None
+            return self.rtt * 1000
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """Returns the current estimates without blocking."""
+        with self._lock:
+            connect_time = self.connect_time
+            failures = self.failures
+        return {
+            "rtt_ms": self.rtt_ms,
+            "connect_ms": None if connect_time is None else connect_time * 1000,
+            "bandwidth": self.bandwidth,
+            "failures": failures,
+        }
+
+
+_probes: Dict[str, NetworkProbe] = {}
+_probes_lock = threading.Lock()
+
+
+def get_probe(server_ip: str, port: int = 8000, wait: float = 2.0) -> NetworkProbe:
+    """Returns the running probe of a server, starting it on first use.
+
+    The first call waits up to ``wait`` seconds for the first measurement so the
+    first frame already has an RTT estimate.
+    """
+    key = f"{server_ip}:{port}"
+    with _probes_lock:
+        probe = _probes.get(key)
+        if probe is None:
+            probe = _probes[key] = NetworkProbe(server_ip, port).start()
+            probe.wait_first_probe(wait)
+    return probe
+
+
+def record_transfer(server_ip: str, num_bytes: int, seconds: float, port: int = 8000) -> None:
+    """Feeds an upload to the probe of the server, if one is running."""
+    probe = _probes.get(f"{server_ip}:{port}")
+    if probe is not None:
+        probe.record_transfer(num_bytes, seconds)
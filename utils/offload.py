@@ -0,0 +1,160 @@
+"""
+This module contains a pipelined client to keep several uploads in flight while the
+camera keeps capturing.
+"""
+
+import collections
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+DELIVERY_MODES = ("ordered", "latest")
+
+
+class PipelinedUploader:
+    """Keeps up to ``max_in_flight`` uploads running at the same time.
+
+    Frames are submitted in capture order and results are delivered either in the
+    same order (``"ordered"``) or only when they are newer than the last delivered
+    result (``"latest"``). The number of frames waiting or in flight is bounded by
+    ``max_queue``.
+
+    Args:
+        upload_function (callable): Function that performs the upload, for example
+            ``utils.detection.upload_image``.
+        max_in_flight (int): Number of uploads running concurrently.
+        delivery (str): ``"ordered"`` or ``"latest"``.
+        max_queue (int, optional): Maximum number of pending frames. Defaults to
+            ``2 * max_in_flight``.
+    """
+
+    def __init__(
+        self,
+        upload_function: Callable[..., Any],
+        max_in_flight: int = 4,
+        delivery: str = "ordered",
+        max_queue: Optional[int] = None,
+    ) -> None:
+        if delivery not in DELIVERY_MODES:
+            raise ValueError(f"Modo de entrega no válido: {delivery} {DELIVERY_MODES}")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight debe ser mayor o igual a 1")
+
+        self.upload_function = upload_function
+        self.max_in_flight = max_in_flight
+        self.delivery = delivery
+        self.max_queue = max(max_queue or 2 * max_in_flight, max_in_flight)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="uploader"
+        )
+        self._pending: Deque[Tuple[int, Any, Future]] = collections.deque()
+        self._ready: List[Tuple[Any, Any]] = []
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._last_delivered = -1
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, frame_id: Any, *args, **kwargs) -> bool:
+        """Submits a new upload.
+
+        In ``"ordered"`` mode the call blocks until there is room in the queue. In
+        ``"latest"`` mode the oldest frame that has not started is cancelled instead;
+        if every pending frame is already running the new frame is dropped.
+
+        Args:
+            frame_id: Identifier returned together with the result (e.g. image path).
+            *args: Positional arguments for the upload function.
+            **kwargs: Keyword arguments for the upload function.
+
+        Returns:
+            bool: True if the frame was queued, False if it was dropped.
+        """
+        self._collect()
+        while len(self._pending) >= self.max_queue:
+            if self.delivery == "ordered":
+                self._pending[0][2].exception()  # Wait for the oldest upload
+                self._collect()
+            elif not self._cancel_oldest_waiting():
+                self.dropped += 1
+                return False
+
+        with self._lock:
+            sequence = self._sequence
+            self._sequence += 1
+            future = self._executor.submit(self.upload_function, *args, **kwargs)
+            self._pending.append((sequence, frame_id, future))
+        return True
+
+    def _cancel_oldest_waiting(self) -> bool:
+        """Cancels the oldest pending upload that has not started yet."""
+        with self._lock:
+            for entry in self._pending:
+                if entry[2].cancel():
+                    self._pending.remove(entry)
+                    self.dropped += 1
+                    return True
+        return False
+
+    def poll(self) -> List[Tuple[Any, Any]]:
+        """Returns the results that are ready without blocking.
+
+        Returns:
+            List[Tuple[Any, Any]]: ``(frame_id, result)`` pairs. Failed uploads are
+            returned with the raised exception as result.
+        """
+        self._collect()
+        with self._lock:
+            ready, self._ready = self._ready, []
+        return ready
+
+    def _collect(self) -> None:
+        """Moves finished uploads from the pending queue to the ready list."""
+        with self._lock:
+            if self.delivery == "ordered":
+                while self._pending and self._pending[0][2].done():
+                    self._ready.append(self._deliver(*self._pending.popleft()))
+                return
+            for entry in [e for e in self._pending if e[2].done()]:
+                self._pending.remove(entry)
+                sequence, frame_id, future = entry
+                if sequence > self._last_delivered:
+                    self._ready.append(self._deliver(sequence, frame_id, future))
+                else:
+                    self.dropped += 1
+
+    def _deliver(self, sequence: int, frame_id: Any, future: Future) -> Tuple[Any, Any]:
+        """Extracts the result of a finished upload."""
+        self._last_delivered = max(self._last_delivered, sequence)
+        error = future.exception()
+        if error is not None:
+            self.failed += 1
+            return frame_id, error
+        return frame_id, future.result()
+
+    def drain(self) -> List[Tuple[Any, Any]]:
+        """Waits for every pending upload and returns the remaining results."""
+        with self._lock:
+            futures = [entry[2] for entry in self._pending]
+        for future in futures:
+            if not future.cancelled():
+                future.exception()
+        return self.poll()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of uploads queued or running."""
+        return len(self._pending)
+
+    def close(self) -> List[Tuple[Any, Any]]:
+        """Drains the pending uploads and stops the worker threads."""
+        results = self.drain()
+        self._executor.shutdown(wait=True)
+        return results
+
+    def __enter__(self) -> "PipelinedUploader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,516 @@
+"""
+This module contains the capture -> infer -> sink pipeline engine shared by every
+inference mode.
+
+A pipeline is a source of frames followed by a list of stages. Each stage receives a
+``Frame`` and returns it (possibly modified), ``None`` to drop it, or a list of frames
+(asynchronous stages may return frames submitted earlier). Stages are connected by
+bounded queues and, when ``threaded`` is True, each one runs on its own thread. The
+time spent in every stage is measured and reported at the end of the run.
+"""
+
+import collections
+import os
+import queue
+import threading
+import time
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Union
+
+import cv2
+import numpy as np
+
+from utils.cpu_affinity import current_cpus, pin_current_thread
+from utils.metrics import get_metrics_sink
+
+StageOutput = Union[None, "Frame", List["Frame"]]
+
+_STOP = object()
+
+
+class Frame:
+    """A captured frame travelling through the pipeline."""
+
+    __slots__ = (
+        "index",
+        "timestamp",
+        "image",
+        "image_path",
+        "result",
+        "timings",
+        "meta",
+    )
+
+    def __init__(self, index: int, image: np.ndarray, timestamp: float = None) -> None:
+        self.index = index
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.image = image
+        self.image_path: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.timings: Dict[str, float] = {}
+        self.meta: Dict[str, Any] = {}
+
+
+class Stage:
+    """Base class of the pipeline stages.
+
+    ``role`` (``"inference"`` or ``"io"``) selects the CPUs of the stage thread when
+    the pipeline is given a CPU affinity per role.
+    """
+
+    name = "stage"
+    role = "io"
+
+    def start(self) -> None:
+        """Called on the thread of the stage before its first frame."""
+
+    def process(self, frame: Frame) -> StageOutput:
+        """Processes a frame. Returns the frame, None to drop it or a list of frames."""
+        return frame
+
+    def flush(self) -> List[Frame]:
+        """Returns the frames still held by the stage when the source is exhausted."""
+        return []
+
+    def close(self) -> None:
+        """Releases the resources of the stage."""
+
+
+class StageStats:
+    """Per-stage timing statistics over the last ``window`` frames."""
+
+    def __init__(self, name: str, window: int = 1000) -> None:
+        self.name = name
+        self.count = 0
+        self.dropped = 0
+        self.total_time = 0.0
+        self.times: Deque[float] = collections.deque(maxlen=window)
+
+    def add(self, elapsed: float) -> None:
+        """Records the time spent on one frame."""
+        self.count += 1
+        self.total_time += elapsed
+        self.times.append(elapsed)
+
+    def percentile(self, q: float) -> float:
+        """Percentile ``q`` (0-100) of the recent stage times in seconds."""
+        return float(np.percentile(self.times, q)) if self.times else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Returns the statistics as a dictionary (times in milliseconds)."""
+        return {
+            "stage": self.name,
+            "count": self.count,
+            "dropped": self.dropped,
+            "mean_ms": self.total_time / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+        }
+
+
+# Sources
+
+
+class CameraSource:
+    """Reads frames from the camera for ``total_duration`` seconds."""
+
+    name = "camera"
+
+    def __init__(self, total_duration: float, device: int = 0) -> None:
+        self.total_duration = total_duration
+        self.device = device
+
+    def __iter__(self) -> Iterator[Frame]:
+        cap = cv2.VideoCapture(self.device)
+        if not cap.isOpened():
+            print("Error: No se puede abrir la cámara")
+            return
+        try:
+            start_time = time.time()
+            index = 0
+            while time.time() - start_time < self.total_duration:
+                ret, image = cap.read()
+                if not ret:
+                    print("Error: No se puede recibir frame (finalizando...)")
+                    break
+                yield Frame(index, image)
+                index += 1
+        finally:
+            cap.release()
+            print("Finalizando captura de fotos...")
+
+
+class FolderSource:
+    """Replays the images of a folder in name order (offline runs and benchmarks)."""
+
+    name = "folder"
+
+    def __init__(self, image_folder: str, limit: int = None, loops: int = 1) -> None:
+        self.image_paths = sorted(
+            os.path.join(image_folder, f)
+            for f in os.listdir(image_folder)
+            if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+            and "result" not in f.lower()
+        )[:limit]
+        self.loops = loops
+
+    def __iter__(self) -> Iterator[Frame]:
+        index = 0
+        for _ in range(self.loops):
+            for image_path in self.image_paths:
+                image = cv2.imread(image_path)
+                if image is None:
+                    print(f"[ERROR] No se pudo leer la imagen: {image_path}")
+                    continue
+                frame = Frame(index, image)
+                frame.meta["source_path"] = image_path
+                yield frame
+                index += 1
+
+
+# Generic stages
+
+
+class IntervalGate(Stage):
+    """Lets a frame through every ``interval`` seconds."""
+
+    name = "gate"
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._last_time: Optional[float] = None
+
+    def process(self, frame: Frame) -> StageOutput:
+        if self._last_time is None:
+            self._last_time = frame.timestamp
+        if frame.timestamp - self._last_time < self.interval:
+            return None
+        self._last_time = frame.timestamp
+        return frame
+
+
+class ElapsedTimeOverlay(Stage):
+    """Writes the elapsed capture time on the frame."""
+
+    name = "overlay"
+
+    def __init__(self) -> None:
+        self._start_time: Optional[float] = None
+
+    def process(self, frame: Frame) -> StageOutput:
+        if self._start_time is None:
+            self._start_time = frame.timestamp
+        cv2.putText(
+            frame.image,
+            f"Tiempo transcurrido: {int(frame.timestamp - self._start_time)}s",
+            (10, 30),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            1,
+            (0, 255, 0),
+            2,
+            cv2.LINE_AA,
+        )
+        return frame
+
+
+class SaveImage(Stage):
+    """Saves the frame in ``output_folder`` with a millisecond timestamp name."""
+
+    name = "save"
+
+    def __init__(self, output_folder: str, image_extension: str = "png") -> None:
+        self.output_folder = output_folder
+        self.image_extension = image_extension
+        os.makedirs(output_folder, exist_ok=True)
+
+    def process(self, frame: Frame) -> StageOutput:
+        timestamp = int(frame.timestamp * 1000)
+        image_path = os.path.join(
+            self.output_folder, f"photo_{timestamp}.{self.image_extension}"
+        )
+        cv2.imwrite(image_path, frame.image)
+        frame.image_path = image_path
+        print(f"Foto guardada en: {image_path}")
+        return frame
+
+
+class RemoveImage(Stage):
+    """Removes the saved image once the frame has been processed successfully."""
+
+    name = "remove"
+
+    def process(self, frame: Frame) -> StageOutput:
+        if isinstance(frame.result, Exception):
+            return frame
+        if frame.image_path and os.path.exists(frame.image_path):
+            os.remove(frame.image_path)
+        return frame
+
+
+class PrintResult(Stage):
+    """Prints a one-line summary of the result of each frame."""
+
+    name = "print"
+
+    def process(self, frame: Frame) -> StageOutput:
+        result = frame.result
+        if isinstance(result, Exception):
+            print(f"[ERROR] Frame {frame.index}: {result}")
+        elif result is not None:
+            detected = result.get("objects_detected", result.get("bounding_boxes", []))
+            place = result.get("detection_place", "")
+            print(f"Frame {frame.index} {place}: {len(detected)} objetos")
+        return frame
+
+
+class CsvSink(Stage):
+    """Appends one row per processed frame to a metrics file (CSV by default, or the
+    format of ``utils.metrics.set_metrics_format``).
+
+    ``write_result`` may also be called from other threads (e.g. results of spooled
+    frames that arrive later); the rows go through a buffered ``MetricsSink``, which
+    is thread safe, and each row keeps the original capture timestamp of its frame.
+    Closing the stage only flushes the buffer, because spooled results may still
+    arrive after the pipeline ends; the file is closed at exit.
+    """
+
+    name = "csv"
+    fieldnames = {
+        "timestamp": float,
+        "frame_index": int,
+        "image_path": str,
+        "detection_place": str,
+        "objects_detected": list,
+        "inference_time": float,
+        "latency": float,
+        "upload_size": int,
+        "imgsz": int,
+        "spooled": bool,
+    }
+
+    def __init__(self, csv_path: str) -> None:
+        self.metrics = get_metrics_sink(csv_path, self.fieldnames)
+        self.csv_path = self.metrics.path
+
+    def write_result(
+        self,
+        timestamp: float,
+        frame_index: int,
+        image_path: str,
+        result: Dict[str, Any],
+        spooled: bool = False,
+    ) -> None:
+        """Writes the result of one frame."""
+        self.metrics.write(
+            {
+                "timestamp": timestamp,
+                "frame_index": frame_index,
+                "image_path": image_path,
+                "detection_place": result.get("detection_place", ""),
+                "objects_detected": list(result.get("objects_detected", [])),
+                "inference_time": result.get("speed", {}).get("inference", 0.0),
+                "latency": result.get("latency"),
+                "upload_size": result.get("upload_size"),
+                "imgsz": result.get("imgsz"),
+                "spooled": spooled,
+            }
+        )
+
+    def process(self, frame: Frame) -> StageOutput:
+        result = frame.result
+        # Failed and spooled frames are written when (if) their result arrives
+        if isinstance(result, dict) and result.get("detection_place") != "spooled":
+            self.write_result(frame.timestamp, frame.index, frame.image_path, result)
+        return frame
+
+    def close(self) -> None:
+        self.metrics.flush()
+
+
+# Engine
+
+
+class Pipeline:
+    """Runs a source through a list of stages and measures each stage.
+
+    Args:
+        source (Iterable[Frame]): Frame source (``CameraSource``, ``FolderSource``).
+        stages (List[Stage]): Stages in processing order, sinks included.
+        threaded (bool): Run each stage on its own thread.
+        queue_size (int): Capacity of the queues between stages.
+        drop_when_full (bool): Drop new source frames when the first queue is full
+            instead of blocking the capture.
+        affinity (Dict[str, Iterable[int]], optional): CPUs of the ``"capture"``
+            (source), ``"inference"`` and ``"io"`` threads (threaded mode only).
+    """
+
+    def __init__(
+        self,
+        source: Iterable[Frame],
+        stages: List[Stage],
+        threaded: bool = True,
+        queue_size: int = 4,
+        drop_when_full: bool = True,
+        affinity: Dict[str, Iterable[int]] = None,
+    ) -> None:
+        self.source = source
+        self.stages = stages
+        self.threaded = threaded
+        self.queue_size = queue_size
+        self.drop_when_full = drop_when_full
+        self.affinity = affinity or {}
+        self.stats = {stage.name: StageStats(stage.name) for stage in stages}
+        self.source_stats = StageStats(getattr(source, "name", "source"))
+        self.frames_out = 0
+        self.elapsed_time = 0.0
+
+    def _run_stage(self, stage: Stage, frame: Frame) -> List[Frame]:
+        """Runs one stage on one frame and normalizes its output to a list."""
+        start_time = time.perf_counter()
+        try:
+            output = stage.process(frame)
+        except Exception as e:  # A failing frame must not stop the pipeline
+            print(f"[ERROR] Etapa '{stage.name}' frame {frame.index}: {e}")
+            output = None
+        elapsed = time.perf_counter() - start_time
+        frame.timings[stage.name] = frame.timings.get(stage.name, 0.0) + elapsed
+        stats = self.stats[stage.name]
+        stats.add(elapsed)
+        if output is None:
+            stats.dropped += 1
+            return []
+        return output if isinstance(output, list) else [output]
+
+    def _start_stage(self, stage: Stage) -> None:
+        try:
+            stage.start()
+        except Exception as e:  # The stage still runs with its defaults
+            print(f"[ERROR] Etapa '{stage.name}' al iniciar: {e}")
+
+    def _flush_stage(self, stage: Stage) -> List[Frame]:
+        try:
+            return stage.flush()
+        except Exception as e:
+            print(f"[ERROR] Etapa '{stage.name}' al finalizar: {e}")
+            return []
+
+    def _source_frames(self) -> Iterator[Frame]:
+        """Iterates the source measuring the time spent waiting for each frame."""
+        iterator = iter(self.source)
+        while True:
+            start_time = time.perf_counter()
+            try:
+                frame = next(iterator)
+            except StopIteration:
+                return
+            self.source_stats.add(time.perf_counter() - start_time)
+            yield frame
+
+    def run(self) -> List[Dict[str, Any]]:
+        """Runs the pipeline until the source is exhausted.
+
+        Returns:
+            List[Dict[str, Any]]: Per-stage statistics (see ``StageStats.as_dict``).
+        """
+        start_time = time.perf_counter()
+        try:
+            if self.threaded:
+                self._run_threaded()
+            else:
+                self._run_sequential()
+        finally:
+            for stage in self.stages:
+                stage.close()
+        self.elapsed_time = time.perf_counter() - start_time
+        return self.report()
+
+    def _run_sequential(self) -> None:
+        def push(frames: List[Frame], first_stage: int) -> None:
+            for position in range(first_stage, len(self.stages)):
+                frames = [
+                    out
+                    for frame in frames
+                    for out in self._run_stage(self.stages[position], frame)
+                ]
+                if not frames:
+                    return
+            self.frames_out += len(frames)
+
+        for stage in self.stages:
+            self._start_stage(stage)
+        for frame in self._source_frames():
+            push([frame], 0)
+        for position, stage in enumerate(self.stages):
+            push(self._flush_stage(stage), position + 1)
+
+    def _run_threaded(self) -> None:
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        last = len(self.stages) - 1
+
+        def emit(position: int, frames: List[Frame]) -> None:
+            if position == last:
+                self.frames_out += len(frames)
+                return
+            for frame in frames:
+                queues[position + 1].put(frame)
+
+        def worker(position: int) -> None:
+            stage = self.stages[position]
+            pin_current_thread(self.affinity.get(stage.role))
+            self._start_stage(stage)
+            while True:
+                item = queues[position].get()
+                if item is _STOP:
+                    emit(position, self._flush_stage(stage))
+                    if position != last:
+                        queues[position + 1].put(_STOP)
+                    return
+                emit(position, self._run_stage(stage, item))
+
+        threads = [
+            threading.Thread(target=worker, args=(i,), name=stage.name, daemon=True)
+            for i, stage in enumerate(self.stages)
+        ]
+        for thread in threads:
+            thread.start()
+
+        capture_cpus = self.affinity.get("capture")
+        main_cpus = current_cpus() if capture_cpus else None
+        pin_current_thread(capture_cpus)
+        try:
+            for frame in self._source_frames():
+                if not self.drop_when_full:
+                    queues[0].put(frame)
+                    continue
+                try:
+                    queues[0].put_nowait(frame)
+                except queue.Full:
+                    self.source_stats.dropped += 1
+        finally:
+            pin_current_thread(main_cpus)  # The caller thread gets its CPUs back
+            queues[0].put(_STOP)
+            for thread in threads:
+                thread.join()
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Prints and returns the per-stage statistics."""
+        rows = [self.source_stats.as_dict()] + [
+            self.stats[stage.name].as_dict() for stage in self.stages
+        ]
+        print("\n" + "=" * 66)
+        print(
+            f"{'Etapa':<14}{'Frames':>8}{'Descart.':>10}"
+            f"{'Media (ms)':>12}{'p50 (ms)':>11}{'p95 (ms)':>11}"
+        )
+        print("=" * 66)
+        for row in rows:
+            print(
+                f"{row['stage']:<14}{row['count']:>8}{row['dropped']:>10}"
+                f"{row['mean_ms']:>12.1f}{row['p50_ms']:>11.1f}{row['p95_ms']:>11.1f}"
+            )
+        print("=" * 66)
+        if self.elapsed_time:
+            print(
+                f"Frames completados: {self.frames_out} en {self.elapsed_time:.1f} s "
+                f"({self.frames_out / self.elapsed_time:.2f} FPS)"
+            )
+        return rows
@@ -0,0 +1,187 @@
+"""
+This module contains the functions to detect the regions of a frame that changed
+against a background model and to offload only those regions to the server.
+"""
+
+import base64
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.detection import encode_image, get_detection_filter, get_session
+
+Region = Tuple[int, int, int, int]
+
+
+def merge_regions(regions: List[Region]) -> List[Region]:
+    """Une los rectángulos (x1, y1, x2, y2) que se solapan hasta que no quede ninguno
+    solapado."""
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        result: List[Region] = []
+        for region in merged:
+            for i, other in enumerate(result):
+                if (
+                    region[0] <= other[2]
+                    and other[0] <= region[2]
+                    and region[1] <= other[3]
+                    and other[1] <= region[3]
+                ):
+                    result[i] = (
+                        min(region[0], other[0]),
+                        min(region[1], other[1]),
+                        max(region[2], other[2]),
+                        max(region[3], other[3]),
+                    )
+                    changed = True
+                    break
+            else:
+                result.append(region)
+        merged = result
+    return merged
+
+
+class BackgroundModel:
+    """Modelo de fondo por media móvil que detecta las regiones que cambiaron.
+
+    El modelo trabaja en escala de grises sobre una versión reducida del frame para
+    que el costo por frame sea bajo en la Raspberry Pi.
+
+    Args:
+        alpha (float): Tasa de aprendizaje de la media móvil del fondo.
+        threshold (int): Diferencia mínima de intensidad para marcar un píxel.
+        min_area (int): Área mínima (en píxeles del frame original) de una región.
+        padding (int): Margen en píxeles añadido alrededor de cada región.
+        downscale (int): Factor de reducción usado para comparar con el fondo.
+        full_frame_ratio (float): Si las regiones cubren más de esta fracción del
+            frame se envía el frame completo.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.05,
+        threshold: int = 25,
+        min_area: int = 400,
+        padding: int = 32,
+        downscale: int = 4,
+        full_frame_ratio: float = 0.5,
+    ) -> None:
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_area = min_area
+        self.padding = padding
+        self.downscale = downscale
+        self.full_frame_ratio = full_frame_ratio
+        self._background: Optional[np.ndarray] = None
+
+    def apply(self, frame: np.ndarray) -> Optional[List[Region]]:
+        """Compara el frame con el fondo, actualiza el fondo y retorna las regiones
+        que cambiaron.
+
+        Args:
+            frame (np.ndarray): Frame BGR.
+
+        Returns:
+            Optional[List[Region]]: Regiones (x1, y1, x2, y2) con margen en
+            coordenadas del frame. Lista vacía si no hubo cambios y None si se debe
+            enviar el frame completo (primer frame o cambios extensos).
+        """
+        height, width = frame.shape[:2]
+        small = cv2.resize(
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+            (width // self.downscale, height // self.downscale),
+            interpolation=cv2.INTER_AREA,
+        )
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+
+        if self._background is None:
+            self._background = small.astype(np.float32)
+            return None
+
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self._background))
+        cv2.accumulateWeighted(small, self._background, self.alpha)
+        _, mask = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        mask = cv2.dilate(mask, None, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        regions = []
+        for contour in contours:
+            x, y, w, h = (v * self.downscale for v in cv2.boundingRect(contour))
+            if w * h < self.min_area:
+                continue
+            regions.append(
+                (
+                    max(x - self.padding, 0),
+                    max(y - self.padding, 0),
+                    min(x + w + self.padding, width),
+                    min(y + h + self.padding, height),
+                )
+            )
+        regions = merge_regions(regions)
+
+        changed_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+        if changed_area > self.full_frame_ratio * width * height:
+            return None
+        return regions
+
+
+def upload_changed_regions(
+    image_path: str,
+    regions: List[Region],
+    server_ip: str = None,
+    encoding: str = "jpg",
+    quality: int = 90,
+    timeout: float = 120,
+) -> Dict[str, Any]:
+    """Envía al servidor solo los recortes de las regiones que cambiaron, con su
+    desplazamiento en el frame, y retorna las detecciones en coordenadas del frame.
+    """
+    if server_ip is None:
+        server_ip = "172.20.10.10"
+    image = cv2.imread(image_path)
+    if image is None:
+        raise FileNotFoundError(f"[CLIENT ERROR] No se pudo leer la imagen: {image_path}")
+
+    crops = []
+    bytes_sent = 0
+    for x1, y1, x2, y2 in regions:
+        encoded = encode_image(image[y1:y2, x1:x2], encoding, quality)
+        bytes_sent += len(encoded)
+        crops.append(
+            {
+                "offset": [x1, y1],
+                "image_encoded": base64.b64encode(encoded).decode("ascii"),
+            }
+        )
+
+    headers = {
+        "Content-type": "application/json",
+        "X-File-Name": os.path.basename(image_path),
+        **get_detection_filter().headers(),
+    }
+    data = {"crops": crops, "encoding": encoding}
+
+    print(f"[CLIENT] Enviando {len(crops)} regiones ({bytes_sent} bytes) al servidor...")
+    start_time = time.perf_counter()
+    url = f"http://{server_ip}:8000/"
+    response = get_session().post(url, headers=headers, json=data, timeout=timeout)
+    if response.status_code != 200:
+        print(f"[CLIENT ERROR] Respuesta inesperada: {response.status_code} - {response.text}")
+        raise RuntimeError("Error in server response.")
+
+    response_data = response.json()
+    result_data = response_data.get("results_data", {})
+    result_data.update(
+        {
+            "bounding_boxes": response_data.get("bounding_boxes", []),
+            "regions": [list(region) for region in regions],
+            "upload_size": bytes_sent,
+            "latency": time.perf_counter() - start_time,
+        }
+    )
+    return result_data
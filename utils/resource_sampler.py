@@ -0,0 +1,182 @@
+"""
+This module contains a long-lived sampler of the resources used by the client: RSS of
+the process and its children, CPU time, per-core usage and system totals, recorded
+into a ring buffer by one background thread at a fixed rate.
+
+Callers mark the start and the end of a prediction to get its exact aggregates: the
+CPU time and the per-core usage come from the counters read at both marks (no
+blocking ``psutil.cpu_percent(interval=...)`` call), and the memory peak and mean
+come from the samples recorded in between.
+"""
+
+import collections
+import os
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional
+
+import psutil
+
+
+def _total_time(times: Any) -> float:
+    """Sum of the CPU times without ``guest`` and ``guest_nice``, which Linux already
+    counts in ``user`` and ``nice`` (as ``psutil.cpu_percent`` does)."""
+    return sum(times) - getattr(times, "guest", 0.0) - getattr(times, "guest_nice", 0.0)
+
+
+def _busy_fractions(before: List[Any], after: List[Any]) -> List[float]:
+    """Busy fraction of each core between two ``psutil.cpu_times(percpu=True)``."""
+    fractions = []
+    for start, end in zip(before, after):
+        total = _total_time(end) - _total_time(start)
+        idle = (end.idle - start.idle) + (
+            getattr(end, "iowait", 0.0) - getattr(start, "iowait", 0.0)
+        )
+        fractions.append(min(max(1.0 - idle / total, 0.0), 1.0) if total > 0 else 0.0)
+    return fractions
+
+
+class ResourceSampler:
+    """Samples the resources of the process and the system on a background thread.
+
+    Args:
+        interval (float): Seconds between samples.
+        window (int): Samples kept in the ring buffer.
+        include_children (bool): Add the RSS and CPU time of the child processes
+            (e.g. ffmpeg or a camera helper).
+    """
+
+    def __init__(
+        self, interval: float = 0.1, window: int = 3000, include_children: bool = True
+    ) -> None:
+        self.interval = interval
+        self.include_children = include_children
+        self.samples: Deque[Dict[str, Any]] = collections.deque(maxlen=window)
+        self._process = psutil.Process(os.getpid())
+        self._sequence = 0
+        self._last_percpu = psutil.cpu_times(percpu=True)
+        self._last_cpu_time = self._cpu_time()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _cpu_time(self) -> float:
+        """User + system CPU seconds of the process (and its finished children)."""
+        times = self._process.cpu_times()
+        cpu_time = times.user + times.system
+        if self.include_children:
+            cpu_time += times.children_user + times.children_system
+        return cpu_time
+
+    def _rss(self) -> Dict[str, int]:
+        rss = self._process.memory_info().rss
+        children_rss = 0
+        if self.include_children:
+            for child in self._process.children(recursive=True):
+                try:
+                    children_rss += child.memory_info().rss
+                except psutil.Error:  # The child finished meanwhile
+                    continue
+        return {"rss": rss, "children_rss": children_rss}
+
+    def sample(self) -> Dict[str, Any]:
+        """Records one sample (called by the thread, or directly without it)."""
+        now = time.monotonic()
+        percpu = psutil.cpu_times(percpu=True)
+        cpu_time = self._cpu_time()
+        memory = psutil.virtual_memory()
+        with self._lock:
+            per_core = _busy_fractions(self._last_percpu, percpu)
+            record = {
+                "sequence": self._sequence,
+                "time": now,
+                "timestamp": time.time(),
+                **self._rss(),
+                "process_cpu_time": cpu_time - self._last_cpu_time,
+                "per_core": per_core,
+                "system_cpu": sum(per_core) / len(per_core) if per_core else 0.0,
+                "system_memory": memory.percent / 100.0,
+                "system_available": memory.available,
+            }
+            self._sequence += 1
+            self._last_percpu = percpu
+            self._last_cpu_time = cpu_time
+            self.samples.append(record)
+        return record
+
+    def start(self) -> "ResourceSampler":
+        """Starts the sampling thread (once)."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="resource-sampler", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the sampling thread."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def mark_start(self) -> Dict[str, Any]:
+        """Returns the mark of the start of a measured section."""
+        with self._lock:
+            sequence = self._sequence
+        return {
+            "sequence": sequence,
+            "time": time.monotonic(),
+            "percpu": psutil.cpu_times(percpu=True),
+            "cpu_time": self._cpu_time(),
+        }
+
+    def mark_end(self, mark: Dict[str, Any]) -> Dict[str, Any]:
+        """Aggregates of the resources used since ``mark_start``.
+
+        Returns:
+            Dict[str, Any]: ``duration`` (s), ``process_cpu_time`` (s), ``process_cpu``
+            (cores used on average), ``per_core`` and ``system_cpu`` (busy fractions),
+            ``rss_peak``/``rss_end`` (bytes, process + children), ``system_memory``
+            (mean fraction) and ``system_memory_end``, and the number of ``samples``.
+        """
+        duration = time.monotonic() - mark["time"]
+        cpu_time = self._cpu_time() - mark["cpu_time"]
+        per_core = _busy_fractions(mark["percpu"], psutil.cpu_times(percpu=True))
+        end = self._rss()
+        end_memory = psutil.virtual_memory().percent / 100.0
+        with self._lock:
+            window = [s for s in self.samples if s["sequence"] >= mark["sequence"]]
+        rss_end = end["rss"] + end["children_rss"]
+        return {
+            "duration": duration,
+            "process_cpu_time": cpu_time,
+            "process_cpu": cpu_time / duration if duration > 0 else 0.0,
+            "per_core": per_core,
+            "system_cpu": sum(per_core) / len(per_core) if per_core else 0.0,
+            "rss_peak": max([s["rss"] + s["children_rss"] for s in window] + [rss_end]),
+            "rss_end": rss_end,
+            "system_memory": (
+                sum(s["system_memory"] for s in window) + end_memory
+            )
+            / (len(window) + 1),
+            "system_memory_end": end_memory,
+            "samples": len(window),
+        }
+
+
+_sampler: Optional[ResourceSampler] = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler(interval: float = 0.1) -> ResourceSampler:
+    """Returns the shared sampler of the process, started on first use."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = ResourceSampler(interval=interval).start()
+        return _sampler
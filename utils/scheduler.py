@@ -0,0 +1,330 @@
+"""
+This module contains a cost-model scheduler that decides, frame by frame, whether
+the inference runs on the Raspberry Pi, on the server or jointly (letterboxed upload).
+
+The scheduler keeps online estimates of every component of the latency of each path
+(local inference, upload time from the measured bandwidth, server queue wait and
+server inference) and routes each frame to the path with the lowest predicted
+latency, or to the path with the lowest Pi CPU time that meets a latency SLO.
+"""
+
+import collections
+import csv
+import os
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import numpy as np
+
+PATHS = ("local", "server", "joint")
+OBJECTIVES = ("latency", "cpu")
+
+
+class LatencyEstimator:
+    """Online estimate of a duration: EWMA plus a window of recent samples used for
+    quantiles.
+
+    Args:
+        alpha (float): Weight of the newest sample in the EWMA.
+        window (int): Number of recent samples kept for ``quantile``.
+    """
+
+    def __init__(self, alpha: float = 0.2, window: int = 50) -> None:
+        self.alpha = alpha
+        self.mean: Optional[float] = None
+        self.samples: Deque[float] = collections.deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        """Adds a sample."""
+        value = max(float(value), 0.0)
+        self.mean = value if self.mean is None else (
+            self.alpha * value + (1 - self.alpha) * self.mean
+        )
+        self.samples.append(value)
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Quantile ``q`` (0-1) of the recent samples, None without samples."""
+        if not self.samples:
+            return None
+        return float(np.quantile(self.samples, q))
+
+    def estimate(self, q: Optional[float] = None) -> Optional[float]:
+        """EWMA when ``q`` is None, otherwise the quantile ``q``."""
+        return self.mean if q is None else self.quantile(q)
+
+
+class OffloadScheduler:
+    """Chooses the inference path of each frame from online latency estimates.
+
+    Predicted latency of each path:
+
+    - ``local``: local inference time.
+    - ``server``: Pi-side time + image bytes / bandwidth + server queue wait +
+      server inference.
+    - ``joint``: Pi-side time (letterbox, encoding) + letterboxed bytes / bandwidth +
+      server queue wait + server inference.
+
+    The first frame of each path only warms it up (model loading, connection setup)
+    and is not used for the estimates. Paths without samples are tried first, and
+    every ``explore_every`` decisions the path observed least recently is chosen so
+    its estimates do not go stale.
+
+    Args:
+        paths (List[str]): Available paths (``local``, ``server``, ``joint``).
+        objective (str): ``"latency"`` (lowest predicted latency) or ``"cpu"``
+            (lowest Pi CPU time among the paths that meet ``slo``).
+        slo (float): Latency objective in seconds, used by the ``cpu`` objective.
+        quantile (float): Use this quantile (0-1) of the samples instead of the EWMA
+            (e.g. 0.9 to plan for the tail latency).
+        explore_every (int): Decisions between forced exploration of stale paths.
+        log_path (str): CSV file where every decision and its error is written.
+        failure_backoff (float): Seconds a remote path is not chosen after a failed
+            request; doubled after each consecutive failure up to ``max_backoff``.
+        max_backoff (float): Maximum backoff of a failing path in seconds.
+    """
+
+    def __init__(
+        self,
+        paths: List[str] = PATHS,
+        objective: str = "latency",
+        slo: Optional[float] = None,
+        quantile: Optional[float] = None,
+        explore_every: int = 20,
+        log_path: Optional[str] = None,
+        failure_backoff: float = 5.0,
+        max_backoff: float = 60.0,
+    ) -> None:
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Objetivo no soportado: {objective}")
+        if objective == "cpu" and slo is None:
+            raise ValueError("El objetivo 'cpu' requiere un SLO de latencia")
+        unknown = set(paths) - set(PATHS)
+        if unknown or not paths:
+            raise ValueError(f"Caminos de inferencia no soportados: {sorted(unknown)}")
+
+        self.paths = list(paths)
+        self.objective = objective
+        self.slo = slo
+        self.quantile = quantile
+        self.explore_every = explore_every
+        self.log_path = log_path
+        self.failure_backoff = failure_backoff
+        self.max_backoff = max_backoff
+
+        self.local_inference = LatencyEstimator()
+        self.server_inference = LatencyEstimator()
+        self.server_wait = LatencyEstimator()
+        self.client_time = {path: LatencyEstimator() for path in ("server", "joint")}
+        self.joint_bytes = LatencyEstimator()
+        self.cpu_time = {path: LatencyEstimator() for path in PATHS}
+        self._transfers: Deque[tuple] = collections.deque(maxlen=20)
+        self._last_used = {path: -1 for path in PATHS}
+        self._warmed_up = set()
+        self._decisions = 0
+        self._failures = {path: 0 for path in PATHS}
+        self._blocked_until = {path: 0.0 for path in PATHS}
+        self._lock = threading.Lock()
+
+    @property
+    def bandwidth(self) -> Optional[float]:
+        """Estimated network throughput in bytes per second, None without samples."""
+        if not self._transfers:
+            return None
+        total_bytes = sum(size for size, _ in self._transfers)
+        total_time = sum(seconds for _, seconds in self._transfers)
+        return total_bytes / total_time
+
+    def _estimate(self, estimator: LatencyEstimator) -> Optional[float]:
+        return estimator.estimate(self.quantile)
+
+    def _upload_time(self, num_bytes: Optional[float]) -> Optional[float]:
+        bandwidth = self.bandwidth
+        if num_bytes is None or bandwidth is None:
+            return None
+        return num_bytes / bandwidth
+
+    def predict(self, image_bytes: int) -> Dict[str, Optional[float]]:
+        """Predicted latency (seconds) of each available path, None if unknown."""
+        server_side = None
+        wait = self._estimate(self.server_wait)
+        inference = self._estimate(self.server_inference)
+        if wait is not None and inference is not None:
+            server_side = wait + inference
+
+        predictions: Dict[str, Optional[float]] = {}
+        for path in self.paths:
+            prediction = None
+            if path == "local":
+                prediction = self._estimate(self.local_inference)
+            else:
+                client = self._estimate(self.client_time[path])
+                upload = self._upload_time(
+                    image_bytes if path == "server" else self._estimate(self.joint_bytes)
+                )
+                if None not in (client, upload, server_side):
+                    prediction = client + upload + server_side
+            predictions[path] = prediction
+        return predictions
+
+    def choose(self, image_bytes: int, unavailable: Sequence[str] = ()) -> Dict[str, Any]:
+        """Chooses the path of a frame.
+
+        Args:
+            image_bytes (int): Size of the image that would be uploaded in server mode.
+            unavailable (Sequence[str]): Paths that cannot be used right now (e.g.
+                ``local`` while the model is still loading). Ignored if no path is
+                left. Paths in backoff after a failure (see ``record_failure``) are
+                skipped too while another path is available.
+
+        Returns:
+            dict: Decision with ``path``, ``predictions``, ``predicted_latency``,
+            ``reason`` and ``decision``. Pass it to ``record`` once the frame is done.
+        """
+        with self._lock:
+            now = time.monotonic()
+            paths = [
+                p
+                for p in self.paths
+                if p not in unavailable and self._blocked_until[p] <= now
+            ] or [p for p in self.paths if p not in unavailable] or self.paths
+            predictions = self.predict(image_bytes)
+            self._decisions += 1
+            unknown = [path for path in paths if predictions[path] is None]
+
+            if unknown:
+                path, reason = unknown[0], "cold_start"
+            elif len(paths) > 1 and self._decisions % self.explore_every == 0:
+                path = min(paths, key=lambda p: self._last_used[p])
+                reason = "explore"
+            elif self.objective == "cpu":
+                within_slo = [p for p in paths if predictions[p] <= self.slo]
+                if within_slo:
+                    path = min(
+                        within_slo, key=lambda p: self._estimate(self.cpu_time[p]) or 0.0
+                    )
+                    reason = "min_cpu"
+                else:
+                    path = min(paths, key=lambda p: predictions[p])
+                    reason = "slo_miss"
+            else:
+                path = min(paths, key=lambda p: predictions[p])
+                reason = "min_latency"
+
+            self._last_used[path] = self._decisions
+            return {
+                "decision": self._decisions,
+                "path": path,
+                "reason": reason,
+                "image_bytes": image_bytes,
+                "predictions": predictions,
+                "predicted_latency": predictions[path],
+            }
+
+    def record(
+        self,
+        decision: Dict[str, Any],
+        result_data: Dict[str, Any],
+        latency: float,
+        cpu_time: float,
+    ) -> Dict[str, Any]:
+        """Updates the estimates with the outcome of a decision and logs it.
+
+        Args:
+            decision (dict): Decision returned by ``choose``.
+            result_data (dict): Result of the inference (``speed``, ``latency``,
+                ``server_time`` and ``upload_size`` for the remote paths).
+            latency (float): Measured end-to-end latency of the frame in seconds.
+            cpu_time (float): CPU time spent by the Pi process on the frame.
+
+        Returns:
+            dict: Logged row, including the prediction error in seconds.
+        """
+        path = decision["path"]
+        with self._lock:
+            self._failures[path] = 0
+            warm = path in self._warmed_up
+            self._warmed_up.add(path)
+            if warm:
+                self.cpu_time[path].add(cpu_time)
+            if warm and path == "local":
+                self.local_inference.add(latency)
+            elif warm:
+                speed = result_data.get("speed", {})
+                inference = sum(speed.values()) / 1000 if speed else 0.0
+                server_time = result_data.get("server_time", inference)
+                request_time = result_data.get("latency", latency)
+                network_time = request_time - server_time
+                self.server_inference.add(inference)
+                self.server_wait.add(server_time - inference)
+                self.client_time[path].add(latency - request_time)
+                upload_size = result_data.get("upload_size", decision["image_bytes"])
+                if upload_size > 0 and network_time > 0:
+                    self._transfers.append((upload_size, network_time))
+                if path == "joint":
+                    self.joint_bytes.add(upload_size)
+
+        return self._row(decision, latency, cpu_time)
+
+    def record_failure(
+        self,
+        decision: Dict[str, Any],
+        latency: float,
+        cpu_time: float,
+        error: Exception,
+    ) -> Dict[str, Any]:
+        """Records a failed request: its path is not chosen during a backoff window
+        (doubled after each consecutive failure) and the failure is logged.
+
+        Returns:
+            dict: Logged row, with the error in ``failure``.
+        """
+        path = decision["path"]
+        with self._lock:
+            self._failures[path] += 1
+            backoff = min(
+                self.failure_backoff * 2 ** (self._failures[path] - 1), self.max_backoff
+            )
+            self._blocked_until[path] = time.monotonic() + backoff
+        failure = f"{type(error).__name__}: {error}"
+        return self._row(decision, latency, cpu_time, failure)
+
+    def _row(
+        self,
+        decision: Dict[str, Any],
+        latency: float,
+        cpu_time: float,
+        failure: str = "",
+    ) -> Dict[str, Any]:
+        """Builds and logs the row of a decision."""
+        path = decision["path"]
+        predicted = decision["predicted_latency"]
+        row = {
+            "timestamp": time.time(),
+            "decision": decision["decision"],
+            "path": path,
+            "reason": decision["reason"],
+            "objective": self.objective,
+            "image_bytes": decision["image_bytes"],
+            "predicted_latency": predicted,
+            "actual_latency": latency,
+            "error": None if predicted is None else latency - predicted,
+            "cpu_time": cpu_time,
+            "failure": failure,
+        }
+        for name in PATHS:
+            row[f"predicted_{name}"] = decision["predictions"].get(name)
+        if self.log_path:
+            self._log(row)
+        return row
+
+    def _log(self, row: Dict[str, Any]) -> None:
+        """Appends a decision to the CSV log (writing the header if it is new)."""
+        is_new = not os.path.isfile(self.log_path)
+        with open(self.log_path, mode="a", newline="", encoding="utf-8") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=list(row))
+            if is_new:
+                writer.writeheader()
+            writer.writerow(row)
@@ -0,0 +1,265 @@
+"""
+This module contains the functions to split the YOLO forward pass between the client
+(first layers) and the server (remaining layers and NMS).
+
+The client runs the model up to ``split_layer``, serializes the intermediate feature
+tensors still needed by the remaining layers (optionally quantized to int8/fp16 and
+compressed with zlib) and sends them to the server, which resumes the forward pass.
+"""
+
+import json
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+from utils.detection import (
+    PREPROCESS_SIZES,
+    Detections,
+    get_detection_filter,
+    get_session,
+    letterbox,
+    scale_boxes_to_original,
+)
+
+try:
+    from ultralytics.utils.nms import non_max_suppression
+except ImportError:  # ultralytics < 8.3.170
+    from ultralytics.utils.ops import non_max_suppression
+
+FEATURES_CONTENT_TYPE = "application/x-nighteye-features"
+FEATURES_MAGIC = b"NEF1"
+QUANTIZATION_MODES = (None, "fp16", "int8")
+
+
+def load_split_model(size: str = "n") -> torch.nn.Module:
+    """Carga el modelo PyTorch (``DetectionModel``) usado a ambos lados del split."""
+    model = YOLO(f"models/yolo11{size}.pt").model
+    model.fuse(verbose=False)
+    return model.eval()
+
+
+def _layer_inputs(layer) -> List[int]:
+    """Returns the absolute indices of the layers whose outputs feed ``layer``."""
+    sources = [layer.f] if isinstance(layer.f, int) else layer.f
+    return [j if j >= 0 else layer.i + j for j in sources]
+
+
+def _gather_inputs(layer, x, outputs: List[Optional[torch.Tensor]]):
+    """Selects the inputs of ``layer`` as ``DetectionModel._predict_once`` does."""
+    if layer.f == -1:
+        return x
+    if isinstance(layer.f, int):
+        return outputs[layer.f]
+    return [x if j == -1 else outputs[j] for j in layer.f]
+
+
+def required_outputs(model: torch.nn.Module, split_layer: int) -> List[int]:
+    """Indices de las capas anteriores a ``split_layer`` cuyas salidas necesitan
+    las capas restantes (la salida actual y las conexiones residuales)."""
+    layers = model.model
+    if not 0 < split_layer < len(layers):
+        raise ValueError(f"split_layer debe estar entre 1 y {len(layers) - 1}")
+    needed = {split_layer - 1}
+    for layer in layers[split_layer:]:
+        needed.update(j for j in _layer_inputs(layer) if j < split_layer)
+    return sorted(needed)
+
+
+@torch.inference_mode()
+def run_head(
+    model: torch.nn.Module, image: torch.Tensor, split_layer: int
+) -> Dict[int, torch.Tensor]:
+    """Ejecuta las capas ``[0, split_layer)`` y retorna los tensores intermedios
+    requeridos por el resto del modelo."""
+    needed = required_outputs(model, split_layer)
+    outputs: List[Optional[torch.Tensor]] = []
+    x = image
+    for layer in model.model[:split_layer]:
+        x = _gather_inputs(layer, x, outputs)
+        x = layer(x)
+        outputs.append(x if layer.i in model.save or layer.i in needed else None)
+    return {i: outputs[i] for i in needed}
+
+
+@torch.inference_mode()
+def run_tail(
+    model: torch.nn.Module, features: Dict[int, torch.Tensor], split_layer: int
+) -> torch.Tensor:
+    """Reanuda el forward pass desde ``split_layer`` con los tensores recibidos y
+    retorna las predicciones sin NMS."""
+    outputs: List[Optional[torch.Tensor]] = [features.get(i) for i in range(split_layer)]
+    x = outputs[split_layer - 1]
+    for layer in model.model[split_layer:]:
+        x = _gather_inputs(layer, x, outputs)
+        x = layer(x)
+        outputs.append(x if layer.i in model.save else None)
+    return x[0] if isinstance(x, (tuple, list)) else x
+
+
+def preprocess_for_split(
+    image: np.ndarray, imgsz: int = 640
+) -> Tuple[torch.Tensor, Dict[str, Any]]:
+    """Aplica ``letterbox`` y convierte la imagen BGR al tensor de entrada del modelo."""
+    if imgsz not in PREPROCESS_SIZES:
+        raise ValueError(f"Tamaño no soportado: {imgsz} {PREPROCESS_SIZES}")
+    padded, ratio, pad = letterbox(image, imgsz)
+    rgb = cv2.cvtColor(padded, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)
+    tensor = torch.from_numpy(np.ascontiguousarray(rgb)).float().div_(255.0)
+    letterbox_info = {"ratio": ratio, "pad": pad, "original_shape": image.shape}
+    return tensor.unsqueeze(0), letterbox_info
+
+
+def serialize_features(
+    features: Dict[int, torch.Tensor],
+    quantization: Optional[str] = "int8",
+    compress: bool = True,
+) -> bytes:
+    """Serializa los tensores intermedios en un mensaje binario.
+
+    El formato es ``NEF1 | uint32 largo_cabecera | cabecera JSON | datos``; los datos
+    se comprimen con zlib si ``compress`` es True.
+
+    Args:
+        features (dict): Tensores por índice de capa.
+        quantization (str, optional): ``None`` (fp32), ``"fp16"`` o ``"int8"``.
+        compress (bool): Comprimir los datos con zlib.
+
+    Returns:
+        bytes: Mensaje serializado.
+    """
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Cuantización no soportada: {quantization}")
+
+    tensors = []
+    chunks = []
+    for index, tensor in features.items():
+        array = tensor.detach().cpu().numpy().astype(np.float32)
+        entry = {"index": index, "shape": list(array.shape)}
+        if quantization == "int8":
+            low, high = float(array.min()), float(array.max())
+            scale = (high - low) / 255.0 or 1.0
+            array = np.round((array - low) / scale).astype(np.uint8)
+            entry.update({"dtype": "uint8", "scale": scale, "min": low})
+        elif quantization == "fp16":
+            array = array.astype(np.float16)
+            entry["dtype"] = "float16"
+        else:
+            entry["dtype"] = "float32"
+        entry["nbytes"] = array.nbytes
+        tensors.append(entry)
+        chunks.append(array.tobytes())
+
+    body = b"".join(chunks)
+    if compress:
+        body = zlib.compress(body, 1)
+    header = json.dumps({"tensors": tensors, "compressed": compress}).encode()
+    return FEATURES_MAGIC + struct.pack("!I", len(header)) + header + body
+
+
+def deserialize_features(data: bytes) -> Dict[int, torch.Tensor]:
+    """Reconstruye los tensores fp32 a partir de un mensaje de ``serialize_features``."""
+    if data[:4] != FEATURES_MAGIC:
+        raise ValueError("Mensaje de features no válido")
+    (header_length,) = struct.unpack("!I", data[4:8])
+    header = json.loads(data[8 : 8 + header_length])
+    body = data[8 + header_length :]
+    if header["compressed"]:
+        body = zlib.decompress(body)
+
+    features = {}
+    offset = 0
+    for entry in header["tensors"]:
+        array = np.frombuffer(
+            body, dtype=entry["dtype"], count=int(np.prod(entry["shape"])), offset=offset
+        ).reshape(entry["shape"])
+        offset += entry["nbytes"]
+        array = array.astype(np.float32)
+        if entry["dtype"] == "uint8":
+            array = array * entry["scale"] + entry["min"]
+        features[entry["index"]] = torch.from_numpy(array)
+    return features
+
+
+def predictions_to_boxes(
+    predictions: torch.Tensor,
+    names: Dict[int, str],
+    conf: float = 0.25,
+    iou: float = 0.7,
+    classes: Optional[List[int]] = None,
+    max_det: int = 300,
+) -> List[Dict[str, Any]]:
+    """Aplica NMS a las predicciones y retorna las bounding boxes (espacio del
+    ``letterbox``) con el mismo formato que ``get_bounding_boxes``."""
+    detections = non_max_suppression(
+        predictions, conf_thres=conf, iou_thres=iou, classes=classes, max_det=max_det
+    )[0]
+    return Detections.from_tensor(detections, names).to_boxes()
+
+
+def upload_features(
+    image_path: str,
+    model: torch.nn.Module,
+    split_layer: int,
+    server_ip: str = None,
+    imgsz: int = 640,
+    quantization: Optional[str] = "int8",
+    compress: bool = True,
+    model_size: str = "n",
+) -> Dict[str, Any]:
+    """Ejecuta la primera parte del modelo en el cliente, envía los tensores
+    intermedios al servidor y retorna las detecciones en coordenadas originales.
+
+    Returns:
+        dict: Resultados con ``bounding_boxes``, ``objects_detected`` y las métricas
+        del split (``client_time``, ``bytes_sent``, ``latency``).
+    """
+    if server_ip is None:
+        server_ip = "172.20.10.10"
+    image = cv2.imread(image_path)
+    if image is None:
+        raise FileNotFoundError(f"[CLIENT ERROR] No se pudo leer la imagen: {image_path}")
+
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    tensor, letterbox_info = preprocess_for_split(image, imgsz)
+    payload = serialize_features(run_head(model, tensor, split_layer), quantization, compress)
+    client_time = time.process_time() - start_cpu
+
+    headers = {
+        "Content-Type": FEATURES_CONTENT_TYPE,
+        "X-File-Name": os.path.basename(image_path),
+        "X-Split-Layer": str(split_layer),
+        "X-Model-Size": model_size,
+        **get_detection_filter().headers(),
+    }
+    url = f"http://{server_ip}:8000/"
+    response = get_session().post(url, headers=headers, data=payload, timeout=120)
+    if response.status_code != 200:
+        print(f"[CLIENT ERROR] Respuesta inesperada: {response.status_code} - {response.text}")
+        raise RuntimeError("Error in server response.")
+
+    response_data = response.json()
+    bounding_boxes = scale_boxes_to_original(
+        response_data.get("bounding_boxes", []),
+        letterbox_info["ratio"],
+        letterbox_info["pad"],
+        letterbox_info["original_shape"],
+    )
+    result_data = response_data.get("results_data", {})
+    result_data.update(
+        {
+            "bounding_boxes": bounding_boxes,
+            "split_layer": split_layer,
+            "client_time": client_time,
+            "bytes_sent": len(payload),
+            "latency": time.perf_counter() - start_time,
+        }
+    )
+    return result_data
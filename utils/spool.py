@@ -0,0 +1,331 @@
+"""
+This module contains a disk-backed spool for the frames that could not be offloaded
+while the server was unreachable, and the background drainer that uploads them in
+batches once the server answers again.
+
+Frames are appended to segment files (``segment_NNNNNN.dat``) and described in an
+append-only index (``index.jsonl``). Drained frames are acknowledged in the same
+index; fully acknowledged segments are deleted and the index is compacted. The spool
+survives restarts: the pending frames are recovered from the index.
+"""
+
+import base64
+import collections
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import requests
+
+from utils.detection import get_detection_filter, get_session
+
+INDEX_FILE = "index.jsonl"
+
+
+class FrameSpool:
+    """Bounded append-only spool of encoded frames.
+
+    Args:
+        folder (str): Folder of the segment files and the index.
+        max_bytes (int): Maximum size of the segments on disk. When a new frame does
+            not fit, the oldest segment is discarded.
+        segment_bytes (int): Size at which a new segment file is started.
+    """
+
+    def __init__(
+        self,
+        folder: str = "./data/spool/",
+        max_bytes: int = 500 * 2**20,
+        segment_bytes: int = 16 * 2**20,
+    ) -> None:
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.segment_bytes = min(segment_bytes, max_bytes)
+        self.dropped = 0
+        self._entries: Deque[Dict[str, Any]] = collections.deque()
+        self._segments: Dict[str, int] = {}  # Segment name -> size, oldest first
+        self._pending: Dict[str, int] = collections.Counter()
+        self._acked_lines = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.folder, name)
+
+    def _load(self) -> None:
+        """Recovers the pending frames of a previous run from the index."""
+        entries: Dict[int, Dict[str, Any]] = {}
+        index_path = self._path(INDEX_FILE)
+        if os.path.isfile(index_path):
+            with open(index_path, encoding="utf-8") as index_file:
+                for line in index_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Line cut by a power loss
+                    if "ack" in record:
+                        entries.pop(record["ack"], None)
+                    else:
+                        entries[record["id"]] = record
+
+        segments = sorted(f for f in os.listdir(self.folder) if f.startswith("segment_"))
+        for name in segments:
+            self._segments[name] = os.path.getsize(self._path(name))
+        for record in sorted(entries.values(), key=lambda r: r["id"]):
+            size = self._segments.get(record["segment"], 0)
+            if record["offset"] + record["length"] <= size:
+                self._entries.append(record)
+                self._pending[record["segment"]] += 1
+        self._next_id = max(entries, default=-1) + 1
+
+        number = int(segments[-1][8:14]) + 1 if segments else 0
+        self._current = f"segment_{number:06d}.dat"
+        self._segments[self._current] = 0
+        self._remove_finished_segments()
+        self._compact_index()
+        if self._entries:
+            print(f"[CLIENT] {len(self._entries)} frames pendientes en el spool")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        """Bytes used by the segment files."""
+        with self._lock:
+            return sum(self._segments.values())
+
+    def append(self, data: bytes, meta: Dict[str, Any]) -> None:
+        """Stores an encoded frame with its metadata (capture timestamp, index...)."""
+        with self._lock:
+            while sum(self._segments.values()) + len(data) > self.max_bytes:
+                if not self._discard_oldest_segment():
+                    break
+            if self._segments[self._current] + len(data) > self.segment_bytes:
+                number = int(self._current[8:14]) + 1
+                self._current = f"segment_{number:06d}.dat"
+                self._segments[self._current] = 0
+
+            offset = self._segments[self._current]
+            with open(self._path(self._current), "ab") as segment:
+                segment.write(data)
+            record = {
+                "id": self._next_id,
+                "segment": self._current,
+                "offset": offset,
+                "length": len(data),
+                "meta": meta,
+            }
+            self._next_id += 1
+            self._segments[self._current] += len(data)
+            self._pending[self._current] += 1
+            self._entries.append(record)
+            self._write_index([record])
+
+    def peek(self, count: int) -> List[Tuple[Dict[str, Any], bytes]]:
+        """Returns up to ``count`` of the oldest pending frames without removing them."""
+        batch = []
+        # Read under the lock: a full spool may delete the oldest segment meanwhile
+        with self._lock:
+            for record in list(self._entries)[:count]:
+                with open(self._path(record["segment"]), "rb") as segment:
+                    segment.seek(record["offset"])
+                    batch.append((record, segment.read(record["length"])))
+        return batch
+
+    def ack(self, records: List[Dict[str, Any]]) -> None:
+        """Removes drained frames from the spool."""
+        ids = {record["id"] for record in records}
+        with self._lock:
+            acked = [record for record in self._entries if record["id"] in ids]
+            if not acked:
+                return
+            self._entries = collections.deque(
+                record for record in self._entries if record["id"] not in ids
+            )
+            for record in acked:
+                self._pending[record["segment"]] -= 1
+            self._write_index([{"ack": record["id"]} for record in acked])
+            self._acked_lines += len(acked)
+            self._remove_finished_segments()
+            if self._acked_lines > max(len(self._entries), 100):
+                self._compact_index()
+
+    def _write_index(self, records: List[Dict[str, Any]]) -> None:
+        with open(self._path(INDEX_FILE), "a", encoding="utf-8") as index_file:
+            for record in records:
+                index_file.write(json.dumps(record) + "\n")
+
+    def _compact_index(self) -> None:
+        """Rewrites the index with the pending frames only."""
+        temporary_path = self._path(INDEX_FILE + ".tmp")
+        with open(temporary_path, "w", encoding="utf-8") as index_file:
+            for record in self._entries:
+                index_file.write(json.dumps(record) + "\n")
+        os.replace(temporary_path, self._path(INDEX_FILE))
+        self._acked_lines = 0
+
+    def _remove_finished_segments(self) -> None:
+        """Deletes the segments (other than the current one) without pending frames."""
+        for name in list(self._segments):
+            if name != self._current and self._pending.get(name, 0) <= 0:
+                self._delete_segment(name)
+
+    def _discard_oldest_segment(self) -> bool:
+        """Drops the oldest segment and its frames to make room; False if only the
+        current segment is left."""
+        oldest = next(iter(self._segments))
+        if oldest == self._current:
+            if not self._segments[oldest]:
+                return False
+            number = int(self._current[8:14]) + 1
+            self._current = f"segment_{number:06d}.dat"
+            self._segments[self._current] = 0
+        lost = [record for record in self._entries if record["segment"] == oldest]
+        self._entries = collections.deque(
+            record for record in self._entries if record["segment"] != oldest
+        )
+        self.dropped += len(lost)
+        print(f"[CLIENT] Spool lleno, se descartan {len(lost)} frames antiguos")
+        self._delete_segment(oldest)
+        self._compact_index()
+        return True
+
+    def _delete_segment(self, name: str) -> None:
+        self._segments.pop(name, None)
+        self._pending.pop(name, None)
+        if os.path.exists(self._path(name)):
+            os.remove(self._path(name))
+
+
+def upload_batch(
+    images: List[Tuple[str, bytes]],
+    server_ip: str = None,
+    encoding: str = "jpg",
+    timeout: float = 120,
+) -> List[Dict[str, Any]]:
+    """Sends several encoded frames in one request and returns one result per frame
+    (``bounding_boxes`` merged into ``results_data``)."""
+    if server_ip is None:
+        server_ip = "172.20.10.10"
+    data = {
+        "images": [
+            {"file_name": name, "image_encoded": base64.b64encode(image).decode("ascii")}
+            for name, image in images
+        ],
+        "encoding": encoding,
+    }
+    headers = {"Content-type": "application/json", **get_detection_filter().headers()}
+    start_time = time.perf_counter()
+    response = get_session().post(
+        f"http://{server_ip}:8000/", headers=headers, json=data, timeout=timeout
+    )
+    if response.status_code != 200:
+        print(f"[CLIENT ERROR] Respuesta inesperada: {response.status_code} - {response.text}")
+        raise RuntimeError("Error in server response.")
+    latency = time.perf_counter() - start_time
+
+    results = []
+    for (_, image), response_data in zip(images, response.json()["results"]):
+        result_data = response_data.get("results_data", {})
+        result_data["bounding_boxes"] = response_data.get("bounding_boxes", [])
+        result_data["upload_size"] = len(image)
+        result_data["latency"] = latency
+        results.append(result_data)
+    return results
+
+
+class SpoolDrainer:
+    """Uploads the spooled frames on a background thread.
+
+    Frames are sent in batches of ``batch_size`` at most ``max_rate`` frames per
+    second, so the backlog shares the link with the live frames instead of
+    competing with them. Nothing is sent while ``is_online`` returns False.
+
+    Args:
+        spool (FrameSpool): Spool to drain.
+        server_ip (str): Address of the detection server.
+        on_result (callable): Called as ``on_result(meta, result_data)`` for each
+            drained frame, with the metadata stored when it was spooled.
+        batch_size (int): Frames per request.
+        max_rate (float): Maximum drained frames per second.
+        is_online (callable, optional): Returns False while the server is known to be
+            unreachable (e.g. the network probe has no RTT).
+        retry_interval (float): Seconds to wait after a failed batch or while idle.
+        request_timeout (float): Timeout of each batch upload; it also bounds how long
+            ``stop`` waits for the batch in flight.
+    """
+
+    def __init__(
+        self,
+        spool: FrameSpool,
+        server_ip: str,
+        on_result: Callable[[Dict[str, Any], Dict[str, Any]], None],
+        batch_size: int = 4,
+        max_rate: float = 2.0,
+        is_online: Optional[Callable[[], bool]] = None,
+        retry_interval: float = 2.0,
+        request_timeout: float = 10.0,
+    ) -> None:
+        self.spool = spool
+        self.server_ip = server_ip
+        self.on_result = on_result
+        self.batch_size = batch_size
+        self.max_rate = max_rate
+        self.is_online = is_online
+        self.retry_interval = retry_interval
+        self.request_timeout = request_timeout
+        self.drained = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SpoolDrainer":
+        """Starts the background thread."""
+        self._thread = threading.Thread(target=self._run, name="spool-drain", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops draining; the frames left stay in the spool for the next run."""
+        self._stop_event.set()
+        if self._thread is not None:
+            # A batch in flight is not acknowledged and is sent again on the next run
+            self._thread.join(self.request_timeout)
+            if self._thread.is_alive():
+                print("[CLIENT] El vaciado del spool sigue en curso, se abandona")
+        if len(self.spool):
+            print(f"[CLIENT] Quedan {len(self.spool)} frames en el spool")
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            if not len(self.spool) or (self.is_online and not self.is_online()):
+                self._stop_event.wait(self.retry_interval)
+                continue
+
+            start_time = time.perf_counter()
+            try:
+                batch = self.spool.peek(self.batch_size)
+                results = upload_batch(
+                    [(record["meta"].get("file_name", ""), data) for record, data in batch],
+                    self.server_ip,
+                    timeout=self.request_timeout,
+                )
+            except (requests.RequestException, OSError, RuntimeError, KeyError) as e:
+                print(f"[CLIENT ERROR] No se pudo vaciar el spool: {e}")
+                self._stop_event.wait(self.retry_interval)
+                continue
+
+            for (record, _), result_data in zip(batch, results):
+                result_data["detection_place"] = "server"
+                self.on_result(record["meta"], result_data)
+            self.spool.ack([record for record, _ in batch])
+            self.drained += len(batch)
+
+            # Rate limit: a batch of N frames takes at least N / max_rate seconds
+            elapsed = time.perf_counter() - start_time
+            self._stop_event.wait(max(len(batch) / self.max_rate - elapsed, 0.0))
@@ -0,0 +1,363 @@
+"""
+This module contains the inference stages of the pipeline: local, remote (server),
+joint (letterbox or split) inference, changed-region gating and tracking.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+import cv2
+from utils.adaptive_encoding import AdaptiveEncoder
+from utils.adaptive_resolution import ResolutionController
+from utils.circuit_breaker import CircuitBreaker
+from utils.cpu_affinity import set_inference_threads
+from utils.detection import (
+    draw_bounding_boxes,
+    encode_image,
+    get_annotation_policy,
+    image_prediction,
+    upload_image,
+    upload_image_preprocessed,
+)
+from utils.hedging import HedgedExecutor
+from utils.model_registry import get_model, model_ready, preload_model
+from utils.offload import PipelinedUploader
+from utils.pipeline import Frame, Stage, StageOutput
+from utils.regions import BackgroundModel, upload_changed_regions
+from utils.spool import FrameSpool
+from utils.tracking import TrackedDetector
+
+
+class LocalInference(Stage):
+    """Runs the YOLO model on the Raspberry Pi over the saved image.
+
+    With a ``ResolutionController`` the input size of each frame follows the load of
+    the Pi; the size used is stored in ``result["imgsz"]``. ``threads`` limits the
+    intra-op threads of the model (set on the stage thread, see ``utils.cpu_affinity``).
+    """
+
+    name = "local"
+    role = "inference"
+
+    def __init__(
+        self,
+        model,
+        image_extension: str = "png",
+        resolution: ResolutionController = None,
+        threads: int = None,
+    ) -> None:
+        self.model = model
+        self.image_extension = image_extension
+        self.resolution = resolution
+        self.threads = threads
+
+    def start(self) -> None:
+        set_inference_threads(self.model, self.threads)
+
+    def process(self, frame: Frame) -> StageOutput:
+        imgsz = self.resolution.imgsz if self.resolution is not None else None
+        frame.result = image_prediction(
+            self.model, frame.image_path, self.image_extension, imgsz
+        )
+        frame.result["detection_place"] = "local"
+        if self.resolution is not None:
+            self.resolution.update(sum(frame.result["speed"].values()) / 1000)
+        return frame
+
+
+def offload_frame(
+    image_path: str,
+    server_ip: str = None,
+    encoder: AdaptiveEncoder = None,
+    regions: list = None,
+    timeout: float = 120,
+) -> Dict[str, Any]:
+    """Sube la imagen completa (o solo las regiones que cambiaron) al servidor."""
+    if regions is None:
+        return upload_image(image_path, server_ip, encoder=encoder, timeout=timeout)
+    return upload_changed_regions(image_path, regions, server_ip, timeout=timeout)
+
+
+class RemoteInference(Stage):
+    """Sends the saved image to the server keeping up to ``max_in_flight`` uploads
+    running; finished frames are returned in capture order (or latest-wins). With a
+    single ordered upload in flight the stage waits for its result, so the frame is
+    not held back until the next capture.
+
+    With a ``breaker`` the uploads go through the circuit breaker: frames whose
+    upload fails, or that arrive while the circuit is open, run on the local model.
+    """
+
+    name = "remote"
+
+    def __init__(
+        self,
+        server_ip: str = None,
+        max_in_flight: int = 1,
+        delivery: str = "ordered",
+        encoder: AdaptiveEncoder = None,
+        breaker: CircuitBreaker = None,
+        request_timeout: float = 120,
+    ) -> None:
+        self.server_ip = server_ip
+        self.encoder = encoder
+        self.breaker = breaker
+        self.request_timeout = request_timeout
+        self._local_lock = threading.Lock()
+        if breaker is not None:
+            preload_model("n", rpi=True)
+        self.uploader = PipelinedUploader(
+            offload_frame if breaker is None else self._guarded_offload,
+            max_in_flight=max_in_flight,
+            delivery=delivery,
+        )
+        self.wait_result = max_in_flight == 1 and delivery == "ordered"
+
+    def _local(self, image_path: str, *_) -> Dict[str, Any]:
+        # The local model is shared by the upload threads
+        with self._local_lock:
+            return image_prediction(get_model("n", rpi=True), image_path)
+
+    def _guarded_offload(
+        self, image_path: str, server_ip: str, encoder: AdaptiveEncoder, regions: list
+    ) -> Dict[str, Any]:
+        result_data, place = self.breaker.call(
+            offload_frame,
+            self._local,
+            image_path,
+            server_ip,
+            encoder,
+            regions,
+            self.request_timeout,
+        )
+        result_data["detection_place"] = place
+        return result_data
+
+    def _finished(self, results: list) -> List[Frame]:
+        frames = []
+        for frame, result_data in results:
+            if not isinstance(result_data, Exception):
+                result_data.setdefault("detection_place", "server")
+            frame.result = result_data
+            frames.append(frame)
+        return frames
+
+    def process(self, frame: Frame) -> StageOutput:
+        submitted = self.uploader.submit(
+            frame,
+            frame.image_path,
+            self.server_ip,
+            self.encoder,
+            frame.meta.get("regions"),
+        )
+        if not submitted:
+            print(f"[CLIENT] Cola llena, se descarta: {frame.image_path}")
+        if self.wait_result:
+            return self._finished(self.uploader.drain())
+        return self._finished(self.uploader.poll())
+
+    def flush(self) -> List[Frame]:
+        return self._finished(self.uploader.drain())
+
+    def close(self) -> None:
+        self.uploader.close()
+        if self.breaker is not None:
+            print(f"Circuito abierto {self.breaker.times_opened} veces")
+
+
+class HedgedInference(Stage):
+    """Sends the saved image to the server and, if the answer takes longer than the
+    learned ``percentile`` of the server latency, also runs the local model on it.
+    The first result wins (see ``HedgedExecutor``)."""
+
+    name = "hedged"
+    role = "inference"
+
+    def __init__(
+        self,
+        server_ip: str = None,
+        percentile: float = 95,
+        encoder: AdaptiveEncoder = None,
+        image_extension: str = "png",
+    ) -> None:
+        self.server_ip = server_ip
+        self.encoder = encoder
+        self.image_extension = image_extension
+        preload_model("n", rpi=True)
+        self.executor = HedgedExecutor(
+            self._remote,
+            self._local,
+            percentile=percentile,
+            local_ready=lambda: model_ready("n", rpi=True),
+        )
+
+    def _remote(self, image_path: str) -> Dict[str, Any]:
+        return upload_image(image_path, self.server_ip, encoder=self.encoder)
+
+    def _local(self, image_path: str) -> Dict[str, Any]:
+        return image_prediction(get_model("n", rpi=True), image_path, self.image_extension)
+
+    def process(self, frame: Frame) -> StageOutput:
+        frame.result, winner = self.executor.run(frame.image_path)
+        frame.result["detection_place"] = winner
+        return frame
+
+    def close(self) -> None:
+        self.executor.report()
+        self.executor.close()
+
+
+class SpoolFailed(Stage):
+    """Stores in the spool the frames whose upload failed so they are uploaded
+    later by ``SpoolDrainer`` (their result is written then)."""
+
+    name = "spool"
+
+    def __init__(self, spool: FrameSpool) -> None:
+        self.spool = spool
+
+    def process(self, frame: Frame) -> StageOutput:
+        if not isinstance(frame.result, Exception):
+            return frame
+        self.spool.append(
+            encode_image(frame.image, "jpg"),
+            {
+                "timestamp": frame.timestamp,
+                "frame_index": frame.index,
+                "image_path": frame.image_path,
+                "file_name": f"{os.path.splitext(os.path.basename(frame.image_path))[0]}.jpg",
+            },
+        )
+        print(f"[CLIENT] Frame {frame.index} guardado en el spool ({len(self.spool)})")
+        frame.result = {"detection_place": "spooled", "error": str(frame.result)}
+        return frame
+
+
+class JointInference(Stage):
+    """Sends the letterboxed image to the server (``upload_image_preprocessed``)."""
+
+    name = "joint"
+    role = "inference"
+
+    def __init__(self, server_ip: str = None, imgsz: int = 640) -> None:
+        self.server_ip = server_ip
+        self.imgsz = imgsz
+
+    def process(self, frame: Frame) -> StageOutput:
+        frame.result = upload_image_preprocessed(
+            image_path=frame.image_path,
+            server_ip=self.server_ip,
+            target_size=self.imgsz,
+        )
+        frame.result["detection_place"] = "joint"
+        return frame
+
+
+class SplitInference(Stage):
+    """Runs the first ``split_layer`` layers locally and the rest on the server."""
+
+    name = "split"
+    role = "inference"
+
+    def __init__(
+        self,
+        model,
+        split_layer: int,
+        server_ip: str = None,
+        imgsz: int = 640,
+        quantization: str = "int8",
+    ) -> None:
+        self.model = model
+        self.split_layer = split_layer
+        self.server_ip = server_ip
+        self.imgsz = imgsz
+        self.quantization = quantization
+
+    def process(self, frame: Frame) -> StageOutput:
+        from utils.split_inference import upload_features  # Imports torch
+
+        frame.result = upload_features(
+            frame.image_path,
+            self.model,
+            self.split_layer,
+            server_ip=self.server_ip,
+            imgsz=self.imgsz,
+            quantization=self.quantization,
+        )
+        frame.result["detection_place"] = "joint"
+        print(
+            f"Split {self.split_layer}: {frame.result['bytes_sent']} bytes, "
+            f"CPU cliente {frame.result['client_time'] * 1000:.1f} ms, "
+            f"latencia {frame.result['latency'] * 1000:.1f} ms"
+        )
+        return frame
+
+
+class ChangedRegions(Stage):
+    """Compares the frame with a background model; drops unchanged frames and tags
+    the others with the regions to upload (None means the full frame)."""
+
+    name = "regions"
+
+    def __init__(self, background: BackgroundModel = None) -> None:
+        self.background = background or BackgroundModel()
+
+    def process(self, frame: Frame) -> StageOutput:
+        regions = self.background.apply(frame.image)
+        if regions == []:
+            print(f"[CLIENT] Sin cambios en el frame {frame.index}, no se sube")
+            return None
+        frame.meta["regions"] = regions
+        return frame
+
+
+class Tracking(Stage):
+    """Runs ``TrackedDetector`` on every frame: full detection every N frames and
+    Kalman/IoU tracking in between.
+
+    The result of every frame carries ``objects_detected`` and the time spent on it
+    (``speed["inference"]``), so a ``CsvSink`` after this stage logs all the frames.
+    ``threads`` limits the intra-op threads of ``model`` as in ``LocalInference``.
+    """
+
+    name = "tracking"
+    role = "inference"
+
+    def __init__(self, tracker: TrackedDetector, model=None, threads: int = None) -> None:
+        self.tracker = tracker
+        self.model = model
+        self.threads = threads
+
+    def start(self) -> None:
+        if self.model is not None:
+            set_inference_threads(self.model, self.threads)
+
+    def process(self, frame: Frame) -> StageOutput:
+        start_time = time.perf_counter()
+        frame.result = self.tracker.process(frame.image)
+        frame.result["speed"] = {"inference": (time.perf_counter() - start_time) * 1000}
+        frame.result["objects_detected"] = [
+            (box["label"], box["confidence"]) for box in frame.result["bounding_boxes"]
+        ]
+        frame.result["detection_place"] = "local"
+        return frame
+
+
+class SaveTrackedResult(Stage):
+    """Draws the tracked boxes (with their track id) over the saved frame, for the
+    frames selected by the annotation policy (``utils.detection``)."""
+
+    name = "annotate"
+
+    def process(self, frame: Frame) -> StageOutput:
+        if not get_annotation_policy().should_render(len(frame.result["bounding_boxes"])):
+            return frame
+        boxes = [
+            {**box, "label": f"{box['label']} #{box['track_id']}"}
+            for box in frame.result["bounding_boxes"]
+        ]
+        root, extension = os.path.splitext(frame.image_path)
+        cv2.imwrite(f"{root}_result{extension}", draw_bounding_boxes(frame.image, boxes))
+        return frame
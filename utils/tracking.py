@@ -0,0 +1,316 @@
+"""
+This module contains a lightweight multi-object tracker (IoU association plus a
+constant-velocity Kalman filter, vectorized in NumPy) used to propagate detections
+between full YOLO inferences.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from utils.adaptive_resolution import ResolutionController
+
+# Constant-velocity model over [cx, cy, area, aspect, vcx, vcy, varea]
+_F = np.eye(7)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+_H = np.eye(4, 7)
+_Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 1e-4])
+_R = np.diag([1.0, 1.0, 10.0, 10.0])
+_P0 = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Calcula la IoU entre todos los pares de cajas (x1, y1, x2, y2).
+
+    Args:
+        boxes_a (np.ndarray): Array (N, 4).
+        boxes_b (np.ndarray): Array (M, 4).
+
+    Returns:
+        np.ndarray: Matriz (N, M) de IoU.
+    """
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)))
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    width = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    height = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return intersection / np.maximum(area_a + area_b - intersection, 1e-9)
+
+
+def _boxes_to_measurements(boxes: np.ndarray) -> np.ndarray:
+    """Convierte (x1, y1, x2, y2) a (cx, cy, área, relación de aspecto)."""
+    width = boxes[:, 2] - boxes[:, 0]
+    height = boxes[:, 3] - boxes[:, 1]
+    return np.stack(
+        [
+            boxes[:, 0] + width / 2,
+            boxes[:, 1] + height / 2,
+            width * height,
+            width / np.maximum(height, 1e-9),
+        ],
+        axis=1,
+    )
+
+
+def _states_to_boxes(states: np.ndarray) -> np.ndarray:
+    """Convierte estados del filtro de Kalman a cajas (x1, y1, x2, y2)."""
+    area = np.clip(states[:, 2], 0, None)
+    width = np.sqrt(area * np.clip(states[:, 3], 0, None))
+    height = area / np.maximum(width, 1e-9)
+    return np.stack(
+        [
+            states[:, 0] - width / 2,
+            states[:, 1] - height / 2,
+            states[:, 0] + width / 2,
+            states[:, 1] + height / 2,
+        ],
+        axis=1,
+    )
+
+
+def greedy_match(iou: np.ndarray, min_iou: float) -> List[tuple]:
+    """Asocia tracks y detecciones por IoU descendente (asignación voraz)."""
+    if iou.size == 0:
+        return []
+    order = np.argsort(-iou, axis=None)
+    rows, cols = np.unravel_index(order, iou.shape)
+    used_rows, used_cols, matches = set(), set(), []
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        if iou[row, col] < min_iou:
+            break
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matches.append((row, col))
+    return matches
+
+
+class IoUTracker:
+    """Tracker multi-objeto con filtro de Kalman de velocidad constante.
+
+    Todos los tracks se predicen y actualizan en bloque con operaciones NumPy.
+
+    En cada detección completa (``update``) los tracks que no se asocian con
+    ninguna detección se eliminan: el detector ya no ve el objeto, o se movió
+    demasiado y se crea un track nuevo para él, así que conservarlos solo dejaría
+    cajas obsoletas o duplicadas.
+
+    Args:
+        min_iou (float): IoU mínima para asociar una detección con un track.
+        max_age (int): Frames sin detección asociada antes de eliminar un track.
+    """
+
+    def __init__(self, min_iou: float = 0.3, max_age: int = 30) -> None:
+        self.min_iou = min_iou
+        self.max_age = max_age
+        self.states = np.zeros((0, 7))
+        self.covariances = np.zeros((0, 7, 7))
+        self.ids = np.zeros(0, dtype=int)
+        self.age = np.zeros(0, dtype=int)  # Frames since the last matched detection
+        self.hits = np.zeros(0, dtype=int)  # Matched detections per track
+        self.labels: List[str] = []
+        self.confidences = np.zeros(0)
+        self._next_id = 1
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def predict(self) -> np.ndarray:
+        """Propaga todos los tracks un frame y retorna sus cajas predichas."""
+        if len(self) == 0:
+            return np.zeros((0, 4))
+        shrinking = self.states[:, 2] + self.states[:, 6] <= 0
+        self.states[shrinking, 6] = 0.0
+        self.states = self.states @ _F.T
+        self.covariances = _F @ self.covariances @ _F.T + _Q
+        self.age += 1
+        keep = self.age <= self.max_age
+        if not keep.all():
+            self._select(keep)
+        return _states_to_boxes(self.states)
+
+    def update(
+        self, boxes: np.ndarray, labels: List[str], confidences: np.ndarray
+    ) -> None:
+        """Corrige los tracks con las detecciones de un frame, elimina los tracks sin
+        detección asociada y crea tracks nuevos.
+
+        Args:
+            boxes (np.ndarray): Cajas detectadas (N, 4).
+            labels (list): Etiqueta de cada detección.
+            confidences (np.ndarray): Confianza de cada detección.
+        """
+        predicted = _states_to_boxes(self.states) if len(self) else np.zeros((0, 4))
+        matches = greedy_match(iou_matrix(predicted, boxes), self.min_iou)
+
+        if matches:
+            track_idx, det_idx = (np.array(v) for v in zip(*matches))
+            measurements = _boxes_to_measurements(boxes[det_idx])
+            covariances = self.covariances[track_idx]
+            innovation = measurements - self.states[track_idx] @ _H.T
+            system = _H @ covariances @ _H.T + _R
+            gain = covariances @ _H.T @ np.linalg.inv(system)
+            self.states[track_idx] += np.einsum("nij,nj->ni", gain, innovation)
+            self.covariances[track_idx] = (np.eye(7) - gain @ _H) @ covariances
+            self.age[track_idx] = 0
+            self.hits[track_idx] += 1
+            self.confidences[track_idx] = confidences[det_idx]
+            for t, d in zip(track_idx.tolist(), det_idx.tolist()):
+                self.labels[t] = labels[d]
+
+        keep = np.zeros(len(self), dtype=bool)
+        keep[[t for t, _ in matches]] = True
+        if not keep.all():
+            self._select(keep)
+
+        matched = {d for _, d in matches}
+        new = [d for d in range(len(boxes)) if d not in matched]
+        if new:
+            states = np.zeros((len(new), 7))
+            states[:, :4] = _boxes_to_measurements(boxes[new])
+            self.states = np.vstack([self.states, states])
+            self.covariances = np.concatenate(
+                [self.covariances, np.repeat(_P0[None], len(new), axis=0)]
+            )
+            self.ids = np.concatenate(
+                [self.ids, np.arange(self._next_id, self._next_id + len(new))]
+            )
+            self._next_id += len(new)
+            self.age = np.concatenate([self.age, np.zeros(len(new), dtype=int)])
+            self.hits = np.concatenate([self.hits, np.ones(len(new), dtype=int)])
+            self.confidences = np.concatenate([self.confidences, confidences[new]])
+            self.labels.extend(labels[d] for d in new)
+
+    def _select(self, keep: np.ndarray) -> None:
+        """Conserva solo los tracks indicados por la máscara ``keep``."""
+        self.states = self.states[keep]
+        self.covariances = self.covariances[keep]
+        self.ids = self.ids[keep]
+        self.age = self.age[keep]
+        self.hits = self.hits[keep]
+        self.confidences = self.confidences[keep]
+        self.labels = [label for label, k in zip(self.labels, keep) if k]
+
+    def position_uncertainty(self) -> np.ndarray:
+        """Desviación estándar (píxeles) de la posición predicha de cada track."""
+        return np.sqrt(self.covariances[:, 0, 0] + self.covariances[:, 1, 1])
+
+    def boxes(self) -> List[Dict[str, Any]]:
+        """Retorna los tracks actuales con el formato de ``get_bounding_boxes`` más
+        el identificador ``track_id``."""
+        return [
+            {
+                "x1": int(x1),
+                "y1": int(y1),
+                "x2": int(x2),
+                "y2": int(y2),
+                "label": label,
+                "confidence": float(confidence),
+                "track_id": int(track_id),
+            }
+            for (x1, y1, x2, y2), label, confidence, track_id in zip(
+                _states_to_boxes(self.states).tolist(),
+                self.labels,
+                self.confidences.tolist(),
+                self.ids.tolist(),
+            )
+        ]
+
+
+class TrackedDetector:
+    """Ejecuta la detección completa cada ``every_n`` frames (o cuando los tracks se
+    degradan) y propaga las cajas con ``IoUTracker`` en los frames intermedios.
+
+    Args:
+        detect_function (callable): Función ``frame -> list`` de bounding boxes con
+            el formato de ``get_bounding_boxes``. Con ``resolution`` se llama como
+            ``detect_function(frame, imgsz)``.
+        every_n (int): Frecuencia de la detección completa en frames.
+        min_iou (float): IoU mínima de asociación.
+        max_uncertainty (float): Desviación de posición (píxeles) a partir de la
+            cual un track se considera degradado y se fuerza una detección.
+        resolution (ResolutionController, optional): Ajusta la resolución de la
+            detección completa según su latencia y la carga de la Raspberry Pi.
+    """
+
+    def __init__(
+        self,
+        detect_function: Callable[[np.ndarray], List[Dict[str, Any]]],
+        every_n: int = 5,
+        min_iou: float = 0.3,
+        max_uncertainty: float = 25.0,
+        resolution: Optional[ResolutionController] = None,
+    ) -> None:
+        if every_n < 1:
+            raise ValueError("every_n debe ser mayor o igual a 1")
+        self.detect_function = detect_function
+        self.every_n = every_n
+        self.max_uncertainty = max_uncertainty
+        self.resolution = resolution
+        self.imgsz: Optional[int] = None
+        self.tracker = IoUTracker(min_iou=min_iou, max_age=2 * every_n)
+        self.frame_index = 0
+        self.frames_since_detection: Optional[int] = None
+        self.detections_run = 0
+
+    def degraded(self, frame_shape: tuple) -> bool:
+        """True si algún track con velocidad estimada (al menos dos detecciones) tiene
+        una posición demasiado incierta o si algún track salió del frame."""
+        if len(self.tracker) == 0:
+            return False
+        uncertain = self.tracker.position_uncertainty() > self.max_uncertainty
+        if (uncertain & (self.tracker.hits >= 2)).any():
+            return True
+        centers_x, centers_y = self.tracker.states[:, 0], self.tracker.states[:, 1]
+        height, width = frame_shape[:2]
+        outside = (centers_x < 0) | (centers_x > width)
+        outside |= (centers_y < 0) | (centers_y > height)
+        return bool(outside.any())
+
+    def process(self, frame: np.ndarray) -> Dict[str, Any]:
+        """Procesa un frame y retorna sus detecciones con identificador de track.
+
+        Returns:
+            dict: ``bounding_boxes`` (con ``track_id``), ``detected`` (True si se
+            ejecutó la detección completa), ``frame_index`` e ``imgsz`` (resolución
+            de la última detección, None sin resolución adaptativa).
+        """
+        self.tracker.predict()
+        detect = (
+            self.frames_since_detection is None
+            or self.frames_since_detection + 1 >= self.every_n
+            or self.degraded(frame.shape)
+        )
+        if detect and self.resolution is not None:
+            self.imgsz = self.resolution.imgsz
+            start_time = time.perf_counter()
+            boxes = self.detect_function(frame, self.imgsz)
+            self.resolution.update(time.perf_counter() - start_time)
+        elif detect:
+            boxes = self.detect_function(frame)
+        if detect:
+            coordinates = [[b["x1"], b["y1"], b["x2"], b["y2"]] for b in boxes]
+            self.tracker.update(
+                np.array(coordinates, dtype=float).reshape(-1, 4),
+                [b["label"] for b in boxes],
+                np.array([b["confidence"] for b in boxes], dtype=float),
+            )
+            self.frames_since_detection = 0
+            self.detections_run += 1
+        else:
+            self.frames_since_detection += 1
+
+        result = {
+            "frame_index": self.frame_index,
+            "detected": detect,
+            "bounding_boxes": self.tracker.boxes(),
+            "imgsz": self.imgsz,
+        }
+        self.frame_index += 1
+        return result